@@ -7,20 +7,55 @@ This API only manages async tasks and returns a Godot-friendly artifact bundle.
 from __future__ import annotations
 
 import argparse
-import base64
 import json
-import mimetypes
 import os
-import subprocess
 import sys
 import threading
+import time
 import uuid
+from contextlib import ExitStack, asynccontextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
+
+from map_pipeline_artifacts import (
+    BlobStore,
+    artifact_entry,
+    etag_for,
+    etag_matches,
+    file_sha256,
+    find_artifact,
+    inline_small_files,
+    iter_file_range,
+    parse_range,
+    sync_plan,
+)
+
+from map_pipeline_cache import (
+    DEFAULT_RESULT_CACHE_MAX_BYTES,
+    DEFAULT_RESULT_CACHE_TTL_SECONDS,
+    InFlight,
+    ResultCache,
+    request_fingerprint,
+)
+from map_pipeline_imports import LazyModule, combined_state, import_profile
+from map_pipeline_events import AsyncWaiter, TaskNotifier, ThreadWaiter, format_cursor, parse_cursor, sse_message
+from map_pipeline_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry
+from map_pipeline_placements import placement_items, prop_images, write_placements_bin
+from map_pipeline_scheduler import JobScheduler, QueueFull, SchedulerClosed, parse_priority
+from map_pipeline_store import (
+    DEFAULT_EVENT_RETENTION_SECONDS,
+    DEFAULT_TASK_RETENTION_SECONDS,
+    TERMINAL_STATUSES,
+    TaskStore,
+    open_task_store,
+)
+from map_pipeline_trace import StageStats, Tracer, current_tracer, instrument_module, rss_bytes
 
 
 SNOWWEAVE_ROOT = Path(__file__).resolve().parent
@@ -29,72 +64,189 @@ ASF_SCRIPTS = DEPENDENCIES_ROOT / "agent-sprite-forge" / "scripts"
 GODOT_PROJECT = Path(r"D:\SnowGlobe\SnowGlobe\snow-globe")
 DEFAULT_OUT = SNOWWEAVE_ROOT / "out" / "maps"
 FMG_REF_ROOT = SNOWWEAVE_ROOT / "out" / "fmg_refs"
+BLOB_ROOT = SNOWWEAVE_ROOT / "out" / "blobs"
+MODEL_REF_ROOT = SNOWWEAVE_ROOT / "out" / "model_refs"
 SNOWWEAVE_SCRIPTS = SNOWWEAVE_ROOT / "scripts"
 API_KEY_ENV_NAMES = ("OPENROUTER_API_KEY", "NAGA_API_KEY", "OPENAI_API_KEY")
 DEFAULT_FMG_BACKEND_URL = "http://127.0.0.1:8765"
 DEFAULT_FMG_CHUNK_SIZE = 4096
+TASK_STORE_KIND = os.environ.get("MAP_PIPELINE_TASK_STORE", "sqlite")
+TASK_DB_PATH = Path(os.environ.get("MAP_PIPELINE_TASK_DB") or SNOWWEAVE_ROOT / "out" / "map_pipeline_tasks.sqlite3")
+TASK_EVENT_RETENTION_SECONDS = float(os.environ.get("MAP_PIPELINE_EVENT_RETENTION", DEFAULT_EVENT_RETENTION_SECONDS))
+TASK_RETENTION_SECONDS = float(os.environ.get("MAP_PIPELINE_TASK_RETENTION", DEFAULT_TASK_RETENTION_SECONDS))
+TASK_COMPACT_INTERVAL_SECONDS = 600.0
+FMG_CACHE_MAX_BYTES = int(os.environ.get("MAP_PIPELINE_FMG_CACHE_MAX_BYTES", str(8 * 1024**3)))
+BLOB_STORE_MAX_BYTES = int(os.environ.get("MAP_PIPELINE_BLOB_MAX_BYTES", str(4 * 1024**3)))
+# "webp" or "jpeg" sends a cached downscaled copy of the FMG reference; "png" sends the original.
+REFERENCE_FORMAT = os.environ.get("MAP_PIPELINE_REFERENCE_FORMAT", "png")
+REFERENCE_QUALITY = int(os.environ.get("MAP_PIPELINE_REFERENCE_QUALITY", "90"))
+REFERENCE_MAX_EDGE = int(os.environ.get("MAP_PIPELINE_REFERENCE_MAX_EDGE", "0"))  # 0: per-model default
+REFERENCE_CACHE_MAX_BYTES = int(os.environ.get("MAP_PIPELINE_REFERENCE_CACHE_MAX_BYTES", str(1024**3)))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get("MAP_PIPELINE_RESULT_CACHE_TTL", DEFAULT_RESULT_CACHE_TTL_SECONDS))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("MAP_PIPELINE_RESULT_CACHE_MAX_BYTES", DEFAULT_RESULT_CACHE_MAX_BYTES))
+PIPELINE_WORKERS = int(os.environ.get("MAP_PIPELINE_WORKERS", "2"))
+PIPELINE_MAX_QUEUE = int(os.environ.get("MAP_PIPELINE_MAX_QUEUE", "32"))
+QUEUE_RETRY_AFTER_SECONDS = 30
+STREAM_KEEPALIVE_SECONDS = 15.0
+STREAM_BATCH_SIZE = 100
+SPAN_EVENT_MAX_DEPTH = 2
+WARMUP_ON_START = os.environ.get("MAP_PIPELINE_WARMUP", "1") != "0"
+SPAN_EVENT_FIELDS = (
+    "name", "parent", "depth", "start_ms", "wall_ms", "cpu_ms", "rss_delta_bytes", "process_peak_rss_bytes"
+)
+# ASF stages timed by default: base -> dressed -> subtract props -> merge -> preview. Names missing
+# from the installed asf are skipped; set MAP_PIPELINE_TRACE_ASF="" to trace none.
+DEFAULT_TRACE_ASF_FUNCTIONS = (
+    "generate_base_image,generate_dressed_reference,extract_props_by_subtraction,"
+    "merge_overlapping_props,render_preview,render_alpha_overlay"
+)
+TRACE_ASF_FUNCTIONS = [
+    name.strip()
+    for name in os.environ.get("MAP_PIPELINE_TRACE_ASF", DEFAULT_TRACE_ASF_FUNCTIONS).split(",")
+    if name.strip()
+]
 
 sys.path.insert(0, str(ASF_SCRIPTS))
-import asf  # type: ignore  # noqa: E402
+sys.path.insert(0, str(SNOWWEAVE_SCRIPTS))
+import fmg_unpack_atlas_bundle as fmg_unpack  # noqa: E402
+
+FMG_MAX_CHUNK_SIZE = int(os.environ.get("MAP_PIPELINE_FMG_MAX_CHUNK_SIZE", fmg_unpack.MAX_CHUNK_SIZE))
+
+# Generation modules load in the background so the server answers /health at once.
+def _instrument_asf(module: Any) -> None:
+    wrapped = instrument_module(module, TRACE_ASF_FUNCTIONS, prefix="asf.")
+    missing = [name for name in TRACE_ASF_FUNCTIONS if name not in wrapped]
+    if missing:
+        print(f"Tracing asf stages {wrapped}; not found in asf: {missing}")
+
+
+_asf = LazyModule("asf", on_load=_instrument_asf)
+_fmg_model_reference = LazyModule("fmg_model_reference")
+_lazy_modules = [_asf, _fmg_model_reference]
+
+_store: TaskStore = open_task_store(TASK_STORE_KIND, TASK_DB_PATH)
+_scheduler = JobScheduler(workers=PIPELINE_WORKERS, max_queue=PIPELINE_MAX_QUEUE)
+_blobs = BlobStore(BLOB_ROOT)
+_result_cache = ResultCache(TASK_DB_PATH if TASK_STORE_KIND == "sqlite" else ":memory:")
+_inflight = InFlight()
+_stage_stats = StageStats()
+
+_metrics = Registry()
+_metrics.gauge("map_pipeline_queue_depth", "Jobs waiting for a worker.", lambda: _scheduler.snapshot()["queued"])
+_metrics.gauge("map_pipeline_active_workers", "Workers currently running a job.", lambda: _scheduler.snapshot()["active"])
+_metrics.gauge("map_pipeline_workers", "Configured worker slots.", lambda: _scheduler.workers)
+_metrics.gauge("map_pipeline_event_watchers", "Open long-poll, SSE and WebSocket watchers.", lambda: _notifier.watcher_count())
+_metrics.gauge("process_resident_memory_bytes", "Resident memory size in bytes.", rss_bytes)
+_task_outcomes = _metrics.counter(
+    "map_pipeline_tasks_total",
+    "Finished /generate requests by outcome (completed, failed, rejected, cancelled, cached, deduplicated).",
+    ("outcome",),
+)
+_task_duration = _metrics.histogram(
+    "map_pipeline_task_duration_seconds",
+    "End-to-end task time from submission to completion or failure, including queue wait.",
+    ("outcome",),
+)
+_stage_duration = _metrics.histogram(
+    "map_pipeline_stage_duration_seconds",
+    "Wall time of traced pipeline stages.",
+    ("stage",),
+)
+_model_call_duration = _metrics.histogram(
+    "map_pipeline_model_call_duration_seconds",
+    "Latency of ASF generation calls by image model.",
+    ("model",),
+)
+_model_calls = _metrics.counter(
+    "map_pipeline_model_calls_total",
+    "ASF generation calls by image model and outcome (ok, error).",
+    ("model", "outcome"),
+)
+_model_references = _metrics.counter(
+    "map_pipeline_model_reference_total",
+    "Model-ready FMG reference images by cache outcome (hit, miss).",
+    ("outcome",),
+)
+_artifact_bytes = _metrics.counter(
+    "map_pipeline_artifact_bytes_served_total",
+    "Artifact bytes sent to clients by endpoint.",
+    ("endpoint",),
+)
+_notifier = TaskNotifier()
+_maintenance_stop = threading.Event()
+
+
+def _configure_task_store(kind: str, path: Path) -> None:
+    global _store, _result_cache
+    _store.close()
+    _result_cache.close()
+    _store = open_task_store(kind, path)
+    _result_cache = ResultCache(path if kind == "sqlite" else ":memory:")
 
 
-app = FastAPI(title="MapPipeline", version="4.1")
+def _maintenance_loop() -> None:
+    while not _maintenance_stop.wait(TASK_COMPACT_INTERVAL_SECONDS):
+        try:
+            _store.compact(event_retention=TASK_EVENT_RETENTION_SECONDS, task_retention=TASK_RETENTION_SECONDS)
+            _blobs.prune(BLOB_STORE_MAX_BYTES)
+            _result_cache.prune(ttl=RESULT_CACHE_TTL_SECONDS, max_bytes=RESULT_CACHE_MAX_BYTES)
+        except Exception:
+            import traceback
+
+            traceback.print_exc()
+
+
+@asynccontextmanager
+async def _lifespan(_app: FastAPI):
+    interrupted = _store.recover_interrupted()
+    if interrupted:
+        print(f"Marked {len(interrupted)} interrupted task(s) as failed")
+    _store.compact(event_retention=TASK_EVENT_RETENTION_SECONDS, task_retention=TASK_RETENTION_SECONDS)
+    _maintenance_stop.clear()
+    maintenance = threading.Thread(target=_maintenance_loop, name="task-store-maintenance", daemon=True)
+    maintenance.start()
+    _scheduler.start()
+    if WARMUP_ON_START:
+        for module in _lazy_modules:
+            module.warm()
+    try:
+        yield
+    finally:
+        _cancel_queued(_scheduler.stop())
+        _maintenance_stop.set()
+
+
+def _cancel_queued(dropped: list[tuple[str, dict[str, Any]]]) -> None:
+    """Fail jobs that were still queued at shutdown and release their in-flight claims."""
+    for task_id, kwargs in dropped:
+        _inflight.release(kwargs["fingerprint"], task_id)
+        _emit(task_id, "cancelled", status="failed", progress=100, message="Cancelled by API shutdown")
+        _task_outcomes.inc(outcome="cancelled")
+
+
+app = FastAPI(title="MapPipeline", version="4.1", lifespan=_lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
-_tasks: dict[str, dict[str, Any]] = {}
-_events: dict[str, list[dict[str, Any]]] = {}
-_lock = threading.Lock()
-_condition = threading.Condition(_lock)
+
+def _new_task_id() -> str:
+    return uuid.uuid4().hex[:10]
 
 
-def _task_id() -> str:
-    task_id = uuid.uuid4().hex[:10]
-    with _condition:
-        _tasks[task_id] = {"status": "pending", "progress": 0, "message": ""}
-        _events[task_id] = []
+def _task_id(task_id: str | None = None) -> str:
+    task_id = task_id or _new_task_id()
+    _store.create(task_id, {"status": "pending", "progress": 0, "message": "", "created_at": time.time()})
     return task_id
 
 
 def _update(task_id: str, **updates: Any) -> None:
-    with _condition:
-        if task_id in _tasks:
-            _tasks[task_id].update(updates)
-            _condition.notify_all()
+    if _store.update(task_id, **updates):
+        _notifier.notify(task_id)
 
 
 def _emit(task_id: str, event_type: str, **payload: Any) -> dict[str, Any]:
-    with _condition:
-        if task_id not in _tasks:
-            raise KeyError(task_id)
-        _tasks[task_id].update(payload)
-        event = {
-            "seq": len(_events[task_id]),
-            "task_id": task_id,
-            "type": event_type,
-            **payload,
-        }
-        _events[task_id].append(event)
-        _condition.notify_all()
-        return event
-
-
-def _artifact_rel_path(path: Path, output_dir: Path) -> str:
-    try:
-        return path.resolve().relative_to(output_dir.resolve()).as_posix()
-    except ValueError:
-        return path.name
-
-
-def _artifact_entry(path: Path, output_dir: Path) -> dict[str, Any] | None:
-    if not path.exists() or not path.is_file():
-        return None
-    mime = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
-    return {
-        "source_path": str(path.resolve()),
-        "relative_path": _artifact_rel_path(path, output_dir),
-        "mime": mime,
-        "content_base64": base64.b64encode(path.read_bytes()).decode("ascii"),
-    }
+    event = _store.append_event(task_id, event_type, payload)
+    _notifier.notify(task_id)
+    return event
 
 
 def _path_values(result: dict[str, Any]) -> list[Path]:
@@ -105,6 +257,7 @@ def _path_values(result: dict[str, Any]) -> list[Path]:
         result.get("preview_annotated_image"),
         result.get("prop_alpha_overlay_image"),
         result.get("placements_json"),
+        result.get("placements_bin"),
         result.get("prop_manifest_json"),
         result.get("preview_report"),
         result.get("prop_alpha_overlay_report"),
@@ -112,11 +265,44 @@ def _path_values(result: dict[str, Any]) -> list[Path]:
     for prop in result.get("props", []):
         if isinstance(prop, dict):
             paths.append(prop.get("image"))
+    paths.append(result.get("trace_json") or Path(str(result["output_dir"])) / "trace.json")
     return [Path(str(path)) for path in paths if path]
 
 
-def _attach_godot_files(result: dict[str, Any]) -> dict[str, Any]:
+def _artifact_with_blob(path: Path, output_dir: Path, task_id: str | None) -> dict[str, Any] | None:
+    entry = artifact_entry(path, output_dir, task_id=task_id)
+    if entry:
+        _blobs.ingest(path, entry["sha256"])
+    return entry
+
+
+def _ensure_placements_bin(result: dict[str, Any]) -> None:
+    """Write `placements.bin` next to `placements.json` unless it is already up to date.
+
+    The JSON stays authoritative, so a placements file the packer cannot read
+    only means no binary copy is offered.
+    """
+    if not result.get("placements_json"):
+        return
+    source = Path(str(result["placements_json"]))
+    target = source.with_suffix(".bin")
+    try:
+        if not target.is_file() or target.stat().st_mtime_ns < source.stat().st_mtime_ns:
+            fmg_reference = (result.get("reference_metadata") or {}).get("fmg_reference") or {}
+            write_placements_bin(
+                target,
+                placement_items(json.loads(source.read_text(encoding="utf-8"))),
+                images=prop_images(result.get("props", [])),
+                chunk=fmg_reference.get("chunk_id"),
+            )
+    except (OSError, ValueError):
+        return
+    result["placements_bin"] = str(target)
+
+
+def _attach_godot_files(result: dict[str, Any], task_id: str | None = None) -> dict[str, Any]:
     output_dir = Path(str(result["output_dir"]))
+    _ensure_placements_bin(result)
     files: list[dict[str, Any]] = []
     seen: set[Path] = set()
     for path in _path_values(result):
@@ -124,7 +310,7 @@ def _attach_godot_files(result: dict[str, Any]) -> dict[str, Any]:
         if resolved in seen:
             continue
         seen.add(resolved)
-        entry = _artifact_entry(resolved, output_dir)
+        entry = _artifact_with_blob(resolved, output_dir, task_id)
         if entry:
             files.append(entry)
     result["godot_project"] = str(GODOT_PROJECT)
@@ -159,16 +345,6 @@ def _api_key_from_environment() -> str | None:
     return None
 
 
-def _run_json_script(args: list[str]) -> dict[str, Any]:
-    completed = subprocess.run(
-        [sys.executable, *args],
-        check=True,
-        capture_output=True,
-        text=True,
-    )
-    return json.loads(completed.stdout)
-
-
 def _prepare_fmg_reference(
     *,
     output_dir: Path,
@@ -177,25 +353,22 @@ def _prepare_fmg_reference(
     chunk_size: int,
     backend_url: str,
     bundle_zip: str | None,
+    progress: Callable[[int, int | None], None] | None = None,
 ) -> dict[str, Any]:
-    if chunk_size != DEFAULT_FMG_CHUNK_SIZE:
-        raise ValueError("FMG SnowWeave integration requires fixed 4096px chunks.")
+    fmg_unpack.check_chunk_size(chunk_size, FMG_MAX_CHUNK_SIZE)
 
     ref_dir = output_dir / "fmg-reference"
-    script = SNOWWEAVE_SCRIPTS / "fmg_unpack_atlas_bundle.py"
-    command = [
-        str(script),
-        "--output-dir", str(ref_dir),
-        "--chunk-size", str(chunk_size),
-        "--backend-url", backend_url,
-        "--force",
-    ]
-    if seed:
-        command.extend(["--seed", seed])
-    if bundle_zip:
-        command.extend(["--zip", bundle_zip])
-
-    index = _run_json_script(command)
+    index = fmg_unpack.prepare_cached_reference(
+        ref_dir,
+        cache_root=FMG_REF_ROOT,
+        zip_path=Path(bundle_zip) if bundle_zip else None,
+        backend_url=backend_url,
+        seed=seed,
+        chunk_size=chunk_size,
+        max_cache_bytes=FMG_CACHE_MAX_BYTES,
+        progress=progress,
+        chunk_ids=[chunk_id],
+    )
     chunks = index.get("chunks")
     if not isinstance(chunks, dict) or chunk_id not in chunks:
         raise ValueError(f"FMG chunk not found: {chunk_id}")
@@ -204,7 +377,7 @@ def _prepare_fmg_reference(
         raise ValueError(f"Invalid FMG chunk entry: {chunk_id}")
 
     return {
-        "index_path": str((ref_dir / "fmg_reference_index.json").resolve()),
+        "index_path": str((ref_dir / fmg_unpack.DEFAULT_INDEX_NAME).resolve()),
         "index": index,
         "chunk_id": chunk_id,
         "chunk": chunk,
@@ -213,6 +386,41 @@ def _prepare_fmg_reference(
     }
 
 
+def _model_reference(image_path: Path, model: str, held: ExitStack) -> dict[str, Any] | None:
+    """Cached downscaled WebP/JPEG copy of a reference image, or None when disabled.
+
+    The copy stays leased on `held` so concurrent jobs cannot prune it before
+    the model call has read it.
+    """
+    if REFERENCE_FORMAT == "png":
+        return None
+    fmg_model_reference = _fmg_model_reference.get()
+    settings = {
+        "max_edge": REFERENCE_MAX_EDGE or fmg_model_reference.max_edge_for_model(model),
+        "image_format": REFERENCE_FORMAT,
+        "quality": REFERENCE_QUALITY,
+    }
+    held.enter_context(
+        fmg_model_reference.LEASES.hold(fmg_model_reference.reference_path(image_path, MODEL_REF_ROOT, **settings))
+    )
+    reference = fmg_model_reference.prepare_model_reference(image_path, MODEL_REF_ROOT, **settings)
+    _model_references.inc(outcome="hit" if reference["cached"] else "miss")
+    if not reference["cached"]:
+        fmg_model_reference.LEASES.prune(MODEL_REF_ROOT, REFERENCE_CACHE_MAX_BYTES)
+    return reference
+
+
+def _emit_download_progress(task_id: str, done: int, total: int | None) -> None:
+    percent = f" ({done * 100 // total}%)" if total else ""
+    _emit(
+        task_id,
+        "fmg_download",
+        status="running",
+        message=f"Downloading FMG bundle: {done / 1024**2:.1f} MiB{percent}",
+        fmg_download={"bytes": done, "total_bytes": total},
+    )
+
+
 def _run_pipeline(
     task_id: str,
     *,
@@ -241,64 +449,95 @@ def _run_pipeline(
     no_rembg_alpha_matting: bool,
     no_constrain_rembg_to_diff_mask: bool,
 ) -> None:
+    tracer = Tracer(on_span=lambda record: _record_span(task_id, record))
+    token = current_tracer.set(tracer)
+    held = ExitStack()
     try:
-        _emit(
-            task_id,
-            "started",
-            status="running",
-            progress=5,
-            message="Generating map bundle with ASF",
-        )
-        effective_image_paths = list(image_paths)
-        effective_prompt_context = prompt_context
-        effective_reference_metadata = dict(reference_metadata)
-        if use_fmg_reference:
+        with tracer.span("pipeline", task_id=task_id, model=model, map_mode=map_mode):
             _emit(
                 task_id,
-                "fmg_reference",
+                "started",
                 status="running",
-                progress=8,
-                message=f"Preparing FMG chunk reference {fmg_chunk_id}",
+                progress=5,
+                message="Generating map bundle with ASF",
             )
-            fmg_reference = _prepare_fmg_reference(
-                output_dir=output_dir,
-                seed=fmg_seed,
-                chunk_id=fmg_chunk_id,
-                chunk_size=fmg_chunk_size,
-                backend_url=fmg_backend_url,
-                bundle_zip=fmg_bundle_zip,
-            )
-            effective_image_paths = [fmg_reference["image_path"], *effective_image_paths]
-            contexts = [effective_prompt_context, fmg_reference["legend_context"]]
-            effective_prompt_context = "\n\n".join(context for context in contexts if context.strip())
-            effective_reference_metadata["fmg_reference"] = {
-                "index_path": fmg_reference["index_path"],
-                "chunk_id": fmg_reference["chunk_id"],
-                "chunk": fmg_reference["chunk"],
-            }
+            effective_image_paths = list(image_paths)
+            effective_prompt_context = prompt_context
+            effective_reference_metadata = dict(reference_metadata)
+            if use_fmg_reference:
+                _emit(
+                    task_id,
+                    "fmg_reference",
+                    status="running",
+                    progress=8,
+                    message=f"Preparing FMG chunk reference {fmg_chunk_id}",
+                )
+                with tracer.span("fmg_reference", chunk_id=fmg_chunk_id):
+                    fmg_reference = _prepare_fmg_reference(
+                        output_dir=output_dir,
+                        seed=fmg_seed,
+                        chunk_id=fmg_chunk_id,
+                        chunk_size=fmg_chunk_size,
+                        backend_url=fmg_backend_url,
+                        bundle_zip=fmg_bundle_zip,
+                        progress=lambda done, total: _emit_download_progress(task_id, done, total),
+                    )
+                with tracer.span("model_reference", model=model) as span_args:
+                    model_reference = _model_reference(Path(fmg_reference["image_path"]), model, held)
+                    span_args["cached"] = bool(model_reference and model_reference["cached"])
+                reference_image = model_reference["path"] if model_reference else fmg_reference["image_path"]
+                effective_image_paths = [reference_image, *effective_image_paths]
+                contexts = [effective_prompt_context, fmg_reference["legend_context"]]
+                effective_prompt_context = "\n\n".join(context for context in contexts if context.strip())
+                effective_reference_metadata["fmg_reference"] = {
+                    "index_path": fmg_reference["index_path"],
+                    "chunk_id": fmg_reference["chunk_id"],
+                    "chunk": fmg_reference["chunk"],
+                }
+                if model_reference:
+                    effective_reference_metadata["fmg_reference"]["model_image"] = model_reference
 
-        result = asf.generate_map_pipeline(
-            prompt=prompt,
-            output_dir=output_dir,
-            image_paths=effective_image_paths,
-            prompt_context=effective_prompt_context,
-            reference_metadata=effective_reference_metadata,
-            model=model,
-            map_mode=map_mode,
-            api_key=_api_key_from_environment(),
-            sub_diff_threshold=diff,
-            sub_min_component_area=min_area,
-            sub_no_shadow_suppression=no_shadow_suppression,
-            sub_no_edge_delta=no_edge_delta,
-            sub_edge_threshold=edge_threshold,
-            sub_edge_grow_radius=edge_grow_radius,
-            sub_edge_support_radius=edge_support_radius,
-            sub_no_fill_holes=no_fill_holes,
-            sub_matting_backend=matting_backend,
-            sub_no_rembg_alpha_matting=no_rembg_alpha_matting,
-            sub_no_constrain_rembg_to_diff_mask=no_constrain_rembg_to_diff_mask,
-        )
-        result = _attach_godot_files(result)
+            if _asf.state != "ready":
+                _emit(task_id, "warming", status="running", message="Waiting for generation modules to load")
+            with tracer.span("import_asf", state=_asf.state):
+                asf = _asf.get()
+            model_started = time.perf_counter()
+            model_outcome = "error"
+            with tracer.span("asf.generate_map_pipeline"):
+                try:
+                    result = asf.generate_map_pipeline(
+                        prompt=prompt,
+                        output_dir=output_dir,
+                        image_paths=effective_image_paths,
+                        prompt_context=effective_prompt_context,
+                        reference_metadata=effective_reference_metadata,
+                        model=model,
+                        map_mode=map_mode,
+                        api_key=_api_key_from_environment(),
+                        sub_diff_threshold=diff,
+                        sub_min_component_area=min_area,
+                        sub_no_shadow_suppression=no_shadow_suppression,
+                        sub_no_edge_delta=no_edge_delta,
+                        sub_edge_threshold=edge_threshold,
+                        sub_edge_grow_radius=edge_grow_radius,
+                        sub_edge_support_radius=edge_support_radius,
+                        sub_no_fill_holes=no_fill_holes,
+                        sub_matting_backend=matting_backend,
+                        sub_no_rembg_alpha_matting=no_rembg_alpha_matting,
+                        sub_no_constrain_rembg_to_diff_mask=no_constrain_rembg_to_diff_mask,
+                    )
+                    model_outcome = "ok"
+                finally:
+                    _model_calls.inc(model=model, outcome=model_outcome)
+                    _model_call_duration.observe(time.perf_counter() - model_started, model=model)
+            with tracer.span("attach_artifacts"):
+                result = _attach_godot_files(result, task_id)
+        trace_path = tracer.write_chrome_trace(output_dir / "trace.json")
+        result["trace_json"] = str(trace_path)
+        result["files"] = [entry for entry in result["files"] if entry["relative_path"] != "trace.json"]
+        trace_entry = _artifact_with_blob(trace_path, output_dir, task_id)
+        if trace_entry:
+            result["files"].append(trace_entry)
         _emit(
             task_id,
             "completed",
@@ -311,7 +550,65 @@ def _run_pipeline(
         import traceback
 
         traceback.print_exc()
+        if output_dir.exists():
+            tracer.write_chrome_trace(output_dir / "trace.json")
         _emit(task_id, "failed", status="failed", progress=100, message=str(exc))
+    finally:
+        held.close()
+        current_tracer.reset(token)
+
+
+def _record_span(task_id: str, record: dict[str, Any]) -> None:
+    _stage_stats.observe(record["name"], record["wall_ms"])
+    _stage_duration.observe(record["wall_ms"] / 1000, stage=record["name"])
+    if record["depth"] <= SPAN_EVENT_MAX_DEPTH:
+        span = {key: record[key] for key in SPAN_EVENT_FIELDS}
+        if "error" in record:
+            span["error"] = record["error"]
+        _emit(task_id, "span", span=span)
+
+
+def _run_cached_pipeline(task_id: str, *, fingerprint: str, cacheable: bool = True, **kwargs: Any) -> None:
+    try:
+        _run_pipeline(task_id, **kwargs)
+        task = _store.get(task_id) or {}
+        outcome = str(task.get("status", "failed"))
+        _task_outcomes.inc(outcome=outcome)
+        if task.get("created_at"):
+            _task_duration.observe(time.time() - float(task["created_at"]), outcome=outcome)
+        if cacheable and task.get("status") == "completed":
+            _result_cache.put(fingerprint, task_id=task_id, output_dir=Path(kwargs["output_dir"]))
+    finally:
+        _inflight.release(fingerprint, task_id)
+
+
+def _generate_fingerprint(kwargs: dict[str, Any]) -> str:
+    params = {key: value for key, value in kwargs.items() if key not in ("output_dir", "image_paths", "fmg_bundle_zip")}
+    if kwargs["use_fmg_reference"]:
+        params["model_reference"] = [REFERENCE_FORMAT, REFERENCE_QUALITY, REFERENCE_MAX_EDGE]
+    inputs = [Path(path) for path in kwargs["image_paths"]]
+    if kwargs["fmg_bundle_zip"]:
+        inputs.append(Path(kwargs["fmg_bundle_zip"]))
+    return request_fingerprint(params, inputs)
+
+
+def _is_reproducible(kwargs: dict[str, Any]) -> bool:
+    """False for FMG requests without a seed or bundle: the backend draws a new map every time."""
+    return not (kwargs["use_fmg_reference"] and not kwargs["fmg_seed"] and not kwargs["fmg_bundle_zip"])
+
+
+def _complete_from_cache(task_id: str, cached: dict[str, Any]) -> None:
+    result = _attach_godot_files(cached["result"], task_id)
+    _emit(
+        task_id,
+        "completed",
+        status="completed",
+        progress=100,
+        message=f"Done from cache ({len(result.get('props', []))} props)",
+        output_dir=cached["output_dir"],
+        cached_from=cached["task_id"],
+        result=result,
+    )
 
 
 @app.get("/health")
@@ -319,7 +616,14 @@ def health() -> dict[str, Any]:
     return {
         "status": "ok",
         "version": "4.1",
-        "tasks": len(_tasks),
+        "state": combined_state(_lazy_modules),
+        "modules": {module.name: module.snapshot() for module in _lazy_modules},
+        "tasks": _store.count(),
+        "task_store": type(_store).__name__,
+        "scheduler": _scheduler.snapshot(),
+        "result_cache": _result_cache.stats(),
+        "event_watchers": _notifier.watcher_count(),
+        "stage_latency": _stage_stats.summary(),
         "dependencies_root": str(DEPENDENCIES_ROOT),
         "output_root": str(DEFAULT_OUT),
         "godot_project": str(GODOT_PROJECT),
@@ -327,6 +631,20 @@ def health() -> dict[str, Any]:
     }
 
 
+def _queue_full_error() -> HTTPException:
+    return HTTPException(
+        429,
+        f"Pipeline queue is full ({_scheduler.max_queue} jobs); retry later",
+        headers={"Retry-After": str(QUEUE_RETRY_AFTER_SECONDS)},
+    )
+
+
+@app.get("/metrics")
+def metrics() -> PlainTextResponse:
+    """Prometheus text exposition of queue, task, stage, model and artifact metrics."""
+    return PlainTextResponse(_metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+
 @app.post("/generate")
 def generate(payload: dict[str, Any]) -> dict[str, Any]:
     prompt = str(payload.get("prompt") or "").strip() or "2D top-down RPG map"
@@ -337,12 +655,74 @@ def generate(payload: dict[str, Any]) -> dict[str, Any]:
     if not prompt and not image_path and not use_fmg_reference:
         raise HTTPException(400, "Need prompt or image")
 
-    task_id = _task_id()
+    try:
+        priority = parse_priority(payload.get("priority"))
+    except ValueError as exc:
+        raise HTTPException(400, str(exc)) from None
+    force = bool(payload.get("force", False))
+
     output_name = str(payload.get("output_name") or "").strip()
     if not output_name:
         output_name = f"map-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
 
     output_dir = DEFAULT_OUT / output_name
+    kwargs = {
+        "prompt": prompt,
+        "output_dir": output_dir,
+        "image_paths": [str(image_path)] if image_path else [],
+        "prompt_context": str(payload.get("prompt_context") or ""),
+        "reference_metadata": {},
+        "use_fmg_reference": use_fmg_reference,
+        "fmg_seed": str(payload.get("fmg_seed") or "").strip() or None,
+        "fmg_chunk_id": str(payload.get("fmg_chunk_id") or "chunk_0_0"),
+        "fmg_chunk_size": int(payload.get("fmg_chunk_size") or DEFAULT_FMG_CHUNK_SIZE),
+        "fmg_backend_url": str(payload.get("fmg_backend_url") or DEFAULT_FMG_BACKEND_URL),
+        "fmg_bundle_zip": str(payload.get("fmg_bundle_zip") or "").strip() or None,
+        "model": str(payload.get("model") or "gemini3.1flash"),
+        "diff": float(payload.get("sub_diff_threshold", 30)),
+        "min_area": int(payload.get("sub_min_component_area", 100)),
+        "map_mode": str(payload.get("map_mode") or "auto"),
+        "no_shadow_suppression": bool(payload.get("sub_no_shadow_suppression", False)),
+        "no_edge_delta": bool(payload.get("sub_no_edge_delta", True)),
+        "edge_threshold": float(payload.get("sub_edge_threshold", 18)),
+        "edge_grow_radius": int(payload.get("sub_edge_grow_radius", 2)),
+        "edge_support_radius": int(payload.get("sub_edge_support_radius", 10)),
+        "no_fill_holes": bool(payload.get("sub_no_fill_holes", False)),
+        "matting_backend": str(payload.get("sub_matting_backend", "auto")),
+        "no_rembg_alpha_matting": bool(payload.get("sub_no_rembg_alpha_matting", False)),
+        "no_constrain_rembg_to_diff_mask": bool(payload.get("sub_no_constrain_rembg_to_diff_mask", False)),
+    }
+    try:
+        fingerprint = _generate_fingerprint(kwargs)
+    except OSError as exc:
+        raise HTTPException(400, f"Cannot read input: {exc}") from None
+
+    # Unseeded FMG requests ask for a new random map, so they never share results.
+    cacheable = _is_reproducible(kwargs)
+    if not force and cacheable:
+        cached = _result_cache.get(fingerprint, ttl=RESULT_CACHE_TTL_SECONDS)
+        if cached:
+            task_id = _task_id()
+            _complete_from_cache(task_id, cached)
+            _task_outcomes.inc(outcome="cached")
+            return {"task_id": task_id, "status": "completed", "output_dir": cached["output_dir"], "cached": True}
+    if _scheduler.full:
+        _task_outcomes.inc(outcome="rejected")
+        raise _queue_full_error()
+
+    task_id = _new_task_id()
+    if not force and cacheable:
+        existing = _inflight.claim(fingerprint, task_id)
+        if existing:
+            _task_outcomes.inc(outcome="deduplicated")
+            task = _store.get(existing) or {}
+            return {
+                "task_id": existing,
+                "status": task.get("status", "pending"),
+                "output_dir": task.get("output_dir", str(output_dir)),
+                "deduplicated": True,
+            }
+    _task_id(task_id)
     _emit(
         task_id,
         "queued",
@@ -350,48 +730,46 @@ def generate(payload: dict[str, Any]) -> dict[str, Any]:
         progress=0,
         message="Queued",
         output_dir=str(output_dir),
+        priority=priority,
+        fingerprint=fingerprint,
     )
-    thread = threading.Thread(
-        target=_run_pipeline,
-        kwargs={
-            "task_id": task_id,
-            "prompt": prompt,
-            "output_dir": output_dir,
-            "image_paths": [str(image_path)] if image_path else [],
-            "prompt_context": str(payload.get("prompt_context") or ""),
-            "reference_metadata": {},
-            "use_fmg_reference": use_fmg_reference,
-            "fmg_seed": str(payload.get("fmg_seed") or "").strip() or None,
-            "fmg_chunk_id": str(payload.get("fmg_chunk_id") or "chunk_0_0"),
-            "fmg_chunk_size": int(payload.get("fmg_chunk_size") or DEFAULT_FMG_CHUNK_SIZE),
-            "fmg_backend_url": str(payload.get("fmg_backend_url") or DEFAULT_FMG_BACKEND_URL),
-            "fmg_bundle_zip": str(payload.get("fmg_bundle_zip") or "").strip() or None,
-            "model": str(payload.get("model") or "gemini3.1flash"),
-            "diff": float(payload.get("sub_diff_threshold", 30)),
-            "min_area": int(payload.get("sub_min_component_area", 100)),
-            "map_mode": str(payload.get("map_mode") or "auto"),
-            "no_shadow_suppression": bool(payload.get("sub_no_shadow_suppression", False)),
-            "no_edge_delta": bool(payload.get("sub_no_edge_delta", True)),
-            "edge_threshold": float(payload.get("sub_edge_threshold", 18)),
-            "edge_grow_radius": int(payload.get("sub_edge_grow_radius", 2)),
-            "edge_support_radius": int(payload.get("sub_edge_support_radius", 10)),
-            "no_fill_holes": bool(payload.get("sub_no_fill_holes", False)),
-            "matting_backend": str(payload.get("sub_matting_backend", "auto")),
-            "no_rembg_alpha_matting": bool(payload.get("sub_no_rembg_alpha_matting", False)),
-            "no_constrain_rembg_to_diff_mask": bool(payload.get("sub_no_constrain_rembg_to_diff_mask", False)),
-        },
-        daemon=True,
-    )
-    thread.start()
-    return {"task_id": task_id, "status": "pending", "output_dir": str(output_dir)}
+    try:
+        position = _scheduler.submit(
+            task_id,
+            _run_cached_pipeline,
+            {"fingerprint": fingerprint, "cacheable": cacheable, **kwargs},
+            priority=priority,
+        )
+    except (QueueFull, SchedulerClosed) as exc:
+        _inflight.release(fingerprint, task_id)
+        _emit(task_id, "rejected", status="failed", progress=100, message=str(exc))
+        _task_outcomes.inc(outcome="rejected")
+        if isinstance(exc, QueueFull):
+            raise _queue_full_error() from None
+        raise HTTPException(503, str(exc)) from None
+    return {
+        "task_id": task_id,
+        "status": "pending",
+        "output_dir": str(output_dir),
+        "queue_position": position + 1,
+    }
 
 
 @app.get("/status/{task_id}")
-def status(task_id: str) -> dict[str, Any]:
-    with _lock:
-        task = _tasks.get(task_id)
+def status(task_id: str, inline_max_bytes: int = 0) -> dict[str, Any]:
+    """Return task state plus queue position while the task is waiting.
+
+    Completed results list artifacts as a manifest. Pass `inline_max_bytes` to
+    also inline files up to that size as base64.
+    """
+    task = _store.get(task_id)
     if not task:
         raise HTTPException(404, "not found")
+    queue = _scheduler.position(task_id)
+    if queue:
+        task.update(queue)
+    if isinstance(task.get("result"), dict):
+        task["result"] = inline_small_files(task["result"], inline_max_bytes)
     return task
 
 
@@ -403,34 +781,291 @@ def events(task_id: str, after: int = -1, timeout: float = 45.0) -> dict[str, An
     the same HttpClient request/response path it already uses elsewhere.
     """
     timeout = max(1.0, min(timeout, 120.0))
-    with _condition:
-        if task_id not in _tasks:
-            raise HTTPException(404, "not found")
+    if _store.get(task_id) is None:
+        raise HTTPException(404, "not found")
 
-        def has_next() -> bool:
-            return any(event["seq"] > after for event in _events[task_id])
+    deadline = time.monotonic() + timeout
+    waiter = ThreadWaiter()
+    with _notifier.watch([task_id], waiter):
+        while True:
+            pending = _store.events_after(task_id, after)
+            if pending:
+                return pending[0]
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            waiter.wait(remaining)
+    task = _store.get(task_id) or {}
+    return {
+        "seq": after,
+        "task_id": task_id,
+        "type": "timeout",
+        "status": task.get("status", "pending"),
+        "progress": task.get("progress", 0),
+        "message": task.get("message", ""),
+    }
+
+
+def _stream_cursors(task_ids: list[str], after: int, last_event_id: str | None) -> dict[str, int]:
+    if not task_ids:
+        raise HTTPException(400, "Need at least one task_id")
+    missing = [task_id for task_id in task_ids if _store.get(task_id) is None]
+    if missing:
+        raise HTTPException(404, f"not found: {', '.join(missing)}")
+    resumed = parse_cursor(last_event_id)
+    return {task_id: resumed.get(task_id, after) for task_id in dict.fromkeys(task_ids)}
+
+
+def _poll_events(cursors: dict[str, int]) -> tuple[list[dict[str, Any]], bool, bool]:
+    """One blocking pass over the store for `_watch_events`.
+
+    Returns the new events, whether every task has finished and drained, and
+    whether a full batch means more events are already waiting. Status is read
+    before events so a terminal event is never skipped.
+    """
+    events: list[dict[str, Any]] = []
+    finished = 0
+    backlog = False
+    for task_id, after in cursors.items():
+        task = _store.get(task_id)
+        batch = _store.events_after(task_id, after, STREAM_BATCH_SIZE)
+        events.extend(batch)
+        if len(batch) == STREAM_BATCH_SIZE:
+            backlog = True
+        elif task is None or task.get("status") in TERMINAL_STATUSES:
+            finished += 1
+    return events, finished == len(cursors), backlog
+
+
+async def _watch_events(cursors: dict[str, int]):
+    """Yield `(event, cursors)` for every new event of the watched tasks, or
+    `None` as a keepalive tick, until every task has finished and drained.
+
+    Store reads run in the threadpool so SQLite never blocks the event loop.
+    """
+    waiter = AsyncWaiter()
+    with _notifier.watch(list(cursors), waiter):
+        while True:
+            events, finished, backlog = await run_in_threadpool(_poll_events, dict(cursors))
+            for event in events:
+                cursors[event["task_id"]] = event["seq"]
+                yield event, cursors
+            if finished:
+                return
+            if backlog:
+                continue
+            if not await waiter.wait(STREAM_KEEPALIVE_SECONDS):
+                yield None
+
+
+@app.get("/stream/events")
+async def stream_events(
+    request: Request,
+    task_id: list[str] = Query(default=[]),
+    after: int = -1,
+    last_event_id: str | None = Header(default=None),
+) -> StreamingResponse:
+    """Server-Sent Events for one or more tasks over a single connection.
+
+    Every event is pushed as it is emitted. The SSE id is a `task_id:seq,...`
+    cursor, so a reconnecting client resumes from `Last-Event-ID`. The stream
+    ends with an `end` event once all watched tasks have finished.
+    """
+    cursors = await run_in_threadpool(_stream_cursors, task_id, after, last_event_id)
+
+    async def body():
+        async for item in _watch_events(cursors):
+            if await request.is_disconnected():
+                return
+            if item is None:
+                yield ": keepalive\n\n"
+                continue
+            event, state = item
+            yield sse_message(event, event=str(event["type"]), event_id=format_cursor(state))
+        yield sse_message({"task_ids": list(cursors)}, event="end", event_id=format_cursor(cursors))
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        _condition.wait_for(has_next, timeout=timeout)
-        for event in _events[task_id]:
-            if event["seq"] > after:
-                return event
-        task = _tasks[task_id]
-        return {
-            "seq": after,
-            "task_id": task_id,
-            "type": "timeout",
-            "status": task.get("status", "pending"),
-            "progress": task.get("progress", 0),
-            "message": task.get("message", ""),
-        }
+
+@app.websocket("/ws/events")
+async def websocket_events(websocket: WebSocket, task_id: list[str] = Query(default=[]), after: int = -1) -> None:
+    """WebSocket variant of `/stream/events`.
+
+    Tasks come from `task_id` query parameters or, if none are given, from a
+    first JSON message `{"task_ids": [...], "after": {"<task_id>": seq}}`.
+    Each event is sent as a JSON message; the server closes after an `end`
+    message once every watched task has finished.
+    """
+    await websocket.accept()
+    try:
+        cursor_overrides: dict[str, int] = {}
+        if not task_id:
+            hello = await websocket.receive_json()
+            task_id = [str(value) for value in hello.get("task_ids", [])]
+            cursor_overrides = {str(key): int(value) for key, value in (hello.get("after") or {}).items()}
+        try:
+            cursors = await run_in_threadpool(_stream_cursors, task_id, after, format_cursor(cursor_overrides))
+        except HTTPException as exc:
+            await websocket.send_json({"type": "error", "status_code": exc.status_code, "message": exc.detail})
+            await websocket.close(code=4404 if exc.status_code == 404 else 4400)
+            return
+        async for item in _watch_events(cursors):
+            if item is None:
+                await websocket.send_json({"type": "keepalive"})
+                continue
+            await websocket.send_json(item[0])
+        await websocket.send_json({"type": "end", "task_ids": list(cursors)})
+        await websocket.close()
+    except WebSocketDisconnect:
+        return
 
 
 @app.post("/load")
 def load(payload: dict[str, Any]) -> dict[str, Any]:
-    result_path = Path(str(payload["output_dir"])) / "pipeline_result.json"
+    output_dir = payload.get("output_dir")
+    task_id = str(payload.get("task_id") or "") or None
+    inline_max_bytes = int(payload.get("inline_max_bytes") or 0)
+    if task_id:
+        task = _store.get(task_id)
+        if not task:
+            raise HTTPException(404, "not found")
+        if isinstance(task.get("result"), dict):
+            return inline_small_files(task["result"], inline_max_bytes)
+        output_dir = output_dir or task.get("output_dir")
+    if not output_dir:
+        raise HTTPException(400, "Need output_dir or task_id")
+    result_path = Path(str(output_dir)) / "pipeline_result.json"
     if not result_path.exists():
         raise HTTPException(404, str(result_path))
-    return _attach_godot_files(json.loads(result_path.read_text(encoding="utf-8")))
+    result = _attach_godot_files(json.loads(result_path.read_text(encoding="utf-8")), task_id)
+    return inline_small_files(result, inline_max_bytes)
+
+
+def _file_response(
+    path: Path,
+    *,
+    mime: str,
+    sha256: str,
+    range_header: str | None,
+    if_none_match: str | None,
+    cache_control: str,
+    endpoint: str,
+) -> Response:
+    etag = etag_for(sha256)
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": cache_control}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    size = path.stat().st_size
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        _artifact_bytes.inc(size, endpoint=endpoint)
+        return FileResponse(path, media_type=mime, headers=headers)
+    start, end = byte_range
+    _artifact_bytes.inc(end - start + 1, endpoint=endpoint)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(iter_file_range(path, start, end), status_code=206, media_type=mime, headers=headers)
+
+
+@app.get("/artifacts/{task_id}/{relative_path:path}")
+def artifact(
+    task_id: str,
+    relative_path: str,
+    range_header: str | None = Header(default=None, alias="Range"),
+    if_none_match: str | None = Header(default=None),
+) -> Response:
+    """Stream one artifact listed in a completed task's manifest.
+
+    Supports single byte ranges and `If-None-Match` against the sha256 ETag.
+    Only files in the manifest are served, so arbitrary paths cannot be read.
+    """
+    task = _store.get(task_id)
+    result = task.get("result") if task else None
+    entry = find_artifact(result, relative_path) if isinstance(result, dict) else None
+    if not entry:
+        raise HTTPException(404, "not found")
+    path = Path(str(entry["source_path"]))
+    if not path.is_file():
+        raise HTTPException(410, f"Artifact no longer on disk: {relative_path}")
+    return _file_response(
+        path,
+        mime=entry["mime"],
+        sha256=file_sha256(path),
+        range_header=range_header,
+        if_none_match=if_none_match,
+        cache_control="private, max-age=0, must-revalidate",
+        endpoint="artifacts",
+    )
+
+
+@app.get("/blobs/{sha256}")
+def blob(
+    sha256: str,
+    range_header: str | None = Header(default=None, alias="Range"),
+    if_none_match: str | None = Header(default=None),
+) -> Response:
+    """Stream an artifact by content hash. Blobs never change, so they cache forever."""
+    try:
+        path = _blobs.get(sha256.lower())
+    except ValueError as exc:
+        raise HTTPException(400, str(exc)) from None
+    if path is None:
+        raise HTTPException(404, "not found")
+    return _file_response(
+        path,
+        mime="application/octet-stream",
+        sha256=sha256.lower(),
+        range_header=range_header,
+        if_none_match=if_none_match,
+        cache_control="public, max-age=31536000, immutable",
+        endpoint="blobs",
+    )
+
+
+@app.post("/sync")
+def sync(payload: dict[str, Any]) -> dict[str, Any]:
+    """Return only the artifacts the client does not already cache.
+
+    The client posts `task_id` (or `output_dir`) and `have`, either
+    `{relative_path: sha256}` for its `user://map_pipeline_cache/<task_id>`
+    copy or a list of sha256 values it holds in a shared blob cache. The
+    manifest is rebuilt from `pipeline_result.json` so edits made after the
+    task finished, such as re-running prop subtraction, are picked up.
+    """
+    task_id = str(payload.get("task_id") or "") or None
+    output_dir = payload.get("output_dir")
+    have = payload.get("have") or {}
+    if not isinstance(have, (dict, list)):
+        raise HTTPException(400, "have must be an object of path -> sha256 or a list of sha256")
+    if task_id:
+        task = _store.get(task_id)
+        if not task:
+            raise HTTPException(404, "not found")
+        output_dir = output_dir or task.get("output_dir")
+    if not output_dir:
+        raise HTTPException(400, "Need output_dir or task_id")
+    result_path = Path(str(output_dir)) / "pipeline_result.json"
+    if not result_path.exists():
+        raise HTTPException(404, str(result_path))
+
+    result = _attach_godot_files(json.loads(result_path.read_text(encoding="utf-8")), task_id)
+    if task_id:
+        _store.update(task_id, result=result)
+    plan = sync_plan(result["files"], have)
+    return {
+        "task_id": task_id,
+        "output_dir": str(output_dir),
+        "manifest_size": len(result["files"]),
+        **plan,
+    }
 
 
 if __name__ == "__main__":
@@ -439,6 +1074,33 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--port", type=int, default=8766)
     parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--task-store", choices=["sqlite", "memory"], default=TASK_STORE_KIND)
+    parser.add_argument("--task-db", type=Path, default=TASK_DB_PATH)
+    parser.add_argument("--workers", type=int, default=PIPELINE_WORKERS, help="Concurrent pipeline jobs.")
+    parser.add_argument("--max-queue", type=int, default=PIPELINE_MAX_QUEUE, help="Queued jobs before /generate returns 429.")
+    parser.add_argument(
+        "--no-warmup",
+        action="store_true",
+        help="Import asf on the first job instead of in the background at startup.",
+    )
+    parser.add_argument(
+        "--import-profile",
+        action="store_true",
+        help="Print a cold import-time breakdown of the API and its generation modules, then exit.",
+    )
     args = parser.parse_args()
+    if args.import_profile:
+        print(
+            import_profile(
+                ["map_pipeline_api", *(module.name for module in _lazy_modules)],
+                paths=[SNOWWEAVE_ROOT, ASF_SCRIPTS, SNOWWEAVE_SCRIPTS],
+                cwd=SNOWWEAVE_ROOT,
+            )
+        )
+        raise SystemExit(0)
+    WARMUP_ON_START = WARMUP_ON_START and not args.no_warmup
+    _scheduler = JobScheduler(workers=args.workers, max_queue=args.max_queue)
+    if args.task_store != TASK_STORE_KIND or args.task_db != TASK_DB_PATH:
+        _configure_task_store(args.task_store, args.task_db)
     print(f"MapPipeline API -> http://{args.host}:{args.port}")
     uvicorn.run(app, host=args.host, port=args.port, log_level="info")
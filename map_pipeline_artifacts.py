@@ -0,0 +1,264 @@
+"""
+Artifact manifests and ranged file reads for the map pipeline API.
+
+Results carry a manifest entry per file (path, size, mime, sha256) instead of
+inlining every image as base64. Clients download files from
+`/artifacts/{task_id}/{relative_path}` and can revalidate with the sha256 ETag.
+Every artifact is also linked once into a content-addressed blob store so
+identical files (typically prop PNGs) are shared across tasks, and `/sync`
+returns only the entries a client does not already hold.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import mimetypes
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Iterator
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+STREAM_CHUNK_SIZE = 256 * 1024
+
+_digest_cache: dict[str, tuple[int, int, str]] = {}
+_digest_lock = threading.Lock()
+
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 of a file, cached by (size, mtime) so repeated manifests don't rehash."""
+    stat = path.stat()
+    key = str(path)
+    with _digest_lock:
+        cached = _digest_cache.get(key)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+    value = digest.hexdigest()
+    with _digest_lock:
+        _digest_cache[key] = (stat.st_size, stat.st_mtime_ns, value)
+    return value
+
+
+def artifact_rel_path(path: Path, output_dir: Path) -> str:
+    try:
+        return path.resolve().relative_to(output_dir.resolve()).as_posix()
+    except ValueError:
+        return path.name
+
+
+def artifact_url(task_id: str, relative_path: str) -> str:
+    return f"/artifacts/{task_id}/{relative_path}"
+
+
+def blob_url(sha256: str) -> str:
+    return f"/blobs/{sha256}"
+
+
+def artifact_entry(path: Path, output_dir: Path, *, task_id: str | None = None) -> dict[str, Any] | None:
+    if not path.exists() or not path.is_file():
+        return None
+    mime = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    relative_path = artifact_rel_path(path, output_dir)
+    entry: dict[str, Any] = {
+        "source_path": str(path.resolve()),
+        "relative_path": relative_path,
+        "mime": mime,
+        "size": path.stat().st_size,
+        "sha256": file_sha256(path),
+    }
+    if task_id:
+        entry["url"] = artifact_url(task_id, relative_path)
+    entry["blob_url"] = blob_url(entry["sha256"])
+    return entry
+
+
+def inline_small_files(result: dict[str, Any], max_bytes: int) -> dict[str, Any]:
+    """Copy of `result` with `content_base64` added to files no larger than `max_bytes`."""
+    if max_bytes <= 0 or not isinstance(result.get("files"), list):
+        return result
+    files: list[dict[str, Any]] = []
+    for entry in result["files"]:
+        entry = dict(entry)
+        path = Path(str(entry.get("source_path", "")))
+        if int(entry.get("size", max_bytes + 1)) <= max_bytes and path.is_file():
+            entry["content_base64"] = base64.b64encode(path.read_bytes()).decode("ascii")
+        files.append(entry)
+    return {**result, "files": files}
+
+
+def find_artifact(result: dict[str, Any], relative_path: str) -> dict[str, Any] | None:
+    for entry in result.get("files", []):
+        if isinstance(entry, dict) and entry.get("relative_path") == relative_path:
+            return entry
+    return None
+
+
+def sync_plan(files: list[dict[str, Any]], have: dict[str, str] | list[str]) -> dict[str, Any]:
+    """Split a manifest against what a client already caches.
+
+    `have` is either `{relative_path: sha256}` for the task's own cache or a
+    list of sha256 values from a content-addressed cache. Entries whose hash
+    the client already holds are not resent, whatever their path.
+    """
+    by_path = isinstance(have, dict)
+    if by_path:
+        held_by_path = {str(path): str(digest) for path, digest in have.items()}
+        held_hashes = set(held_by_path.values())
+    else:
+        held_by_path = {}
+        held_hashes = {str(digest) for digest in have}
+
+    changed: list[dict[str, Any]] = []
+    unchanged: list[str] = []
+    for entry in files:
+        if by_path:
+            held = held_by_path.get(entry["relative_path"]) == entry["sha256"]
+        else:
+            held = entry["sha256"] in held_hashes
+        if held:
+            unchanged.append(entry["relative_path"])
+        elif entry["sha256"] in held_hashes:
+            # Same bytes already cached under another path: the client can copy locally.
+            changed.append({**entry, "cached_as_blob": True})
+        else:
+            changed.append(entry)
+    current_paths = {entry["relative_path"] for entry in files}
+    return {
+        "files": changed,
+        "unchanged": unchanged,
+        "removed": sorted(path for path in held_by_path if path not in current_paths),
+        "transfer_bytes": sum(int(entry["size"]) for entry in changed if not entry.get("cached_as_blob")),
+    }
+
+
+class BlobStore:
+    """Content-addressed artifacts at `<root>/<sha[:2]>/<sha>`.
+
+    Artifacts are hard-linked into the store so a basemap does not take its
+    space twice; only when linking fails (another volume, no link support) is
+    the file copied. A task that later rewrites an artifact in place also
+    changes the linked blob, so `get` re-checks the hash (cached by size and
+    mtime) and drops a blob whose bytes no longer match. Access time is the
+    LRU clock for `prune`; modification time is left alone because it belongs
+    to the artifact as well.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+
+    def path_for(self, sha256: str) -> Path:
+        if len(sha256) != 64 or any(char not in "0123456789abcdef" for char in sha256):
+            raise ValueError(f"Invalid sha256: {sha256}")
+        return self.root / sha256[:2] / sha256
+
+    def ingest(self, path: Path, sha256: str) -> Path:
+        target = self.path_for(sha256)
+        if target.exists():
+            return target
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temp = target.with_name(f".{sha256}.{uuid.uuid4().hex}.tmp")
+        try:
+            try:
+                os.link(path, temp)
+            except OSError:
+                shutil.copyfile(path, temp)
+            os.replace(temp, target)
+        finally:
+            temp.unlink(missing_ok=True)
+        _touch(target)
+        return target
+
+    def get(self, sha256: str) -> Path | None:
+        target = self.path_for(sha256)
+        if not target.is_file():
+            return None
+        if file_sha256(target) != sha256:
+            target.unlink(missing_ok=True)
+            return None
+        _touch(target)
+        return target
+
+    def prune(self, max_bytes: int) -> int:
+        """Delete least recently used blobs until the store fits `max_bytes`.
+
+        Blobs still linked to an artifact take no space of their own, so they
+        are neither counted nor evicted; they join the budget once the task's
+        output is deleted.
+        """
+        if not self.root.exists():
+            return 0
+        blobs = [(path.stat(), path) for path in self.root.glob("??/*") if len(path.name) == 64 and path.is_file()]
+        blobs = [(stat, path) for stat, path in blobs if stat.st_nlink <= 1]
+        total = sum(stat.st_size for stat, _ in blobs)
+        removed = 0
+        for stat, path in sorted(blobs, key=lambda item: item[0].st_atime):
+            if total <= max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= stat.st_size
+            removed += 1
+        return removed
+
+
+def _touch(path: Path) -> None:
+    """Mark a blob as used by bumping its access time only."""
+    stat = path.stat()
+    os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+
+
+def etag_for(sha256: str) -> str:
+    return f'"{sha256}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Parse a single `bytes=` range into an inclusive (start, end) pair.
+
+    Returns None when the header is absent or not a byte range (serve the whole
+    file). Raises ValueError when the range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec:
+        # Multipart ranges are not worth the complexity; serve the whole file.
+        return None
+    start_text, _, end_text = spec.partition("-")
+    if not start_text:
+        length = int(end_text)
+        if length <= 0:
+            raise ValueError(header)
+        start, end = max(0, size - length), size - 1
+    else:
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+        end = min(end, size - 1)
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def iter_file_range(path: Path, start: int, end: int) -> Iterator[bytes]:
+    remaining = end - start + 1
+    with path.open("rb") as handle:
+        handle.seek(start)
+        while remaining > 0:
+            block = handle.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
@@ -0,0 +1,180 @@
+"""
+Result cache and single-flight registry for identical `/generate` payloads.
+
+A request fingerprint is the SHA-256 of the normalized pipeline parameters
+plus the content hashes of every input file, so the same prompt, FMG chunk,
+model and `sub_*` thresholds map to the same key regardless of output name.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from map_pipeline_artifacts import file_sha256
+
+
+FINGERPRINT_VERSION = 1
+RESULT_NAME = "pipeline_result.json"
+DEFAULT_RESULT_CACHE_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_RESULT_CACHE_MAX_BYTES = 20 * 1024**3
+
+
+def request_fingerprint(params: dict[str, Any], input_files: list[Path]) -> str:
+    """Canonical hash of pipeline parameters and input file contents."""
+    canonical = {
+        "version": FINGERPRINT_VERSION,
+        "params": params,
+        "inputs": [file_sha256(path) for path in input_files],
+    }
+    encoded = json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def directory_size(path: Path) -> int:
+    return sum(item.stat().st_size for item in path.rglob("*") if item.is_file())
+
+
+class ResultCache:
+    """Fingerprint -> completed output directory, with TTL and LRU byte budget.
+
+    The output directories belong to the tasks that produced them; evicting an
+    entry only forgets it, so `/load` and `/artifacts` keep working for as long
+    as the task store keeps the task. Each entry records the SHA-256 of the
+    directory's `pipeline_result.json`, so a directory reused by a later request
+    with the same `output_name` no longer answers for the old fingerprint.
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        if str(path) != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        if str(path) != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(result_cache)")}
+        if columns and "result_sha256" not in columns:
+            # Entries from before result hashing cannot be validated; the cache just refills.
+            self._conn.execute("DROP TABLE result_cache")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS result_cache (
+                fingerprint TEXT PRIMARY KEY,
+                task_id TEXT NOT NULL,
+                output_dir TEXT NOT NULL,
+                result_sha256 TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+            """
+        )
+
+    def get(self, fingerprint: str, *, ttl: float) -> dict[str, Any] | None:
+        """The cached entry with its parsed `result`, or None on a miss.
+
+        The result file is read once and checked against the recorded hash, so
+        an entry whose directory was removed or rewritten since `put` is dropped
+        instead of returning someone else's result.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT task_id, output_dir, result_sha256, size_bytes, created_at FROM result_cache"
+                " WHERE fingerprint = ?",
+                (fingerprint,),
+            ).fetchone()
+        if row is None:
+            return None
+        task_id, output_dir, result_sha256, size_bytes, created_at = row
+        result = None
+        if now - created_at <= ttl:
+            try:
+                data = (Path(output_dir) / RESULT_NAME).read_bytes()
+                if hashlib.sha256(data).hexdigest() == result_sha256:
+                    result = json.loads(data)
+            except (OSError, ValueError):
+                result = None
+        with self._lock:
+            if not isinstance(result, dict):
+                self._conn.execute(
+                    "DELETE FROM result_cache WHERE fingerprint = ? AND result_sha256 = ?",
+                    (fingerprint, result_sha256),
+                )
+                return None
+            self._conn.execute("UPDATE result_cache SET last_used_at = ? WHERE fingerprint = ?", (now, fingerprint))
+        return {
+            "fingerprint": fingerprint,
+            "task_id": task_id,
+            "output_dir": output_dir,
+            "size_bytes": size_bytes,
+            "created_at": created_at,
+            "result": result,
+        }
+
+    def put(self, fingerprint: str, *, task_id: str, output_dir: Path) -> None:
+        now = time.time()
+        result_sha256 = hashlib.sha256((output_dir / RESULT_NAME).read_bytes()).hexdigest()
+        size = directory_size(output_dir)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO result_cache"
+                " (fingerprint, task_id, output_dir, result_sha256, size_bytes, created_at, last_used_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (fingerprint, task_id, str(output_dir), result_sha256, size, now, now),
+            )
+
+    def prune(self, *, ttl: float, max_bytes: int) -> int:
+        """Drop expired entries, then least recently used ones until under `max_bytes`."""
+        evicted = 0
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT fingerprint, output_dir, size_bytes, created_at FROM result_cache ORDER BY last_used_at DESC"
+            ).fetchall()
+            cutoff = time.time() - ttl
+            total = 0
+            for fingerprint, _output_dir, size_bytes, created_at in rows:
+                if created_at >= cutoff:
+                    total += size_bytes
+                    if total <= max_bytes:
+                        continue
+                self._conn.execute("DELETE FROM result_cache WHERE fingerprint = ?", (fingerprint,))
+                evicted += 1
+        return evicted
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM result_cache"
+            ).fetchone()
+        return {"entries": int(count), "bytes": int(total)}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class InFlight:
+    """Fingerprints of queued or running tasks, for attaching duplicate submissions."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tasks: dict[str, str] = {}
+
+    def claim(self, fingerprint: str, task_id: str) -> str | None:
+        """Register `task_id` for `fingerprint`, or return the task already holding it."""
+        with self._lock:
+            existing = self._tasks.get(fingerprint)
+            if existing is not None:
+                return existing
+            self._tasks[fingerprint] = task_id
+            return None
+
+    def release(self, fingerprint: str, task_id: str) -> None:
+        with self._lock:
+            if self._tasks.get(fingerprint) == task_id:
+                del self._tasks[fingerprint]
@@ -0,0 +1,112 @@
+"""
+Per-task event wakeups for long polling, SSE and WebSocket watchers.
+
+Each watcher registers a waiter under the task ids it follows, so an event
+for one task wakes only the watchers of that task. Waiters are registered
+before the store is read, which means an event appended between the read and
+the wait still sets the waiter and is never missed.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator
+
+
+class ThreadWaiter:
+    """Waiter for sync endpoints running in the threadpool."""
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+
+    def wake(self) -> None:
+        self._event.set()
+
+    def wait(self, timeout: float) -> bool:
+        fired = self._event.wait(timeout)
+        self._event.clear()
+        return fired
+
+
+class AsyncWaiter:
+    """Waiter for async endpoints; wakes are marshalled onto the owning loop."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None) -> None:
+        self._loop = loop or asyncio.get_running_loop()
+        self._event = asyncio.Event()
+
+    def wake(self) -> None:
+        self._loop.call_soon_threadsafe(self._event.set)
+
+    async def wait(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._event.clear()
+
+
+class TaskNotifier:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._waiters: dict[str, set[Any]] = {}
+
+    @contextmanager
+    def watch(self, task_ids: Iterable[str], waiter: ThreadWaiter | AsyncWaiter) -> Iterator[None]:
+        task_ids = list(task_ids)
+        with self._lock:
+            for task_id in task_ids:
+                self._waiters.setdefault(task_id, set()).add(waiter)
+        try:
+            yield
+        finally:
+            with self._lock:
+                for task_id in task_ids:
+                    waiters = self._waiters.get(task_id)
+                    if waiters is None:
+                        continue
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[task_id]
+
+    def notify(self, task_id: str) -> None:
+        with self._lock:
+            waiters = list(self._waiters.get(task_id, ()))
+        for waiter in waiters:
+            waiter.wake()
+
+    def watcher_count(self) -> int:
+        with self._lock:
+            return len({id(waiter) for waiters in self._waiters.values() for waiter in waiters})
+
+
+def format_cursor(cursors: dict[str, int]) -> str:
+    return ",".join(f"{task_id}:{seq}" for task_id, seq in cursors.items())
+
+
+def parse_cursor(value: str | None) -> dict[str, int]:
+    """Parse a `task_id:seq,...` cursor such as an SSE Last-Event-ID."""
+    cursors: dict[str, int] = {}
+    for part in (value or "").split(","):
+        task_id, sep, seq = part.strip().rpartition(":")
+        if not sep or not task_id:
+            continue
+        try:
+            cursors[task_id] = int(seq)
+        except ValueError:
+            continue
+    return cursors
+
+
+def sse_message(data: dict[str, Any], *, event: str | None = None, event_id: str | None = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False, default=str))
+    return "\n".join(lines) + "\n\n"
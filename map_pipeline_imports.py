@@ -0,0 +1,134 @@
+"""
+Deferred imports for the map pipeline API.
+
+Importing `asf` pulls in the whole generation stack (PIL, numpy, rembg/onnx,
+HTTP clients). A `LazyModule` lets the server bind and answer `/health` and
+`/status` first: the module is imported by a background warmup thread, or on
+first use if a job needs it before warmup has finished.
+"""
+from __future__ import annotations
+
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable
+
+
+class LazyModule:
+    """A module imported once, on demand or from `warm()`.
+
+    States: `cold` (not requested), `warming` (import running), `ready` and
+    `failed`. A failed import is not retried; `get()` raises the same error
+    until the process restarts.
+    """
+
+    def __init__(self, name: str, *, on_load: Callable[[ModuleType], Any] | None = None) -> None:
+        self.name = name
+        self._on_load = on_load
+        self._lock = threading.Lock()
+        self._module: ModuleType | None = None
+        self._error: BaseException | None = None
+        self._state = "cold"
+        self._seconds: float | None = None
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def get(self) -> ModuleType:
+        if self._module is not None:
+            return self._module
+        with self._lock:
+            if self._module is None and self._error is None:
+                self._state = "warming"
+                started = time.perf_counter()
+                try:
+                    module = importlib.import_module(self.name)
+                    if self._on_load:
+                        self._on_load(module)
+                except BaseException as exc:
+                    self._error = exc
+                    self._state = "failed"
+                else:
+                    self._module = module
+                    self._state = "ready"
+                finally:
+                    self._seconds = round(time.perf_counter() - started, 3)
+        if self._error is not None:
+            raise RuntimeError(f"Failed to import {self.name}: {self._error}") from self._error
+        assert self._module is not None
+        return self._module
+
+    def warm(self) -> threading.Thread:
+        def run() -> None:
+            try:
+                self.get()
+            except RuntimeError:
+                pass
+
+        thread = threading.Thread(target=run, name=f"warmup-{self.name}", daemon=True)
+        thread.start()
+        return thread
+
+    def snapshot(self) -> dict[str, Any]:
+        snapshot: dict[str, Any] = {"state": self._state, "import_seconds": self._seconds}
+        if self._error is not None:
+            snapshot["error"] = f"{type(self._error).__name__}: {self._error}"
+        return snapshot
+
+
+def combined_state(modules: list[LazyModule]) -> str:
+    states = {module.state for module in modules}
+    if "failed" in states:
+        return "failed"
+    if states == {"ready"}:
+        return "ready"
+    if "warming" in states:
+        return "warming"
+    return "cold"
+
+
+def import_profile(modules: list[str], *, paths: list[Path], cwd: Path, top: int = 25) -> str:
+    """Import `modules` in a fresh interpreter with `-X importtime` and summarise the slowest imports.
+
+    A separate process is used so the numbers are cold-start numbers,
+    unaffected by anything this process has already imported.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([*map(str, paths), env.get("PYTHONPATH", "")]).rstrip(os.pathsep)
+    code = "\n".join(f"import {name}" for name in modules)
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=str(cwd),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - started
+
+    rows: list[tuple[int, int, str]] = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue
+        rows.append((cumulative_us, self_us, parts[2].rstrip()))
+
+    lines = [f"{'cumulative ms':>14} {'self ms':>9}  module"]
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        lines.append(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+    lines.append(f"{len(rows)} modules imported in {wall:.2f}s (process wall time)")
+    if completed.returncode != 0:
+        errors = [line for line in completed.stderr.splitlines() if not line.startswith("import time:")]
+        lines.append("Import failed:")
+        lines.extend(errors[-10:])
+    return "\n".join(lines)
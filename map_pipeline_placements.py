@@ -0,0 +1,251 @@
+"""
+Packed binary placements for Godot import.
+
+`placements.json` and the prop manifests are pretty-printed JSON that Godot
+parses prop by prop. `placements.bin` carries the same placement data as one
+fixed-layout record per prop plus a string table, so a loader can read the
+whole file into a buffer and index records directly.
+
+Layout (little-endian):
+
+    header   magic "SWPL", u16 version, u16 header size, u32 record count,
+             u32 record size, u32 records offset, u32 string count,
+             u32 strings offset
+    records  record count x RECORD (see below)
+    strings  (string count + 1) u32 offsets into the blob, then UTF-8 blob;
+             string i is blob[offsets[i]:offsets[i + 1]]
+
+Each record is: u32 prop id, u32 image, u32 chunk, u32 layer (string table
+indices), f32 x, y, w, h (pixels, top-left origin) and u32 flags.
+"""
+from __future__ import annotations
+
+import os
+import struct
+import uuid
+from pathlib import Path
+from typing import Any, Iterable
+
+
+MAGIC = b"SWPL"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIIII")
+RECORD = struct.Struct("<IIIIffffI")
+OFFSET = struct.Struct("<I")
+
+FLAG_CLUSTER = 1 << 0
+FLAG_COLLISION = 1 << 1
+FLAG_FLIP_H = 1 << 2
+FLAG_FLIP_V = 1 << 3
+FLAG_KEYS = {
+    "cluster": FLAG_CLUSTER,
+    "is_cluster": FLAG_CLUSTER,
+    "collision": FLAG_COLLISION,
+    "blocking": FLAG_COLLISION,
+    "flip_h": FLAG_FLIP_H,
+    "flip_v": FLAG_FLIP_V,
+}
+
+
+class PlacementFormatError(ValueError):
+    """The binary file is malformed, or a placement cannot be encoded in it."""
+
+
+class StringTable:
+    def __init__(self) -> None:
+        self.strings: list[str] = [""]
+        self._index: dict[str, int] = {"": 0}
+
+    def add(self, value: Any) -> int:
+        text = "" if value is None else str(value)
+        index = self._index.get(text)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(text)
+            self._index[text] = index
+        return index
+
+    def pack(self) -> bytes:
+        blobs = [text.encode("utf-8") for text in self.strings]
+        offsets = [0]
+        for blob in blobs:
+            offsets.append(offsets[-1] + len(blob))
+        return b"".join(OFFSET.pack(offset) for offset in offsets) + b"".join(blobs)
+
+
+def _first(item: dict[str, Any], *keys: str) -> Any:
+    for key in keys:
+        value = item.get(key)
+        if value is not None:
+            return value
+    return None
+
+
+def _pair(value: Any, first: str, second: str) -> tuple[float, float] | None:
+    if isinstance(value, dict) and first in value and second in value:
+        return float(value[first]), float(value[second])
+    if isinstance(value, (list, tuple)) and len(value) >= 2:
+        return float(value[0]), float(value[1])
+    return None
+
+
+def _box(item: dict[str, Any]) -> tuple[float, float, float, float]:
+    """(x, y, width, height) of a placement; raises `PlacementFormatError` for non-numeric fields."""
+    try:
+        bbox = _first(item, "bbox", "box")
+        if isinstance(bbox, (list, tuple)) and len(bbox) >= 4:
+            x0, y0, x1, y1 = (float(value) for value in bbox[:4])
+            return x0, y0, x1 - x0, y1 - y0
+        position = _pair(_first(item, "position", "pos"), "x", "y")
+        x, y = position or (float(item.get("x") or 0), float(item.get("y") or 0))
+        size = _pair(item.get("size"), "width", "height")
+        w, h = size or (
+            float(_first(item, "width", "w") or 0),
+            float(_first(item, "height", "h") or 0),
+        )
+    except (TypeError, ValueError) as exc:
+        prop_id = _first(item, "id", "prop_id", "name")
+        raise PlacementFormatError(f"Placement {prop_id!r} has a non-numeric position or size: {exc}") from None
+    return x, y, w, h
+
+
+def placement_items(data: Any) -> list[dict[str, Any]]:
+    """Placement dicts from a placements JSON document (a list or a wrapping object)."""
+    if isinstance(data, dict):
+        for key in ("placements", "props", "items"):
+            if isinstance(data.get(key), list):
+                data = data[key]
+                break
+        else:
+            return []
+    return [item for item in data if isinstance(item, dict)] if isinstance(data, list) else []
+
+
+def prop_images(props: Iterable[Any]) -> dict[str, str]:
+    """Prop id -> image path from a result's `props` list."""
+    images = {}
+    for prop in props:
+        if isinstance(prop, dict) and prop.get("image"):
+            prop_id = _first(prop, "id", "prop_id", "name")
+            if prop_id is not None:
+                images[str(prop_id)] = str(prop["image"])
+    return images
+
+
+def pack_placements(
+    items: Iterable[dict[str, Any]],
+    *,
+    images: dict[str, str] | None = None,
+    chunk: str | None = None,
+) -> bytes:
+    """Pack placement dicts. `images` maps prop id to image path for items without one.
+
+    Raises `PlacementFormatError` for a placement whose box is not numeric or does not fit in f32.
+    """
+    images = images or {}
+    strings = StringTable()
+    records = []
+    for item in items:
+        prop_id = str(_first(item, "id", "prop_id", "name") or "")
+        x, y, w, h = _box(item)
+        flags = 0
+        for key, bit in FLAG_KEYS.items():
+            if item.get(key):
+                flags |= bit
+        try:
+            record = RECORD.pack(
+                strings.add(prop_id),
+                strings.add(_first(item, "image", "image_path", "path") or images.get(prop_id)),
+                strings.add(_first(item, "chunk", "chunk_id") or chunk),
+                strings.add(_first(item, "layer", "category", "kind")),
+                x,
+                y,
+                w,
+                h,
+                flags,
+            )
+        except (struct.error, OverflowError) as exc:
+            raise PlacementFormatError(f"Placement {prop_id!r} cannot be packed: {exc}") from None
+        records.append(record)
+    records_offset = HEADER.size
+    strings_offset = records_offset + RECORD.size * len(records)
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        HEADER.size,
+        len(records),
+        RECORD.size,
+        records_offset,
+        len(strings.strings),
+        strings_offset,
+    )
+    return header + b"".join(records) + strings.pack()
+
+
+def unpack_placements(buffer: bytes) -> list[dict[str, Any]]:
+    if len(buffer) < HEADER.size:
+        raise PlacementFormatError("Placements file is truncated")
+    magic, version, header_size, count, record_size, records_offset, string_count, strings_offset = (
+        HEADER.unpack_from(buffer)
+    )
+    if magic != MAGIC:
+        raise PlacementFormatError("Not a placements file")
+    if version > VERSION:
+        raise PlacementFormatError(f"Unsupported placements version {version}")
+    if record_size < RECORD.size:
+        raise PlacementFormatError(f"Record size {record_size} is smaller than {RECORD.size}")
+
+    blob_start = strings_offset + OFFSET.size * (string_count + 1)
+    if blob_start > len(buffer) or records_offset + count * record_size > len(buffer):
+        raise PlacementFormatError("Placements file is truncated")
+    offsets = struct.unpack_from(f"<{string_count + 1}I", buffer, strings_offset)
+    if blob_start + offsets[-1] > len(buffer):
+        raise PlacementFormatError("Placements file is truncated")
+    if any(start > end for start, end in zip(offsets, offsets[1:])):
+        raise PlacementFormatError("String offsets are not ascending")
+    try:
+        strings = [
+            buffer[blob_start + offsets[i]:blob_start + offsets[i + 1]].decode("utf-8") for i in range(string_count)
+        ]
+    except UnicodeDecodeError as exc:
+        raise PlacementFormatError(f"String table is not UTF-8: {exc}") from None
+    placements = []
+    for i in range(count):
+        prop_id, image, chunk, layer, x, y, w, h, flags = RECORD.unpack_from(buffer, records_offset + i * record_size)
+        if max(prop_id, image, chunk, layer) >= string_count:
+            raise PlacementFormatError(f"Record {i} references a string outside the table of {string_count}")
+        placements.append(
+            {
+                "id": strings[prop_id],
+                "image": strings[image],
+                "chunk": strings[chunk],
+                "layer": strings[layer],
+                "x": x,
+                "y": y,
+                "w": w,
+                "h": h,
+                "flags": flags,
+            }
+        )
+    return placements
+
+
+def write_placements_bin(
+    output: Path,
+    items: Iterable[dict[str, Any]],
+    *,
+    images: dict[str, str] | None = None,
+    chunk: str | None = None,
+) -> Path:
+    output.parent.mkdir(parents=True, exist_ok=True)
+    temp = output.with_name(f".{output.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        temp.write_bytes(pack_placements(items, images=images, chunk=chunk))
+        os.replace(temp, output)
+    finally:
+        temp.unlink(missing_ok=True)
+    return output
+
+
+def read_placements_bin(path: Path) -> list[dict[str, Any]]:
+    return unpack_placements(path.read_bytes())
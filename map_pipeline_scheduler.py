@@ -0,0 +1,187 @@
+"""
+Bounded worker pool with a priority queue for map pipeline jobs.
+
+`/generate` used to start one thread per request. Jobs now wait in a priority
+queue (lower value first, FIFO within a priority) and a fixed number of worker
+threads run them, so a burst of requests queues up instead of running every
+ASF pipeline at once.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+
+PRIORITIES = {"interactive": 0, "batch": 10}
+DEFAULT_PRIORITY = "interactive"
+
+
+class QueueFull(Exception):
+    """Raised when the queue is at its maximum depth."""
+
+
+class SchedulerClosed(Exception):
+    """Raised when jobs are submitted while the scheduler is not running."""
+
+
+def parse_priority(value: Any) -> int:
+    if value is None or value == "":
+        return PRIORITIES[DEFAULT_PRIORITY]
+    if isinstance(value, str) and value.strip().lower() in PRIORITIES:
+        return PRIORITIES[value.strip().lower()]
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Unknown priority: {value!r}") from None
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    order: int
+    task_id: str = field(compare=False)
+    target: Callable[..., None] = field(compare=False)
+    kwargs: dict[str, Any] = field(compare=False)
+    submitted_at: float = field(compare=False, default_factory=time.time)
+
+
+class JobScheduler:
+    def __init__(self, *, workers: int, max_queue: int, duration_smoothing: float = 0.2) -> None:
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        self.workers = workers
+        self.max_queue = max_queue
+        self._smoothing = duration_smoothing
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._heap: list[_Job] = []
+        self._order = itertools.count()
+        self._running: dict[str, float] = {}
+        self._running_jobs: dict[str, _Job] = {}
+        self._threads: list[threading.Thread] = []
+        self._accepting = False
+        self._avg_duration: float | None = None
+        self.completed = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._accepting:
+                return
+            self._accepting = True
+            self._threads = [
+                threading.Thread(target=self._worker, name=f"map-pipeline-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> list[tuple[str, dict[str, Any]]]:
+        """Stop accepting jobs. Workers exit after their current job.
+
+        Queued jobs never run; they are returned as `(task_id, kwargs)` in queue
+        order so the caller can fail their tasks and release what they hold.
+        """
+        with self._not_empty:
+            self._accepting = False
+            dropped = [(job.task_id, job.kwargs) for job in sorted(self._heap)]
+            self._heap.clear()
+            self._not_empty.notify_all()
+        return dropped
+
+    @property
+    def full(self) -> bool:
+        with self._lock:
+            return len(self._heap) >= self.max_queue
+
+    def submit(self, task_id: str, target: Callable[..., None], kwargs: dict[str, Any], *, priority: int) -> int:
+        """Queue a job and return its 0-based queue position."""
+        with self._not_empty:
+            if not self._accepting:
+                raise SchedulerClosed("scheduler is not running")
+            if len(self._heap) >= self.max_queue:
+                raise QueueFull(f"queue depth limit reached ({self.max_queue})")
+            job = _Job(priority, next(self._order), task_id, target, kwargs)
+            heapq.heappush(self._heap, job)
+            self._not_empty.notify()
+            return sum(1 for other in self._heap if other < job)
+
+    def position(self, task_id: str) -> dict[str, Any] | None:
+        """Queue position and ETA for a queued or running task, or None if unknown."""
+        now = time.time()
+        with self._lock:
+            started = self._running.get(task_id)
+            avg = self._avg_duration
+            if started is not None:
+                elapsed = now - started
+                return {
+                    "queue_position": 0,
+                    "queue_state": "running",
+                    "eta_seconds": round(max(0.0, avg - elapsed), 1) if avg is not None else None,
+                }
+            ordered = sorted(self._heap)
+            running_remaining = sorted(
+                max(0.0, avg - (now - start)) if avg is not None else 0.0 for start in self._running.values()
+            )
+        for position, job in enumerate(ordered):
+            if job.task_id != task_id:
+                continue
+            eta = None
+            if avg is not None:
+                slots = running_remaining + [0.0] * (self.workers - len(running_remaining))
+                # Jobs ahead of us start as slots free up; each slot finishes one job per `avg`.
+                rounds, slot = divmod(position, self.workers)
+                eta = sorted(slots)[slot] + rounds * avg + avg
+            return {
+                "queue_position": position + 1,
+                "queue_state": "queued",
+                "eta_seconds": round(eta, 1) if eta is not None else None,
+            }
+        return None
+
+    def jobs(self) -> list[tuple[str, dict[str, Any]]]:
+        """`(task_id, kwargs)` of every running and queued job."""
+        with self._lock:
+            return [(job.task_id, job.kwargs) for job in (*self._running_jobs.values(), *self._heap)]
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "active": len(self._running),
+                "queued": len(self._heap),
+                "max_queue": self.max_queue,
+                "completed": self.completed,
+                "avg_duration_seconds": round(self._avg_duration, 1) if self._avg_duration is not None else None,
+                "accepting": self._accepting,
+            }
+
+    def _worker(self) -> None:
+        while True:
+            with self._not_empty:
+                while self._accepting and not self._heap:
+                    self._not_empty.wait()
+                if not self._accepting:
+                    return
+                job = heapq.heappop(self._heap)
+                started = time.time()
+                self._running[job.task_id] = started
+                self._running_jobs[job.task_id] = job
+            try:
+                job.target(job.task_id, **job.kwargs)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                duration = time.time() - started
+                with self._lock:
+                    self._running.pop(job.task_id, None)
+                    self._running_jobs.pop(job.task_id, None)
+                    self.completed += 1
+                    if self._avg_duration is None:
+                        self._avg_duration = duration
+                    else:
+                        self._avg_duration += self._smoothing * (duration - self._avg_duration)
@@ -0,0 +1,317 @@
+"""
+Task and event storage for the map pipeline API.
+
+The API used to keep tasks and events in process-global dicts. Stores here keep
+the same shapes (task dict, event dict with a per-task `seq`) behind a small
+interface so the server can persist them in SQLite and survive restarts.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+
+TERMINAL_STATUSES = ("completed", "failed")
+DEFAULT_EVENT_RETENTION_SECONDS = 6 * 3600
+DEFAULT_TASK_RETENTION_SECONDS = 30 * 24 * 3600
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TaskStore:
+    """Interface shared by the task stores.
+
+    Events are append-only per task and numbered by `seq` starting at 0. The
+    task dict is the merged view of every event payload, which is what
+    `/status` returns.
+    """
+
+    def create(self, task_id: str, task: dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get(self, task_id: str) -> dict[str, Any] | None:
+        raise NotImplementedError
+
+    def update(self, task_id: str, **updates: Any) -> bool:
+        raise NotImplementedError
+
+    def append_event(self, task_id: str, event_type: str, payload: dict[str, Any]) -> dict[str, Any]:
+        raise NotImplementedError
+
+    def events_after(self, task_id: str, after: int, limit: int = 1) -> list[dict[str, Any]]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def recover_interrupted(self) -> list[str]:
+        """Fail tasks that were pending/running when the previous process died."""
+        raise NotImplementedError
+
+    def compact(self, *, event_retention: float, task_retention: float) -> dict[str, int]:
+        """Drop intermediate events of old finished tasks and expire very old tasks.
+
+        The terminal event of a compacted task is kept so `/events` can still
+        answer a reconnecting client with the final state.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryTaskStore(TaskStore):
+    """Process-local store. Nothing survives a restart.
+
+    Each task's events are a contiguous run of seqs starting at `_first_seq`,
+    so finding the events after a seq is an index computation, not a scan.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tasks: dict[str, dict[str, Any]] = {}
+        self._events: dict[str, list[dict[str, Any]]] = {}
+        self._next_seq: dict[str, int] = {}
+        self._first_seq: dict[str, int] = {}
+        self._updated_at: dict[str, float] = {}
+
+    def create(self, task_id: str, task: dict[str, Any]) -> None:
+        with self._lock:
+            self._tasks[task_id] = dict(task)
+            self._events[task_id] = []
+            self._next_seq[task_id] = 0
+            self._first_seq[task_id] = 0
+            self._updated_at[task_id] = time.time()
+
+    def get(self, task_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return dict(task) if task is not None else None
+
+    def update(self, task_id: str, **updates: Any) -> bool:
+        with self._lock:
+            if task_id not in self._tasks:
+                return False
+            self._tasks[task_id].update(updates)
+            self._updated_at[task_id] = time.time()
+            return True
+
+    def append_event(self, task_id: str, event_type: str, payload: dict[str, Any]) -> dict[str, Any]:
+        with self._lock:
+            if task_id not in self._tasks:
+                raise KeyError(task_id)
+            self._tasks[task_id].update(payload)
+            seq = self._next_seq[task_id]
+            self._next_seq[task_id] = seq + 1
+            event = {"seq": seq, "task_id": task_id, "type": event_type, **payload}
+            self._events[task_id].append(event)
+            self._updated_at[task_id] = time.time()
+            return event
+
+    def events_after(self, task_id: str, after: int, limit: int = 1) -> list[dict[str, Any]]:
+        with self._lock:
+            events = self._events.get(task_id, [])
+            start = max(0, after + 1 - self._first_seq.get(task_id, 0))
+            return events[start:start + limit]
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._tasks)
+
+    def recover_interrupted(self) -> list[str]:
+        return []
+
+    def compact(self, *, event_retention: float, task_retention: float) -> dict[str, int]:
+        now = time.time()
+        stats = {"events_removed": 0, "tasks_removed": 0}
+        with self._lock:
+            for task_id in list(self._tasks):
+                if self._tasks[task_id].get("status") not in TERMINAL_STATUSES:
+                    continue
+                age = now - self._updated_at.get(task_id, now)
+                if age > task_retention:
+                    stats["events_removed"] += len(self._events.pop(task_id, []))
+                    self._tasks.pop(task_id, None)
+                    self._next_seq.pop(task_id, None)
+                    self._first_seq.pop(task_id, None)
+                    self._updated_at.pop(task_id, None)
+                    stats["tasks_removed"] += 1
+                elif age > event_retention and len(self._events[task_id]) > 1:
+                    stats["events_removed"] += len(self._events[task_id]) - 1
+                    self._events[task_id] = self._events[task_id][-1:]
+                    self._first_seq[task_id] = self._events[task_id][0]["seq"]
+        return stats
+
+
+class SQLiteTaskStore(TaskStore):
+    """SQLite store in WAL mode so pollers can read while workers write."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                data TEXT NOT NULL,
+                next_seq INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS tasks_status_updated ON tasks (status, updated_at);
+            CREATE TABLE IF NOT EXISTS events (
+                task_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (task_id, seq)
+            ) WITHOUT ROWID;
+            """
+        )
+
+    def create(self, task_id: str, task: dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tasks (task_id, status, data, next_seq, created_at, updated_at)"
+                " VALUES (?, ?, ?, 0, ?, ?)",
+                (task_id, str(task.get("status", "pending")), _dumps(task), now, now),
+            )
+
+    def _load(self, task_id: str) -> tuple[dict[str, Any], int] | None:
+        row = self._conn.execute("SELECT data, next_seq FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), int(row[1])
+
+    def get(self, task_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            loaded = self._load(task_id)
+        return loaded[0] if loaded else None
+
+    def update(self, task_id: str, **updates: Any) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                loaded = self._load(task_id)
+                if loaded is None:
+                    self._conn.execute("ROLLBACK")
+                    return False
+                task = loaded[0]
+                task.update(updates)
+                self._conn.execute(
+                    "UPDATE tasks SET status = ?, data = ?, updated_at = ? WHERE task_id = ?",
+                    (str(task.get("status", "pending")), _dumps(task), time.time(), task_id),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def append_event(self, task_id: str, event_type: str, payload: dict[str, Any]) -> dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                loaded = self._load(task_id)
+                if loaded is None:
+                    raise KeyError(task_id)
+                task, seq = loaded
+                task.update(payload)
+                event = {"seq": seq, "task_id": task_id, "type": event_type, **payload}
+                self._conn.execute(
+                    "INSERT INTO events (task_id, seq, data, created_at) VALUES (?, ?, ?, ?)",
+                    (task_id, seq, _dumps(event), now),
+                )
+                self._conn.execute(
+                    "UPDATE tasks SET status = ?, data = ?, next_seq = ?, updated_at = ? WHERE task_id = ?",
+                    (str(task.get("status", "pending")), _dumps(task), seq + 1, now, task_id),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return event
+
+    def events_after(self, task_id: str, after: int, limit: int = 1) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM events WHERE task_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (task_id, after, limit),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0])
+
+    def recover_interrupted(self) -> list[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT task_id FROM tasks WHERE status NOT IN (?, ?)", TERMINAL_STATUSES
+            ).fetchall()
+        task_ids = [str(row[0]) for row in rows]
+        for task_id in task_ids:
+            self.append_event(
+                task_id,
+                "failed",
+                {"status": "failed", "progress": 100, "message": "Interrupted by API restart"},
+            )
+        return task_ids
+
+    def compact(self, *, event_retention: float, task_retention: float) -> dict[str, int]:
+        now = time.time()
+        placeholders = ", ".join("?" for _ in TERMINAL_STATUSES)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                expired = self._conn.execute(
+                    f"SELECT task_id FROM tasks WHERE status IN ({placeholders}) AND updated_at < ?",
+                    (*TERMINAL_STATUSES, now - task_retention),
+                ).fetchall()
+                events_removed = 0
+                for (task_id,) in expired:
+                    events_removed += self._conn.execute("DELETE FROM events WHERE task_id = ?", (task_id,)).rowcount
+                    self._conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+                events_removed += self._conn.execute(
+                    f"""
+                    DELETE FROM events
+                    WHERE task_id IN (
+                        SELECT task_id FROM tasks WHERE status IN ({placeholders}) AND updated_at < ?
+                    )
+                    AND seq < (SELECT next_seq - 1 FROM tasks WHERE tasks.task_id = events.task_id)
+                    """,
+                    (*TERMINAL_STATUSES, now - event_retention),
+                ).rowcount
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if events_removed:
+            with self._lock:
+                self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        return {"events_removed": events_removed, "tasks_removed": len(expired)}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def open_task_store(kind: str, path: Path) -> TaskStore:
+    if kind == "memory":
+        return MemoryTaskStore()
+    if kind == "sqlite":
+        return SQLiteTaskStore(path)
+    raise ValueError(f"Unknown task store: {kind}")
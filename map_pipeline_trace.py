@@ -0,0 +1,262 @@
+"""
+Nested timing spans for map pipeline runs.
+
+A `Tracer` records spans with wall time, worker-thread CPU time, process RSS
+at start and end, and, when enabled, the process-wide peak RSS while the span
+was open (see `SpanPeaks`). Spans export in Chrome trace format (`chrome://tracing`,
+Perfetto).
+The active tracer is held in a context variable so code that does not know
+about the task (for example wrapped `asf` functions) can still open spans.
+"""
+from __future__ import annotations
+
+import contextvars
+import functools
+import itertools
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+try:
+    import psutil  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    psutil = None
+
+
+current_tracer: contextvars.ContextVar["Tracer | None"] = contextvars.ContextVar("current_tracer", default=None)
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process, or 0 if unknown."""
+    if psutil is not None:
+        return int(psutil.Process().memory_info().rss)
+    try:
+        with open("/proc/self/statm", encoding="ascii") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _hwm_bytes() -> int:
+    """Kernel RSS high-water mark since the last reset (Linux), or 0 if unknown."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as handle:
+            for line in handle:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+class SpanPeaks:
+    """Process-wide peak RSS while a span was open, from the resettable kernel high-water mark.
+
+    Writing "5" to `/proc/self/clear_refs` resets `VmHWM` to the current RSS.
+    The mark is process-wide while spans nest and overlap across worker
+    threads, so before each reset the mark is folded into every open span;
+    the window since the last reset is then always one in which all open
+    spans were running. The peak therefore includes memory used by every
+    other thread (including concurrent tasks) during the span, and each reset
+    also clobbers `VmHWM` for anything else reading it, so it is off unless
+    `enabled` (`MAP_PIPELINE_TRACE_PEAK_RSS=1` for the shared instance).
+    When disabled, or where the reset is not available (not Linux, or not
+    permitted), `begin` returns None and spans report no peak.
+    """
+
+    def __init__(self, clear_refs: str = "/proc/self/clear_refs", *, enabled: bool = True) -> None:
+        self._clear_refs = clear_refs
+        self._lock = threading.Lock()
+        self._open: dict[int, int] = {}
+        self._tokens = itertools.count()
+        self._available: bool | None = None if enabled else False
+
+    def _reset(self) -> bool:
+        try:
+            with open(self._clear_refs, "w", encoding="ascii") as handle:
+                handle.write("5")
+            return True
+        except OSError:
+            return False
+
+    def _fold(self) -> None:
+        mark = _hwm_bytes()
+        for token, peak in self._open.items():
+            self._open[token] = max(peak, mark)
+
+    def begin(self) -> int | None:
+        with self._lock:
+            if self._available is False:
+                return None
+            self._fold()
+            reset = self._reset()
+            if self._available is None:
+                self._available = reset and _hwm_bytes() > 0
+                if not self._available:
+                    return None
+            token = next(self._tokens)
+            self._open[token] = _hwm_bytes()
+            return token
+
+    def end(self, token: int | None) -> int | None:
+        if token is None:
+            return None
+        with self._lock:
+            self._fold()
+            return self._open.pop(token, None)
+
+
+_span_peaks = SpanPeaks(enabled=os.environ.get("MAP_PIPELINE_TRACE_PEAK_RSS", "0") == "1")
+
+
+class Tracer:
+    def __init__(self, *, on_span: Callable[[dict[str, Any]], None] | None = None) -> None:
+        self._origin = time.perf_counter()
+        self._on_span = on_span
+        self._lock = threading.Lock()
+        self._stack: list[str] = []
+        self.spans: list[dict[str, Any]] = []
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[dict[str, Any]]:
+        """Record a span. Yields its args dict so callers can attach details."""
+        parent = self._stack[-1] if self._stack else None
+        self._stack.append(name)
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        rss_start = rss_bytes()
+        peak_token = _span_peaks.begin()
+        error: str | None = None
+        try:
+            yield args
+        except BaseException as exc:
+            error = type(exc).__name__
+            raise
+        finally:
+            self._stack.pop()
+            rss_end = rss_bytes()
+            record = {
+                "name": name,
+                "parent": parent,
+                "depth": len(self._stack),
+                "start_ms": round((start - self._origin) * 1000, 3),
+                "wall_ms": round((time.perf_counter() - start) * 1000, 3),
+                "cpu_ms": round((time.thread_time() - cpu_start) * 1000, 3),
+                "rss_start_bytes": rss_start,
+                "rss_end_bytes": rss_end,
+                "rss_delta_bytes": rss_end - rss_start,
+                "process_peak_rss_bytes": _span_peaks.end(peak_token),
+                "thread": threading.get_ident(),
+                "args": args,
+            }
+            if error:
+                record["error"] = error
+            with self._lock:
+                self.spans.append(record)
+            if self._on_span:
+                self._on_span(record)
+
+    def chrome_trace(self) -> dict[str, Any]:
+        pid = os.getpid()
+        events = []
+        for span in sorted(self.spans, key=lambda item: item["start_ms"]):
+            events.append(
+                {
+                    "name": span["name"],
+                    "cat": "map_pipeline",
+                    "ph": "X",
+                    "ts": round(span["start_ms"] * 1000),
+                    "dur": round(span["wall_ms"] * 1000),
+                    "pid": pid,
+                    "tid": span["thread"],
+                    "args": {
+                        "cpu_ms": span["cpu_ms"],
+                        "rss_start_bytes": span["rss_start_bytes"],
+                        "rss_end_bytes": span["rss_end_bytes"],
+                        "rss_delta_bytes": span["rss_delta_bytes"],
+                        "process_peak_rss_bytes": span["process_peak_rss_bytes"],
+                        **({"error": span["error"]} if "error" in span else {}),
+                        **span["args"],
+                    },
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.chrome_trace(), ensure_ascii=False, default=str), encoding="utf-8")
+        return path
+
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[dict[str, Any]]:
+    """Open a span on the current tracer, or do nothing if none is active."""
+    tracer = current_tracer.get()
+    if tracer is None:
+        yield args
+        return
+    with tracer.span(name, **args) as span_args:
+        yield span_args
+
+
+def traced(name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with span(name):
+            return func(*args, **kwargs)
+
+    wrapper.__traced__ = True  # type: ignore[attr-defined]
+    return wrapper
+
+
+def instrument_module(module: Any, names: list[str], *, prefix: str = "") -> list[str]:
+    """Wrap module-level functions in spans. Returns the names that were wrapped.
+
+    Used to time stages inside dependencies (e.g. `asf`) without editing them;
+    functions called through the module attribute are traced.
+    """
+    wrapped = []
+    for name in names:
+        func = getattr(module, name, None)
+        if not callable(func) or getattr(func, "__traced__", False):
+            continue
+        setattr(module, name, traced(f"{prefix}{name}", func))
+        wrapped.append(name)
+    return wrapped
+
+
+class StageStats:
+    """Rolling per-stage latency samples for percentile reporting."""
+
+    def __init__(self, window: int = 512) -> None:
+        self._window = window
+        self._lock = threading.Lock()
+        self._samples: dict[str, deque[float]] = {}
+        self._counts: dict[str, int] = {}
+
+    def observe(self, stage: str, wall_ms: float) -> None:
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self._window)).append(wall_ms)
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+
+    def summary(self, percentiles: tuple[float, ...] = (50, 90, 99)) -> dict[str, dict[str, float]]:
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+            counts = dict(self._counts)
+        summary: dict[str, dict[str, float]] = {}
+        for stage, values in samples.items():
+            if not values:
+                continue
+            entry: dict[str, float] = {"count": counts[stage], "max_ms": values[-1]}
+            for pct in percentiles:
+                # Nearest-rank percentile.
+                index = min(len(values) - 1, max(0, math.ceil(pct / 100 * len(values)) - 1))
+                entry[f"p{int(pct)}_ms"] = round(values[index], 3)
+            summary[stage] = entry
+        return summary
@@ -233,7 +233,8 @@ class FullPipeline:
                 tolerance=int(tolerance),
                 num_workers=None,
                 auto_crop=auto_crop,
-                crop_padding=int(crop_padding)
+                crop_padding=int(crop_padding),
+                clip_model=True
             )
             
             # 步骤4: 创建最终 sprite sheet
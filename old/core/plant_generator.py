@@ -25,6 +25,7 @@ from lib.extract_sprite_frames import (
     process_frames_to_target_size
 )
 from lib.remove_background import process_directory
+from lib.matting import apply_alpha, get_engine
 
 from .config import OUTPUT_DIR, DEFAULT_DIRT_IMAGE_PATH, t, get_current_language
 from .api_manager import get_api_manager
@@ -281,17 +282,12 @@ class PlantGenerator:
                     # 调整到目标宽度（放大）
                     cell_img = cell_img.resize((target_width, target_width), Image.Resampling.LANCZOS)
                     
-                    # 去除背景（白色）
-                    cell_img = cell_img.convert("RGBA")
-                    datas = cell_img.getdata()
-                    newData = []
-                    for item in datas:
-                        # 检测白色或接近白色的像素
-                        if item[0] > 240 and item[1] > 240 and item[2] > 240:
-                            newData.append((255, 255, 255, 0))  # 透明
-                        else:
-                            newData.append(item)
-                    cell_img.putdata(newData)
+                    # 去除背景（白色）: 三个通道都 > 240 的像素设为透明白色
+                    cell_rgb = np.asarray(cell_img.convert("RGB"))
+                    alpha = get_engine().matte(cell_rgb, "floor", floor=240)
+                    cell_rgba = apply_alpha(cell_rgb, alpha)
+                    cell_rgba[alpha == 0, :3] = 255
+                    cell_img = Image.fromarray(cell_rgba, "RGBA")
                     
                     # 保存到 final_frames 根目录，按transition/idle分类命名
                     filename = f"{plant_id}-stage{stage_num}-{anim_type}-frame{anim_frame_idx}.png"
@@ -1126,9 +1122,9 @@ class PlantGenerator:
         idle_nobg_dir = os.path.join(stage_dir, "idle_nobg")
         
         process_directory(transition_frames_dir, output_dir=transition_nobg_dir, tolerance=tolerance,
-                         num_workers=None, auto_crop=auto_crop, crop_padding=crop_padding)
+                         num_workers=None, auto_crop=auto_crop, crop_padding=crop_padding, clip_model=True)
         process_directory(idle_frames_dir, output_dir=idle_nobg_dir, tolerance=tolerance,
-                         num_workers=None, auto_crop=auto_crop, crop_padding=crop_padding)
+                         num_workers=None, auto_crop=auto_crop, crop_padding=crop_padding, clip_model=True)
         
         # 缩放帧
         transition_resized = FrameProcessor.resize_frames_to_width(transition_nobg_dir, target_width)
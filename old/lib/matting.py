@@ -0,0 +1,828 @@
+"""
+统一抠图引擎
+为 lib/remove_background、mcp/frame_extractor 和 PlantGenerator 提供同一套背景移除实现
+
+特点:
+    - 全部在整数域计算: 颜色距离使用平方距离查找表 (uint32)，阈值比较不开方
+    - 按帧尺寸复用 scratch 缓冲区，连续处理视频帧时不再反复分配整帧数组
+    - 可插拔策略: color (颜色键)、white (白底)、flood (边缘连通)、smart (智能)、floor (通道下限)
+    - 批量接口: matte_batch 处理 (N, H, W, 3) 的帧堆栈
+    - 片段模式: ClipBackground 从抽样帧估计一次背景 (黑边、背景色、渐变)，
+      smooth_alpha_sequence 在静止区域做时间中值滤波抑制闪烁
+    - 大图: 降采样估计前景边界框，分块 (带重叠) 抠图，边缘精细化只处理 alpha 边界附近的块
+
+使用方法:
+    engine = get_engine()
+    alpha = engine.matte(rgb, "smart", bg_color=(255, 255, 255), tolerance=50)
+    alphas = engine.matte_batch(frames, "flood", bg_color=(0, 255, 0), tolerance=30)
+
+    clip = estimate_clip_background(samples, border_skip=20)
+    rgb, alpha = engine.matte_clip(frame_rgb, clip, "smart", tolerance=50)
+"""
+
+import math
+import threading
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+try:
+    from scipy import ndimage
+except ImportError:
+    ndimage = None
+
+
+STRATEGIES = ("color", "white", "flood", "smart", "floor")
+
+# refine_edges 的边缘距离阈值: 距离背景色小于该值的边缘像素按距离降低透明度
+EDGE_REFINE_DISTANCE = 60
+
+# 片段背景模型: 抽样帧数、渐变拟合所需的最少边框像素数、忽略的渐变幅度
+CLIP_SAMPLE_FRAMES = 8
+CLIP_MIN_RING_PIXELS = 64
+CLIP_MIN_GRADIENT = 4
+
+# 左右黑边只在接近 1280x720 的帧 (视频生成的版式) 上检测，其他尺寸的暗边是画面内容
+BLACK_BORDER_WIDTHS = (1270, 1290)
+BLACK_BORDER_HEIGHTS = (710, 770)
+
+# 时间平滑: 相邻帧 RGB 差异 (各通道最大值) 不超过该值才视为静止像素
+TEMPORAL_MOTION_THRESHOLD = 24
+
+# 大图分块: 超过 TILED_MIN_PIXELS 的输入按 TILE_SIZE 分块，每块四周多读 TILE_HALO 像素
+TILED_MIN_PIXELS = 2048 * 2048
+TILE_SIZE = 1024
+TILE_HALO = 16
+# 粗略前景框的降采样倍数；比它更细且孤立的前景可能被漏掉
+COARSE_FACTOR = 4
+# refine_edges 在该尺寸的块网格上定位 alpha 边界
+REFINE_BLOCK = 64
+# 需要全图连通性 (边缘连通) 的策略，不能分块，只能裁到前景框整体处理
+GLOBAL_STRATEGIES = ("flood", "smart")
+
+
+def squared_threshold(tolerance, inclusive=False):
+    """
+    把欧氏距离阈值换算成整数平方距离阈值，使 d2 <= 返回值 与原来的 sqrt 比较等价
+
+    参数:
+        tolerance: 距离阈值 (可为小数，如 tolerance * 1.5)
+        inclusive: True 表示原比较为 d <= tolerance，False 表示 d < tolerance
+    """
+    t2 = float(tolerance) * float(tolerance)
+    if inclusive:
+        return int(math.floor(t2))
+    return int(math.ceil(t2)) - 1
+
+
+def _edge_alpha_lut():
+    """平方距离 -> 边缘 alpha (255 * d / 60，截断)，仅覆盖 d < 60 的部分"""
+    limit = EDGE_REFINE_DISTANCE * EDGE_REFINE_DISTANCE
+    d2 = np.arange(limit, dtype=np.float64)
+    return (255.0 * np.sqrt(d2) / EDGE_REFINE_DISTANCE).astype(np.uint8)
+
+
+_EDGE_ALPHA_LUT = _edge_alpha_lut()
+
+
+def _mean_color(bg_color):
+    """背景色 (元组或逐像素背景平面) 的平均颜色"""
+    if isinstance(bg_color, np.ndarray):
+        return tuple(int(c) for c in bg_color.reshape(-1, 3).mean(axis=0))
+    return bg_color
+
+
+def _squared_distance(rgb, bg_color, dist, term, diff=None):
+    """到背景色 (颜色元组或背景平面) 的平方距离写入 dist (uint32)，term/diff 为临时缓冲区"""
+    if isinstance(bg_color, np.ndarray):
+        square = term.view(np.int32)
+        for channel in range(3):
+            np.subtract(rgb[:, :, channel], bg_color[:, :, channel], out=diff, dtype=np.int16)
+            np.multiply(diff, diff, out=square, dtype=np.int32)
+            if channel == 0:
+                dist[:] = term
+            else:
+                dist += term
+        return dist
+    values = np.arange(256, dtype=np.int32)
+    for channel in range(3):
+        lut = ((values - int(bg_color[channel])) ** 2).astype(np.uint32)
+        if channel == 0:
+            np.take(lut, rgb[:, :, 0], out=dist)
+        else:
+            np.take(lut, rgb[:, :, channel], out=term)
+            dist += term
+    return dist
+
+
+def _background_region(bg_color, rows, cols):
+    """背景平面取与 rgb 子区域对应的部分；颜色元组原样返回"""
+    if isinstance(bg_color, np.ndarray):
+        return bg_color[rows, cols]
+    return bg_color
+
+
+def _block_reduce(mask, block, ufunc):
+    """按 block x block 块对布尔掩码做 any (logical_or) / all (logical_and) 归约"""
+    h, w = mask.shape
+    rows = ufunc.reduceat(mask, np.arange(0, h, block), axis=0)
+    return ufunc.reduceat(rows, np.arange(0, w, block), axis=1)
+
+
+def _edge_band_regions(opaque, block):
+    """
+    alpha 边界附近的块区域，按块行合并连续块，产出 (y0, y1, x0, x1)
+
+    标记: 内部混有透明/不透明的块、与相邻块状态不同的纯色块、
+    贴着图像边缘且含不透明像素的块 (refine 的腐蚀边界值为 0)；
+    再向八邻域扩一块，覆盖边缘带伸进相邻块的部分 (要求 feather_radius + 1 <= block)。
+    """
+    h, w = opaque.shape
+    any_opaque = _block_reduce(opaque, block, np.logical_or)
+    all_opaque = _block_reduce(opaque, block, np.logical_and)
+    marked = any_opaque & ~all_opaque
+    differs = all_opaque[:, :-1] != all_opaque[:, 1:]
+    marked[:, :-1] |= differs
+    marked[:, 1:] |= differs
+    differs = all_opaque[:-1, :] != all_opaque[1:, :]
+    marked[:-1, :] |= differs
+    marked[1:, :] |= differs
+    border = np.zeros_like(marked)
+    border[0, :] = border[-1, :] = border[:, 0] = border[:, -1] = True
+    marked |= border & any_opaque
+
+    padded = np.pad(marked, 1)
+    grown = np.zeros_like(marked)
+    for dy in range(3):
+        for dx in range(3):
+            grown |= padded[dy:dy + marked.shape[0], dx:dx + marked.shape[1]]
+
+    for row in range(grown.shape[0]):
+        cols = np.flatnonzero(grown[row])
+        if len(cols) == 0:
+            continue
+        for run in np.split(cols, np.flatnonzero(np.diff(cols) > 1) + 1):
+            yield (
+                row * block,
+                min(h, (row + 1) * block),
+                int(run[0]) * block,
+                min(w, (int(run[-1]) + 1) * block),
+            )
+
+
+def _tile_span(start, stop, limit, tile, halo):
+    """内部区间 [start, stop) 外扩 halo 后的读取区间，尽量保持 tile + 2 * halo 的固定长度以复用缓冲区"""
+    size = min(limit, tile + 2 * halo)
+    outer_start = min(max(0, start - halo), limit - size)
+    return outer_start, max(stop, outer_start + size)
+
+
+def _square_kernel(size):
+    return np.ones((size, size), np.uint8)
+
+
+def _cross_kernel():
+    return np.array([[0, 1, 0], [1, 1, 1], [0, 1, 0]], np.uint8)
+
+
+def _binary_value(mask):
+    """二值平面的前景值 (0/1 或 0/255)，scipy 回退路径按它还原结果"""
+    return np.uint8(255 if mask.max(initial=0) > 1 else 1)
+
+
+def _dilate(mask, kernel, iterations=1):
+    """二值膨胀 (mask 为 uint8 0/1 或 0/255)"""
+    if cv2 is not None:
+        return cv2.dilate(mask, kernel, iterations=iterations)
+    dilated = ndimage.binary_dilation(mask, structure=kernel.astype(bool), iterations=iterations)
+    return dilated.astype(np.uint8) * _binary_value(mask)
+
+
+def _erode(mask, kernel, iterations=1, border_value=1):
+    """二值腐蚀 (mask 为 uint8 0/1 或 0/255)；border_value=1 与 OpenCV 默认边界一致"""
+    if cv2 is not None:
+        if border_value == 1:
+            return cv2.erode(mask, kernel, iterations=iterations)
+        return cv2.erode(
+            mask, kernel, iterations=iterations, borderType=cv2.BORDER_CONSTANT, borderValue=int(border_value)
+        )
+    eroded = ndimage.binary_erosion(
+        mask, structure=kernel.astype(bool), iterations=iterations, border_value=border_value
+    )
+    return eroded.astype(np.uint8) * _binary_value(mask)
+
+
+def _blur3(plane):
+    """3x3 高斯模糊 (sigma 自动)，uint8 进 uint8 出"""
+    if cv2 is not None:
+        return cv2.GaussianBlur(plane, (3, 3), 0)
+    # [1, 2, 1] / 4 可分离卷积，BORDER_REFLECT_101 边界，整数运算并四舍五入
+    padded = np.pad(plane, 1, mode="reflect").astype(np.uint16)
+    rows = padded[:-2, :] + 2 * padded[1:-1, :] + padded[2:, :]
+    blurred = rows[:, :-2] + 2 * rows[:, 1:-1] + rows[:, 2:]
+    return ((blurred + 8) >> 4).astype(np.uint8)
+
+
+def _label(mask):
+    """4 连通区域标记，返回 (int32 标签图, 区域数)"""
+    if ndimage is not None:
+        return ndimage.label(mask)
+    count, labeled = cv2.connectedComponents(mask.astype(np.uint8), connectivity=4)
+    return labeled, count - 1
+
+
+def _ring(plane, inset):
+    """plane 上距离边缘 inset 像素的一圈 (一维数组)"""
+    h, w = plane.shape
+    top, bottom = inset, h - 1 - inset
+    left, right = inset, w - 1 - inset
+    return np.concatenate((
+        plane[top, left:right + 1],
+        plane[bottom, left:right + 1],
+        plane[top:bottom + 1, left],
+        plane[top:bottom + 1, right],
+    ))
+
+
+class MattingEngine:
+    """
+    可复用的抠图引擎
+
+    一个实例在连续帧之间复用 scratch 缓冲区 (帧尺寸变化时重新分配)，
+    因此不是线程安全的；多线程请用 get_engine() 获取线程本地实例。
+    """
+
+    def __init__(self):
+        self._buffers = {}
+        self._coarse = None
+
+    def _scratch(self, name, shape, dtype):
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buffer
+        return buffer
+
+    # ------------------------------------------------------------------
+    # 基础掩码
+    # ------------------------------------------------------------------
+
+    def distance_squared(self, rgb, bg_color):
+        """
+        每个像素到背景色的平方距离 (uint32)，写入复用缓冲区
+
+        每个通道用 256 项查找表 (c - bg)^2 取值，避免整帧 int32/float 副本；
+        bg_color 为 (H, W, 3) 背景平面 (渐变背景) 时逐像素相减
+        """
+        h, w = rgb.shape[:2]
+        dist = self._scratch("dist2", (h, w), np.uint32)
+        term = self._scratch("dist2_term", (h, w), np.uint32)
+        diff = self._scratch("dist2_diff", (h, w), np.int16) if isinstance(bg_color, np.ndarray) else None
+        return _squared_distance(rgb, bg_color, dist, term, diff)
+
+    def color_key_mask(self, rgb, bg_color, tolerance, inclusive=False):
+        """与背景色距离小于 (inclusive 时小于等于) tolerance 的像素"""
+        dist = self.distance_squared(rgb, bg_color)
+        return dist <= squared_threshold(tolerance, inclusive)
+
+    def white_key_mask(self, rgb, bg_color, tolerance):
+        """
+        白色背景掩码: 高亮度 + 低饱和度，并上颜色距离 <= tolerance * 1.5
+
+        饱和度判断 (max - min) / max <= tolerance / 255 * 1.5 在整数域改写为
+        510 * (max - min) <= 3 * tolerance * max
+        """
+        h, w = rgb.shape[:2]
+        max_rgb = self._scratch("max_rgb", (h, w), np.uint8)
+        min_rgb = self._scratch("min_rgb", (h, w), np.uint8)
+        np.maximum(rgb[:, :, 0], rgb[:, :, 1], out=max_rgb)
+        np.maximum(max_rgb, rgb[:, :, 2], out=max_rgb)
+        np.minimum(rgb[:, :, 0], rgb[:, :, 1], out=min_rgb)
+        np.minimum(min_rgb, rgb[:, :, 2], out=min_rgb)
+
+        spread = self._scratch("spread", (h, w), np.int32)
+        limit = self._scratch("sat_limit", (h, w), np.int32)
+        np.subtract(max_rgb, min_rgb, out=spread, dtype=np.int32)
+        spread *= 510
+        np.multiply(max_rgb, 3 * int(tolerance), out=limit, dtype=np.int32)
+
+        mask = (max_rgb >= 255 - tolerance) & (spread <= limit)
+        mask |= self.color_key_mask(rgb, bg_color, tolerance * 1.5, inclusive=True)
+        return mask
+
+    def border_connected(self, mask, border_skip=0):
+        """
+        只保留与图像边缘 (以及 border_skip 处的内边框) 连通的区域
+
+        所有策略共用；标签化后用布尔查找表重映射，耗时与像素数成线性
+
+        参数:
+            mask: bool 或 0/1 掩码
+            border_skip: >0 时额外以距离边缘 border_skip 像素的一圈作为种子
+        """
+        h, w = mask.shape
+        labeled, count = _label(mask)
+        seeds = [_ring(labeled, 0)]
+        inner = border_skip
+        if inner > 0 and inner < h - inner and inner < w - inner:
+            seeds.append(_ring(labeled, inner))
+
+        # 标签查找表: 触边标签为 True，再用标签图一次性索引，
+        # 与触边区域数量无关，每个像素只访问一次
+        lut = np.zeros(count + 1, dtype=bool)
+        lut[np.concatenate(seeds)] = True
+        lut[0] = False
+        return lut[labeled]
+
+    def shrink_foreground(self, background, edge_shrink):
+        """边缘内缩: 以 (2 * edge_shrink + 1) 方核腐蚀前景，返回新的背景掩码"""
+        if edge_shrink <= 0:
+            return background
+        foreground = (~background).astype(np.uint8)
+        foreground = _erode(foreground, _square_kernel(edge_shrink * 2 + 1))
+        return foreground == 0
+
+    def refine_edges(self, rgb, alpha, bg_color, feather_radius=1, dist=None):
+        """
+        边缘精细化: 边缘带内接近背景色的像素按距离降低透明度 (原地修改 alpha)
+
+        参数:
+            dist: 已算好的平方距离 (distance_squared 的结果)，省去重复计算
+
+        只在 alpha 边界附近的块 (见 _edge_band_regions) 上做形态学和距离计算，
+        耗时随前景周长而不是画布面积增长；结果与整图计算一致。
+
+        返回被调整的像素数；scipy 与 OpenCV 都不可用时返回 -1
+        """
+        if ndimage is None and cv2 is None:
+            return -1
+        h, w = alpha.shape
+        reach = feather_radius + 1
+        margin = reach + 1
+        opaque = alpha > 0
+        adjusted = 0
+        for y0, y1, x0, x1 in _edge_band_regions(opaque, max(REFINE_BLOCK, reach)):
+            # 外扩 margin 做形态学，保证内部区域的结果不受区域边界影响
+            ey0, ey1 = max(0, y0 - margin), min(h, y1 + margin)
+            ex0, ex1 = max(0, x0 - margin), min(w, x1 + margin)
+            region = opaque[ey0:ey1, ex0:ex1].astype(np.uint8)
+            dilated = _dilate(region, _cross_kernel(), iterations=reach)
+            eroded = _erode(region, _cross_kernel(), iterations=max(1, feather_radius), border_value=0)
+            inner = (slice(y0 - ey0, y1 - ey0), slice(x0 - ex0, x1 - ex0))
+            band = (dilated[inner] > 0) & (eroded[inner] == 0) & opaque[y0:y1, x0:x1]
+            if not band.any():
+                continue
+
+            rows, cols = slice(y0, y1), slice(x0, x1)
+            if dist is not None:
+                region_dist = dist[rows, cols]
+            else:
+                shape = (y1 - y0, x1 - x0)
+                background = _background_region(bg_color, rows, cols)
+                region_dist = _squared_distance(
+                    rgb[rows, cols], background, np.empty(shape, np.uint32), np.empty(shape, np.uint32),
+                    np.empty(shape, np.int16) if isinstance(background, np.ndarray) else None,
+                )
+            adjust = band & (region_dist < _EDGE_ALPHA_LUT.size)
+            region_alpha = alpha[rows, cols]
+            scaled = (region_alpha[adjust].astype(np.uint16) * _EDGE_ALPHA_LUT[region_dist[adjust]]) // 255
+            region_alpha[adjust] = scaled.astype(np.uint8)
+            adjusted += int(np.count_nonzero(adjust))
+        return adjusted
+
+    # ------------------------------------------------------------------
+    # 策略
+    # ------------------------------------------------------------------
+
+    def _color(self, rgb, bg_color, tolerance=30, edge_smooth=1, **_):
+        """颜色键: 与背景色距离小于容差的像素透明，可选闭运算 + 模糊平滑"""
+        alpha = np.where(self.color_key_mask(rgb, bg_color, tolerance), 0, 255).astype(np.uint8)
+        if edge_smooth > 0:
+            kernel = _square_kernel(edge_smooth * 2 + 1)
+            alpha = _erode(_dilate(alpha, kernel), kernel)
+            alpha = _blur3(alpha)
+        return alpha
+
+    def _white(self, rgb, bg_color, tolerance=30, white_threshold=230, **_):
+        """
+        lib/remove_background 的算法: 白色背景用亮度/饱和度 + 颜色距离并做边缘精细化，
+        其他背景用颜色距离 (<= tolerance)
+        """
+        if all(c >= white_threshold for c in _mean_color(bg_color)):
+            mask = self.white_key_mask(rgb, bg_color, tolerance)
+            alpha = np.where(mask, 0, 255).astype(np.uint8)
+            # white_key_mask 刚把到背景色的平方距离写进 dist2 缓冲区
+            self.refine_edges(rgb, alpha, bg_color, feather_radius=1, dist=self._buffers["dist2"])
+        else:
+            mask = self.color_key_mask(rgb, bg_color, tolerance, inclusive=True)
+            alpha = np.where(mask, 0, 255).astype(np.uint8)
+        return alpha
+
+    def _flood(self, rgb, bg_color, tolerance=30, edge_shrink=5, edge_smooth=1, **_):
+        """从图像边缘连通的背景区域才移除，保留主体内部的背景色"""
+        background = self.border_connected(self.color_key_mask(rgb, bg_color, tolerance))
+        background = self.shrink_foreground(background, edge_shrink)
+        if edge_smooth > 0:
+            kernel = _square_kernel(edge_smooth * 2 + 1)
+            foreground = (~background).astype(np.uint8) * 255
+            foreground = _erode(_dilate(foreground, kernel), kernel)
+            foreground = _blur3(foreground)
+            background = foreground < 128
+        return np.where(background, 0, 255).astype(np.uint8)
+
+    def _smart(self, rgb, bg_color, tolerance=50, edge_shrink=3, border_skip=20, **_):
+        """
+        智能模式: 颜色匹配 (浅色背景额外匹配暗边框)，膨胀后按边缘连通筛选，
+        再内缩并模糊边缘
+        """
+        background = self.color_key_mask(rgb, bg_color, tolerance)
+        if sum(_mean_color(bg_color)) / 3 > 200:
+            # 灰度均值 < 40 等价于三通道和 < 120
+            h, w = rgb.shape[:2]
+            total = self._scratch("channel_sum", (h, w), np.uint16)
+            np.add(rgb[:, :, 0], rgb[:, :, 1], out=total, dtype=np.uint16)
+            total += rgb[:, :, 2]
+            background |= total < 120
+        dilated = _dilate(background.astype(np.uint8), _square_kernel(3))
+        background &= self.border_connected(dilated, border_skip=border_skip)
+        background = self.shrink_foreground(background, edge_shrink)
+        foreground = (~background).astype(np.uint8) * 255
+        return _blur3(foreground)
+
+    def _floor(self, rgb, floor=240, **_):
+        """通道下限: 三个通道都大于 floor 的像素透明 (接近纯白)"""
+        h, w = rgb.shape[:2]
+        low = self._scratch("min_rgb", (h, w), np.uint8)
+        np.minimum(rgb[:, :, 0], rgb[:, :, 1], out=low)
+        np.minimum(low, rgb[:, :, 2], out=low)
+        return np.where(low > floor, 0, 255).astype(np.uint8)
+
+    # ------------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------------
+
+    def matte(self, rgb, strategy, bg_color=(255, 255, 255), **params):
+        """
+        计算单帧 alpha
+
+        参数:
+            rgb: (H, W, 3) uint8 数组
+            strategy: STRATEGIES 之一
+            bg_color: 背景色 (R, G, B)，或与 rgb 同尺寸的 (H, W, 3) uint8 背景平面
+            **params: 策略参数 (tolerance, edge_shrink, edge_smooth, border_skip, floor ...)
+
+        返回:
+            (H, W) uint8 alpha
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"未知抠图策略: {strategy}")
+        if not isinstance(bg_color, np.ndarray):
+            bg_color = tuple(int(c) for c in bg_color)
+        h, w = rgb.shape[:2]
+        if h * w >= TILED_MIN_PIXELS:
+            return self.matte_tiled(rgb, strategy, bg_color=bg_color, **params)
+        return self._matte_region(rgb, strategy, bg_color, **params)
+
+    def _matte_region(self, rgb, strategy, bg_color, **params):
+        rgb = np.ascontiguousarray(rgb[:, :, :3], dtype=np.uint8)
+        return getattr(self, f"_{strategy}")(rgb, bg_color=bg_color, **params)
+
+    def _coarse_engine(self):
+        # 降采样副本用独立的引擎，不打乱整帧/分块尺寸的 scratch 缓冲区
+        if self._coarse is None:
+            self._coarse = MattingEngine()
+        return self._coarse
+
+    def foreground_bbox(self, rgb, strategy, bg_color=(255, 255, 255), factor=COARSE_FACTOR,
+                        tolerance=30, floor=240, white_threshold=230, **_):
+        """
+        在 factor 倍降采样 (取样) 的副本上粗略估计前景边界框
+
+        只做颜色判断不做形态学，偏保守 (框宁大勿小)；比 factor 更细且孤立的前景可能漏掉。
+
+        返回:
+            (x0, y0, x1, y1)，没有前景时返回 None
+        """
+        h, w = rgb.shape[:2]
+        small = np.ascontiguousarray(rgb[::factor, ::factor, :3])
+        background = _background_region(bg_color, slice(None, None, factor), slice(None, None, factor))
+        if isinstance(background, np.ndarray):
+            background = np.ascontiguousarray(background)
+        engine = self._coarse_engine()
+        if strategy == "floor":
+            foreground = small.min(axis=2) <= floor
+        elif strategy == "white" and all(c >= white_threshold for c in _mean_color(background)):
+            foreground = ~engine.white_key_mask(small, background, tolerance)
+        else:
+            foreground = ~engine.color_key_mask(small, background, tolerance)
+
+        rows = np.flatnonzero(foreground.any(axis=1))
+        if len(rows) == 0:
+            return None
+        cols = np.flatnonzero(foreground.any(axis=0))
+        return (
+            max(0, int(cols[0]) * factor - factor),
+            max(0, int(rows[0]) * factor - factor),
+            min(w, (int(cols[-1]) + 2) * factor),
+            min(h, (int(rows[-1]) + 2) * factor),
+        )
+
+    def matte_tiled(self, rgb, strategy, bg_color=(255, 255, 255), tile=TILE_SIZE, halo=TILE_HALO, **params):
+        """
+        大图抠图: 只处理粗略前景框内的部分，框外直接透明
+
+        局部策略 (color/white/floor) 按 tile 分块，每块四周多读 halo 像素再只写回中间，
+        读取区域尽量保持固定尺寸，scratch 缓冲区在块之间复用，内存只与块大小有关；
+        flood/smart 依赖全图边缘连通，裁到前景框 (外扩 halo + border_skip) 后整体处理。
+
+        返回:
+            (H, W) uint8 alpha
+        """
+        if not isinstance(bg_color, np.ndarray):
+            bg_color = tuple(int(c) for c in bg_color)
+        h, w = rgb.shape[:2]
+        alpha = np.zeros((h, w), dtype=np.uint8)
+        box = self.foreground_bbox(rgb, strategy, bg_color, **params)
+        if box is None:
+            return alpha
+        x0, y0, x1, y1 = box
+
+        if strategy in GLOBAL_STRATEGIES:
+            margin = halo + params.get("border_skip", 20 if strategy == "smart" else 0)
+            y0, y1 = max(0, y0 - margin), min(h, y1 + margin)
+            x0, x1 = max(0, x0 - margin), min(w, x1 + margin)
+            rows, cols = slice(y0, y1), slice(x0, x1)
+            alpha[rows, cols] = self._matte_region(
+                rgb[rows, cols], strategy, _background_region(bg_color, rows, cols), **params
+            )
+            return alpha
+
+        for ty in range(y0, y1, tile):
+            iy1 = min(ty + tile, y1)
+            oy0, oy1 = _tile_span(ty, iy1, h, tile, halo)
+            for tx in range(x0, x1, tile):
+                ix1 = min(tx + tile, x1)
+                ox0, ox1 = _tile_span(tx, ix1, w, tile, halo)
+                rows, cols = slice(oy0, oy1), slice(ox0, ox1)
+                region = self._matte_region(
+                    rgb[rows, cols], strategy, _background_region(bg_color, rows, cols), **params
+                )
+                alpha[ty:iy1, tx:ix1] = region[ty - oy0:iy1 - oy0, tx - ox0:ix1 - ox0]
+        return alpha
+
+    def matte_clip(self, rgb, clip, strategy="white", **params):
+        """
+        用片段背景模型处理一帧: 先按模型裁掉黑边，再以模型背景 (纯色或渐变平面) 抠图
+
+        返回:
+            (裁剪后的 rgb, alpha)
+        """
+        rgb = clip.crop_frame(rgb[:, :, :3])
+        h, w = rgb.shape[:2]
+        return rgb, self.matte(rgb, strategy, bg_color=clip.background(h, w), **params)
+
+    def matte_batch(self, frames, strategy, bg_color=(255, 255, 255), bg_colors=None, out=None, **params):
+        """
+        批量计算 (N, H, W, 3) 帧堆栈的 alpha，scratch 缓冲区在帧之间复用
+
+        参数:
+            bg_colors: 每帧各自的背景色列表 (优先于 bg_color)
+            out: 可选的 (N, H, W) uint8 输出数组
+
+        返回:
+            (N, H, W) uint8 alpha 堆栈
+        """
+        frames = np.asarray(frames)
+        count, h, w = frames.shape[:3]
+        if out is None:
+            out = np.empty((count, h, w), dtype=np.uint8)
+        for index in range(count):
+            color = bg_colors[index] if bg_colors is not None else bg_color
+            out[index] = self.matte(frames[index], strategy, bg_color=color, **params)
+        return out
+
+
+class ClipBackground:
+    """
+    一段视频共用的背景模型
+
+    属性:
+        crop: (left, right) 左右黑边裁剪后的列范围，None 表示不裁剪
+        bg_color: 背景色 (R, G, B)
+        gradient: (3, 3) 渐变平面系数，每个通道 [c0, cx, cy]，
+            背景 = c0 + cx * x / w + cy * y / h；None 表示纯色背景
+    """
+
+    def __init__(self, crop=None, bg_color=(255, 255, 255), gradient=None):
+        self.crop = crop
+        self.bg_color = tuple(int(c) for c in bg_color)
+        self.gradient = gradient
+        self._plane = None
+
+    def crop_frame(self, rgb):
+        if self.crop is None:
+            return rgb
+        left, right = self.crop
+        return rgb[:, left:right]
+
+    def background(self, h, w):
+        """纯色背景返回颜色元组，渐变背景返回 (h, w, 3) uint8 背景平面 (按尺寸缓存)"""
+        if self.gradient is None:
+            return self.bg_color
+        if self._plane is None or self._plane.shape[:2] != (h, w):
+            xs = (np.arange(w, dtype=np.float32) / max(1, w))[None, :]
+            ys = (np.arange(h, dtype=np.float32) / max(1, h))[:, None]
+            plane = np.empty((h, w, 3), dtype=np.uint8)
+            for channel, (c0, cx, cy) in enumerate(self.gradient):
+                plane[:, :, channel] = np.clip(c0 + cx * xs + cy * ys + 0.5, 0, 255)
+            self._plane = plane
+        return self._plane
+
+    def __getstate__(self):
+        # 传给工作进程时不带缓存的背景平面
+        state = dict(self.__dict__)
+        state["_plane"] = None
+        return state
+
+    def describe(self):
+        text = f"RGB{self.bg_color}"
+        if self.gradient is not None:
+            swing = max(abs(cx) + abs(cy) for _, cx, cy in self.gradient)
+            text += f", 渐变幅度 {swing:.0f}"
+        if self.crop is not None:
+            text += f", 裁剪列 {self.crop[0]}-{self.crop[1]}"
+        return text
+
+
+def sample_indices(count, samples=CLIP_SAMPLE_FRAMES):
+    """在 count 帧中均匀抽取至多 samples 帧的索引"""
+    if count <= samples:
+        return list(range(count))
+    return sorted({round(i * (count - 1) / (samples - 1)) for i in range(samples)})
+
+
+def black_border_size(w, h):
+    """帧尺寸是否在检测左右黑边的范围内 (约 1280x720)"""
+    return (BLACK_BORDER_WIDTHS[0] <= w <= BLACK_BORDER_WIDTHS[1]
+            and BLACK_BORDER_HEIGHTS[0] <= h <= BLACK_BORDER_HEIGHTS[1])
+
+
+def _clip_crop(samples, black_threshold):
+    """所有抽样帧的列亮度中值，找到左右黑边；帧尺寸不在 black_border_size 范围内时不裁剪"""
+    h, w = samples[0].shape[:2]
+    if not black_border_size(w, h):
+        return None
+    brightness = np.median([sample.mean(axis=(0, 2)) for sample in samples], axis=0)
+    non_black = np.where(brightness > black_threshold)[0]
+    if len(non_black) == 0:
+        return None
+    left, right = int(non_black[0]), int(non_black[-1]) + 1
+    if left == 0 and right == w:
+        return None
+    return (left, right)
+
+
+def _corner_color(rgb, border_skip, sample_size=15):
+    """跳过 border_skip 像素后四个角的平均色 (与 frame_extractor.detect_background_color 相同)"""
+    h, w = rgb.shape[:2]
+    start, end_h, end_w = border_skip, h - border_skip, w - border_skip
+    if end_h <= start or end_w <= start:
+        start, end_h, end_w = 5, h - 5, w - 5
+    corners = [
+        rgb[start:start + sample_size, start:start + sample_size],
+        rgb[start:start + sample_size, end_w - sample_size:end_w],
+        rgb[end_h - sample_size:end_h, start:start + sample_size],
+        rgb[end_h - sample_size:end_h, end_w - sample_size:end_w],
+    ]
+    return np.mean([corner.reshape(-1, 3).mean(axis=0) for corner in corners], axis=0)
+
+
+def _clip_gradient(samples, bg_color, border_skip, tolerance, ring=4, step=4):
+    """
+    用边框一圈 (距离背景色不超过 2 * tolerance 的像素) 拟合每个通道的线性渐变平面
+
+    渐变幅度小于 CLIP_MIN_GRADIENT 时返回 None (按纯色背景处理)
+    """
+    h, w = samples[0].shape[:2]
+    inset = border_skip if border_skip * 2 + ring * 2 < min(h, w) else 0
+    ys, xs = np.mgrid[0:h:step, 0:w:step]
+    ring_mask = (
+        (ys >= inset) & (ys < h - inset) & (xs >= inset) & (xs < w - inset)
+        & ((ys < inset + ring) | (ys >= h - inset - ring) | (xs < inset + ring) | (xs >= w - inset - ring))
+    )
+    ys, xs = ys[ring_mask], xs[ring_mask]
+    limit = squared_threshold(tolerance * 2, inclusive=True)
+    bg = np.array(bg_color, dtype=np.int32)
+
+    coords, colors = [], []
+    for sample in samples:
+        pixels = sample[ys, xs].astype(np.int32)
+        near = ((pixels - bg) ** 2).sum(axis=1) <= limit
+        coords.append(np.stack((xs[near] / w, ys[near] / h), axis=1))
+        colors.append(pixels[near])
+    coords = np.concatenate(coords)
+    colors = np.concatenate(colors)
+    if len(colors) < CLIP_MIN_RING_PIXELS:
+        return None
+
+    design = np.column_stack((np.ones(len(coords)), coords))
+    coefficients, *_ = np.linalg.lstsq(design, colors.astype(np.float64), rcond=None)
+    gradient = coefficients.T
+    if max(abs(cx) + abs(cy) for _, cx, cy in gradient) < CLIP_MIN_GRADIENT:
+        return None
+    return gradient
+
+
+def estimate_clip_background(samples, border_skip=0, tolerance=30, black_threshold=30, detect_crop=True):
+    """
+    从同一段视频的抽样帧估计背景模型
+
+    参数:
+        samples: (H, W, 3) uint8 帧列表 (同尺寸，建议用 sample_indices 抽样)
+        border_skip: 采样背景色时跳过的边框像素数
+        tolerance: 颜色容差，用于挑选参与渐变拟合的边框像素
+        black_threshold: 列平均亮度低于该值视为黑边
+        detect_crop: 是否检测并裁剪左右黑边 (只对约 1280x720 的帧生效)
+
+    返回:
+        ClipBackground
+    """
+    samples = [np.asarray(sample)[:, :, :3] for sample in samples]
+    crop = _clip_crop(samples, black_threshold) if detect_crop else None
+    if crop is not None:
+        samples = [sample[:, crop[0]:crop[1]] for sample in samples]
+    bg_color = np.median([_corner_color(sample, border_skip) for sample in samples], axis=0)
+    bg_color = tuple(int(c) for c in bg_color)
+    gradient = _clip_gradient(samples, bg_color, border_skip, tolerance)
+    return ClipBackground(crop=crop, bg_color=bg_color, gradient=gradient)
+
+
+def _median3(a, b, c):
+    low = np.minimum(a, b)
+    high = np.maximum(a, b)
+    np.minimum(high, c, out=high)
+    return np.maximum(low, high, out=low)
+
+
+def _static_mask(rgb, other, motion_threshold):
+    diff = np.abs(rgb.astype(np.int16) - other.astype(np.int16)).max(axis=2)
+    return diff <= motion_threshold
+
+
+def _smooth_frame(prev, cur, nxt, motion_threshold):
+    rgb, alpha = cur
+    prev = prev if prev is not None and prev[1].shape == alpha.shape else None
+    nxt = nxt if nxt is not None and nxt[1].shape == alpha.shape else None
+    if prev is None and nxt is None:
+        return alpha.copy()
+    prev = prev or nxt
+    nxt = nxt or prev
+    static = _static_mask(rgb, prev[0], motion_threshold) & _static_mask(rgb, nxt[0], motion_threshold)
+    return np.where(static, _median3(prev[1], alpha, nxt[1]), alpha)
+
+
+def smooth_alpha_sequence(frames, motion_threshold=TEMPORAL_MOTION_THRESHOLD):
+    """
+    时间平滑: 对按顺序排列的 (rgb, alpha) 帧逐帧输出平滑后的 alpha
+
+    只在前后帧颜色几乎不变的静止像素上取三帧 alpha 中值，
+    因此抑制的是背景附近的抠图闪烁，运动中的前景不会被抹掉。
+    输入帧会被复制，调用方可以在拿到结果后直接覆盖原 alpha。
+    """
+    window = []
+    for rgb, alpha in frames:
+        window.append((np.array(rgb[:, :, :3]), np.array(alpha)))
+        if len(window) == 3:
+            yield _smooth_frame(window[0], window[1], window[2], motion_threshold)
+            window.pop(0)
+        elif len(window) == 2:
+            yield _smooth_frame(None, window[0], window[1], motion_threshold)
+    if len(window) == 2:
+        yield _smooth_frame(window[0], window[1], None, motion_threshold)
+    elif len(window) == 1:
+        yield window[0][1]
+
+
+def apply_alpha(rgb, alpha):
+    """合并 RGB 与 alpha 为 (H, W, 4) uint8 数组"""
+    h, w = alpha.shape
+    rgba = np.empty((h, w, 4), dtype=np.uint8)
+    rgba[:, :, :3] = rgb[:, :, :3]
+    rgba[:, :, 3] = alpha
+    return rgba
+
+
+_local = threading.local()
+
+
+def get_engine():
+    """当前线程的共享引擎实例 (线程之间不共享 scratch 缓冲区)"""
+    engine = getattr(_local, "engine", None)
+    if engine is None:
+        engine = MattingEngine()
+        _local.engine = engine
+    return engine
@@ -11,10 +11,24 @@
 """
 
 import os
+import shutil
 import sys
 import numpy as np
 from PIL import Image
-from multiprocessing import Pool, cpu_count
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import cpu_count, shared_memory
+
+try:
+    from lib.matting import (
+        TILED_MIN_PIXELS, apply_alpha, black_border_size, estimate_clip_background, get_engine, sample_indices,
+        smooth_alpha_sequence,
+    )
+except ImportError:
+    # 直接运行脚本时使用同目录导入
+    from matting import (
+        TILED_MIN_PIXELS, apply_alpha, black_border_size, estimate_clip_background, get_engine, sample_indices,
+        smooth_alpha_sequence,
+    )
 
 def detect_background_color(image):
     """
@@ -81,7 +95,7 @@ def detect_and_remove_black_borders(image, black_threshold=30):
     h, w = img_array.shape[:2]
     
     # 检查是否是1280x720尺寸 (允许小幅度误差)
-    if not (1270 <= w <= 1290 and 710 <= h <= 770):
+    if not black_border_size(w, h):
         print(f"图片尺寸 {w}x{h} 不在目标范围内，跳过黑边检测")
         return image
     
@@ -130,70 +144,51 @@ def remove_background(image, bg_color, tolerance=30):
     返回:
         带透明通道的PIL Image对象
     """
-    img_array = np.array(image.convert('RGB')).astype(np.float32)
+    img_array = np.asarray(image.convert('RGB'))
     h, w = img_array.shape[:2]
-    
-    # 创建alpha通道
-    alpha = np.ones((h, w), dtype=np.uint8) * 255
+    engine = get_engine()
     
     # 检测是否为白色背景
     white_bg = is_white_background(bg_color)
     
+    if h * w >= TILED_MIN_PIXELS:
+        # 大图: 只处理粗略前景框内的部分并分块，边缘精细化在块内完成
+        print(f"大图 {w}x{h}，分块移除背景 (容差: {tolerance})...")
+        alpha = engine.matte(img_array, "white", bg_color=bg_color, tolerance=tolerance)
+        removed_count = int(np.count_nonzero(alpha == 0))
+        print(f"✓ 移除背景像素: {removed_count} ({removed_count/(h*w)*100:.1f}%)")
+        return Image.fromarray(apply_alpha(img_array, alpha), 'RGBA')
+    
     if white_bg:
         print(f"检测到白色背景，使用优化算法 (容差: {tolerance})...")
         
-        # 白色背景优化策略:
-        # 1. 计算像素亮度 (V 值)
-        # 2. 计算像素饱和度 (S 值) - 白色背景饱和度低
-        # 3. 综合判断
-        
-        # 计算亮度 (取最大RGB值作为V)
-        brightness = np.max(img_array, axis=2)
-        
-        # 计算饱和度: S = (max - min) / max
-        max_rgb = np.max(img_array, axis=2)
-        min_rgb = np.min(img_array, axis=2)
-        # 避免除零
-        saturation = np.where(max_rgb > 0, (max_rgb - min_rgb) / max_rgb, 0)
-        
-        # 白色背景特征: 高亮度 + 低饱和度
-        # 容差越大，允许的饱和度越高
-        brightness_threshold = 255 - tolerance  # 容差30 -> 亮度阈值225
-        saturation_threshold = tolerance / 255.0 * 1.5  # 容差30 -> 饱和度阈值约0.18
-        
-        # 背景掩码: 高亮度且低饱和度
-        mask = (brightness >= brightness_threshold) & (saturation <= saturation_threshold)
-        
-        # 边缘优化: 使用颜色距离作为补充判断
-        bg_array = np.array(bg_color, dtype=np.float32)
-        distances = np.sqrt(np.sum((img_array - bg_array) ** 2, axis=2))
-        color_mask = distances <= tolerance * 1.5
-        
-        # 合并两种掩码 (取并集，确保白色区域都被移除)
-        mask = mask | color_mask
-        
+        # 白色背景特征: 高亮度 + 低饱和度，并上颜色距离 <= 容差*1.5
+        # (整数域平方距离比较，见 lib/matting.py)
+        mask = engine.white_key_mask(img_array, bg_color, tolerance)
     else:
         print(f"开始移除背景 (容差: {tolerance})...")
         # 非白色背景: 使用传统颜色距离方法
-        bg_array = np.array(bg_color, dtype=np.float32)
-        distances = np.sqrt(np.sum((img_array - bg_array) ** 2, axis=2))
-        mask = distances <= tolerance
+        mask = engine.color_key_mask(img_array, bg_color, tolerance, inclusive=True)
     
     # 标记背景像素为透明
-    alpha[mask] = 0
+    alpha = np.where(mask, 0, 255).astype(np.uint8)
     
-    removed_count = np.sum(mask)
+    removed_count = np.count_nonzero(mask)
     print(f"✓ 移除背景像素: {removed_count} ({removed_count/(h*w)*100:.1f}%)")
     
-    # 合并RGB和Alpha
-    result = np.dstack((img_array.astype(np.uint8), alpha))
-    result_image = Image.fromarray(result, 'RGBA')
-    
     # 对白色背景应用边缘羽化，消除白边
     if white_bg:
-        result_image = refine_edges(result_image, bg_color, feather_radius=1)
+        _refine_alpha(engine, img_array, alpha, bg_color, feather_radius=1)
     
-    return result_image
+    return Image.fromarray(apply_alpha(img_array, alpha), 'RGBA')
+
+
+def _refine_alpha(engine, rgb, alpha, bg_color, feather_radius=1):
+    adjusted_count = engine.refine_edges(rgb, alpha, bg_color, feather_radius=feather_radius)
+    if adjusted_count < 0:
+        print("⚠ scipy未安装，跳过边缘精细化")
+    elif adjusted_count > 0:
+        print(f"  边缘精细化: 调整了 {adjusted_count} 个边缘像素")
 
 
 def refine_edges(image, bg_color, feather_radius=1):
@@ -208,46 +203,11 @@ def refine_edges(image, bg_color, feather_radius=1):
     返回:
         处理后的PIL Image对象
     """
-    try:
-        from scipy import ndimage
-    except ImportError:
-        print("⚠ scipy未安装，跳过边缘精细化")
-        return image
-    
     img_array = np.array(image)
-    alpha = img_array[:, :, 3].astype(np.float32)
-    rgb = img_array[:, :, :3].astype(np.float32)
-    
-    # 找到边缘像素 (alpha从0到255的过渡区)
-    # 膨胀操作找到边缘外围
-    alpha_binary = alpha > 0
-    dilated = ndimage.binary_dilation(alpha_binary, iterations=feather_radius + 1)
-    eroded = ndimage.binary_erosion(alpha_binary, iterations=max(1, feather_radius))
-    edge_mask = dilated & ~eroded
-    
-    # 对边缘像素检查是否接近背景色 (向量化)
-    bg_array = np.array(bg_color, dtype=np.float32)
-    
-    # 计算所有像素与背景色的距离
-    distances = np.sqrt(np.sum((rgb - bg_array) ** 2, axis=2))
-    
-    # 对边缘区域中接近背景色的像素调整透明度
-    # 距离阈值: 越接近背景色，透明度越低
-    edge_threshold = 60
-    adjustment_mask = edge_mask & (alpha > 0) & (distances < edge_threshold)
-    
-    # 根据距离计算新的透明度
-    # 距离为0时透明度为0，距离为threshold时保持原透明度
-    alpha_factor = np.clip(distances / edge_threshold, 0, 1)
-    alpha[adjustment_mask] = alpha[adjustment_mask] * alpha_factor[adjustment_mask]
-    
-    adjusted_count = np.sum(adjustment_mask)
-    if adjusted_count > 0:
-        print(f"  边缘精细化: 调整了 {adjusted_count} 个边缘像素")
-    
-    # 合并结果
-    result = np.dstack((rgb.astype(np.uint8), alpha.astype(np.uint8)))
-    return Image.fromarray(result, 'RGBA')
+    rgb = img_array[:, :, :3]
+    alpha = np.ascontiguousarray(img_array[:, :, 3])
+    _refine_alpha(get_engine(), rgb, alpha, bg_color, feather_radius)
+    return Image.fromarray(apply_alpha(rgb, alpha), 'RGBA')
 
 def auto_crop_transparent(image, padding=0):
     """
@@ -313,22 +273,20 @@ def normalize_width(images, target_width=None):
     
     print(f"统一宽度至: {target_width}px")
     
-    normalized = []
-    for img in images:
-        if img.width < target_width:
-            # 需要扩展宽度，居中放置
-            new_height = img.height
-            new_img = Image.new('RGBA', (target_width, new_height), (0, 0, 0, 0))
-            
-            # 计算居中位置
-            x_offset = (target_width - img.width) // 2
-            new_img.paste(img, (x_offset, 0), img if img.mode == 'RGBA' else None)
-            
-            normalized.append(new_img)
-        else:
-            normalized.append(img)
-    
-    return normalized
+    return [pad_to_width(img, target_width) for img in images]
+
+def pad_to_width(img, target_width):
+    """把图片左右补透明像素到 target_width，居中放置；已够宽的图片原样返回"""
+    if img.width >= target_width:
+        return img
+    
+    new_img = Image.new('RGBA', (target_width, img.height), (0, 0, 0, 0))
+    
+    # 计算居中位置
+    x_offset = (target_width - img.width) // 2
+    new_img.paste(img, (x_offset, 0), img if img.mode == 'RGBA' else None)
+    
+    return new_img
 
 def process_image(input_path, output_path=None, tolerance=30, auto_crop=True, crop_padding=0):
     """
@@ -373,29 +331,215 @@ def process_image(input_path, output_path=None, tolerance=30, auto_crop=True, cr
     
     return output_path
 
-def process_single_image_wrapper(args):
+def _matte_to_shared(args):
     """
-    包装函数用于多进程处理
+    第一阶段 (工作进程): 黑边检测 + 去背景 + 裁剪，结果写入共享内存
     
     参数:
-        args: (input_path, output_path, tolerance, auto_crop, crop_padding) 元组
+        args: (input_path, shm_name, tolerance, auto_crop, crop_padding, clip) 元组
+            shm_name 是主进程按原图尺寸分配的共享内存；
+            clip 为片段背景模型 (ClipBackground) 时跳过逐帧的黑边/背景色检测，
+            只做抠图；裁剪留到时间平滑之后由主进程决定
     
     返回:
-        (filename, success, error_msg)
+        (filename, (width, height), error_msg)
+        像素以 RGBA 行优先存放在 shm_name 的开头
     """
-    input_path, output_path, tolerance, auto_crop, crop_padding = args
+    input_path, shm_name, tolerance, auto_crop, crop_padding, clip = args
     filename = os.path.basename(input_path)
     
     try:
-        process_image(input_path, output_path, tolerance, auto_crop, crop_padding)
+        if clip is not None:
+            rgb = np.asarray(Image.open(input_path).convert('RGB'))
+            rgb, alpha = get_engine().matte_clip(rgb, clip, "white", tolerance=tolerance)
+            return (filename, _to_shared(apply_alpha(rgb, alpha), shm_name), None)
+        
+        image = Image.open(input_path)
+        
+        # 1. 先检测并移除黑边 (针对1280x720尺寸)
+        image = detect_and_remove_black_borders(image)
+        
+        # 2. 检测背景色
+        bg_color = detect_background_color(image)
+        
+        # 3. 移除背景
+        result = remove_background(image, bg_color, tolerance)
+        
+        # 4. 自动裁剪透明边缘
+        if auto_crop:
+            result = auto_crop_transparent(result, padding=crop_padding)
+        
+        return (filename, _to_shared(np.asarray(result.convert('RGBA')), shm_name), None)
+    except Exception as e:
+        return (filename, None, str(e))
+
+def _allocate_shared(input_path):
+    """
+    主进程按图片头部尺寸分配 W*H*4 字节的共享内存 (只读文件头，不解码像素)
+    
+    去黑边、抠图和裁剪都不会让帧变大，所以这块内存一定放得下处理结果。
+    共享内存由主进程持有，工作进程只是附加写入，退出时不会把它释放掉。
+    """
+    with Image.open(input_path) as image:
+        width, height = image.size
+    return shared_memory.SharedMemory(create=True, size=max(1, width * height * 4))
+
+def _to_shared(pixels, shm_name):
+    """把 (H, W, 4) 像素写入主进程分配的共享内存，返回 (width, height)"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        if pixels.nbytes > shm.size:
+            raise ValueError(f"处理结果 {pixels.shape[1]}x{pixels.shape[0]} 超出共享内存大小 {shm.size}")
+        np.ndarray(pixels.shape, dtype=np.uint8, buffer=shm.buf)[:] = pixels
+    finally:
+        shm.close()
+    return (pixels.shape[1], pixels.shape[0])
+
+def _save_from_shared(args):
+    """
+    第二阶段 (工作进程): 从共享内存读回帧，补齐到统一宽度并保存
+    
+    参数:
+        args: (shm_name, (width, height), box, target_width, output_path) 元组
+            box 为 (left, top, right, bottom) 时先按它裁剪
+    
+    返回:
+        (filename, success, error_msg)
+    """
+    shm_name, (width, height), box, target_width, output_path = args
+    filename = os.path.basename(output_path)
+    
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            view = np.ndarray((height, width, 4), dtype=np.uint8, buffer=shm.buf[:width * height * 4])
+            if box is not None:
+                left, top, right, bottom = box
+                view = view[top:bottom, left:right]
+            image = Image.fromarray(view.copy(), 'RGBA')
+            del view
+        finally:
+            shm.close()
+        pad_to_width(image, target_width).save(output_path)
         return (filename, True, None)
     except Exception as e:
         return (filename, False, str(e))
 
-def process_directory(input_dir, output_dir=None, tolerance=30, num_workers=None, auto_crop=True, crop_padding=0):
+def _alpha_bbox(alpha, padding=0):
+    """非透明像素的边界框 (left, top, right, bottom)，与 auto_crop_transparent 一致；全透明返回 None"""
+    rows = np.flatnonzero(alpha.any(axis=1))
+    if len(rows) == 0:
+        return None
+    cols = np.flatnonzero(alpha.any(axis=0))
+    h, w = alpha.shape
+    return (
+        max(0, int(cols[0]) - padding),
+        max(0, int(rows[0]) - padding),
+        min(w, int(cols[-1]) + 1 + padding),
+        min(h, int(rows[-1]) + 1 + padding),
+    )
+
+def _estimate_clip(input_dir, image_files, tolerance):
+    """从目录中均匀抽样的帧估计片段背景模型；帧尺寸不一致时返回 None"""
+    samples = []
+    for i in sample_indices(len(image_files)):
+        try:
+            samples.append(np.asarray(Image.open(os.path.join(input_dir, image_files[i])).convert('RGB')))
+        except Exception as e:
+            print(f"⚠ 抽样帧读取失败 {image_files[i]}: {e}")
+    if not samples:
+        return None
+    if len({sample.shape for sample in samples}) > 1:
+        print("⚠ 帧尺寸不一致，不使用片段背景模型")
+        return None
+    return estimate_clip_background(samples, tolerance=tolerance)
+
+def _smooth_shared(blocks, processed, auto_crop, crop_padding):
+    """
+    按文件名顺序对共享内存中的帧做时间平滑 (原地写回 alpha)，并计算裁剪框
+    
+    参数:
+        blocks: {filename: SharedMemory}，主进程持有的共享内存
+        processed: {filename: (width, height)}
+    
+    返回:
+        {filename: box}，box 为 None 表示不裁剪
+    """
+    names = sorted(processed)
+    views = []
+    try:
+        for name in names:
+            width, height = processed[name]
+            views.append(np.ndarray((height, width, 4), dtype=np.uint8, buffer=blocks[name].buf[:width * height * 4]))
+        boxes = {}
+        frames = ((view[:, :, :3], view[:, :, 3]) for view in views)
+        for name, view, alpha in zip(names, views, smooth_alpha_sequence(frames)):
+            view[:, :, 3] = alpha
+            boxes[name] = _alpha_bbox(alpha, crop_padding) if auto_crop else None
+        return boxes
+    finally:
+        # 主进程之后还要 close 这些共享内存，出错时也不能留下指向它们的视图
+        views.clear()
+        frames = view = alpha = None
+
+def _run_tasks(func, tasks, num_workers, name_of):
+    """
+    按完成顺序产出 func(task) 的结果；单进程时直接在当前进程执行
+    
+    func 自己捕获处理异常，但工作进程崩溃 (BrokenProcessPool) 等异常只会在 submit 或
+    future.result() 抛出；这些异常按任务产出 (name_of(task), None, 错误信息)，不会中断其余任务的结果收集。
+    """
+    if num_workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield func(task)
+        return
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = {}
+        for task in tasks:
+            try:
+                futures[executor.submit(func, task)] = task
+            except Exception as e:
+                yield (name_of(task), None, f"{type(e).__name__}: {e}")
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                yield (name_of(futures[future]), None, f"{type(e).__name__}: {e}")
+
+def _check_shared_capacity(blocks):
+    """
+    确认共享内存所在的 tmpfs 放得下所有帧；放不下时抛出 MemoryError
+    
+    Linux 上 SharedMemory 位于 /dev/shm，tmpfs 满了以后写入会触发 SIGBUS 直接杀死进程，
+    所以在开始处理前检查，而不是等到写到一半。其他平台不检查。
+    """
+    if not os.path.isdir('/dev/shm'):
+        return
+    total = sum(shm.size for shm in blocks.values())
+    free = shutil.disk_usage('/dev/shm').free
+    if total > free:
+        raise MemoryError(
+            f"{len(blocks)} 帧需要 {total / 1024**2:.0f} MiB 共享内存，/dev/shm 只剩 {free / 1024**2:.0f} MiB；"
+            f"请调大 /dev/shm (例如 docker --shm-size) 或分批处理目录"
+        )
+
+def process_directory(input_dir, output_dir=None, tolerance=30, num_workers=None, auto_crop=True, crop_padding=0,
+                      clip_model=False):
     """
     批量处理目录中的所有图片（多核心并行）
     
+    分两个阶段并行:
+        1. 工作进程完成黑边检测、去背景和裁剪，帧像素写入主进程预先分配的共享内存
+           (不 pickle PIL 图片)；共享内存在第二阶段结束后由主进程统一释放
+        2. 主进程根据所有帧的宽度确定统一宽度，工作进程补齐宽度并保存
+    
+    统一宽度和时间平滑都需要整段帧，所以所有帧同时驻留在共享内存中，共需
+    帧数 x W x H x 4 字节。Linux 上这部分内存来自 /dev/shm (容器默认只有 64 MiB)，
+    开始处理前会检查剩余空间，不够时抛出 MemoryError；长片段请调大 /dev/shm 或分目录处理。
+    
+    clip_model=True 时把目录视为同一段视频的帧: 先从抽样帧估计一次背景模型
+    (黑边、背景色、渐变)，工作进程只做抠图；主进程按帧顺序做时间平滑后再裁剪。
+    
     参数:
         input_dir: 输入目录
         output_dir: 输出目录（如果为None，创建 *_nobg 目录）
@@ -403,6 +547,10 @@ def process_directory(input_dir, output_dir=None, tolerance=30, num_workers=None
         num_workers: 工作进程数（默认为CPU核心数）
         auto_crop: 是否自动裁剪透明边缘
         crop_padding: 裁剪时保留的边距
+        clip_model: 是否使用片段背景模型和时间平滑
+    
+    返回:
+        {'succeeded': [文件名...], 'failed': {文件名: 错误信息}}
     """
     if not os.path.exists(input_dir):
         raise FileNotFoundError(f"找不到目录: {input_dir}")
@@ -417,77 +565,103 @@ def process_directory(input_dir, output_dir=None, tolerance=30, num_workers=None
     image_exts = {'.png', '.jpg', '.jpeg', '.bmp', '.webp'}
     
     # 获取所有图片文件
-    image_files = [f for f in os.listdir(input_dir) 
-                   if os.path.splitext(f)[1].lower() in image_exts]
+    image_files = sorted(f for f in os.listdir(input_dir)
+                         if os.path.splitext(f)[1].lower() in image_exts)
     
     if not image_files:
         print(f" 在 {input_dir} 中没有找到图片文件")
-        return
+        return {'succeeded': [], 'failed': {}}
     
     # 确定工作进程数
     if num_workers is None:
         num_workers = cpu_count()
+    num_workers = max(1, min(num_workers, len(image_files)))
     
     print(f"找到 {len(image_files)} 个图片文件")
     print(f"输出目录: {output_dir}")
     print(f"自动裁剪: {'开启' if auto_crop else '关闭'}")
     print(f"使用 {num_workers} 个进程并行处理\n")
     
-    # 第一步: 处理所有图片（黑边检测 + 去背景 + 裁剪）
-    processed_images = []
-    image_filenames = []
-    
-    for filename in image_files:
-        input_path = os.path.join(input_dir, filename)
-        try:
-            print(f"处理: {filename}")
-            image = Image.open(input_path)
-            
-            # 1. 先检测并移除黑边 (针对1280x720尺寸)
-            image = detect_and_remove_black_borders(image)
-            
-            # 2. 检测背景色
-            bg_color = detect_background_color(image)
-            
-            # 3. 移除背景
-            result = remove_background(image, bg_color, tolerance)
-            
-            # 4. 自动裁剪透明边缘
-            if auto_crop:
-                result = auto_crop_transparent(result, padding=crop_padding)
-            
-            processed_images.append(result)
-            image_filenames.append(filename)
-            
-        except Exception as e:
-            print(f" 处理失败 {filename}: {e}")
-    
-    if not processed_images:
-        print(" 没有成功处理的图片")
-        return
+    clip = None
+    if clip_model and len(image_files) > 1:
+        clip = _estimate_clip(input_dir, image_files, tolerance)
+        if clip is not None:
+            print(f"片段背景模型: {clip.describe()}\n")
     
-    # 第二步: 统一宽度
-    print(f"\n统一所有图片宽度...")
-    normalized_images = normalize_width(processed_images)
-    
-    # 第三步: 保存结果
-    print(f"\n保存处理后的图片...")
-    success_count = 0
-    fail_count = 0
-    
-    for filename, image in zip(image_filenames, normalized_images):
-        try:
-            output_path = os.path.join(output_dir, filename)
-            image.save(output_path)
-            print(f"✓ 已保存: {filename}")
-            success_count += 1
-        except Exception as e:
-            print(f" 保存失败 {filename}: {e}")
-            fail_count += 1
+    failed = {}
+    succeeded = []
+    blocks = {}
+    processed = {}
+    boxes = {}
     
+    try:
+        # 共享内存由主进程分配和持有，工作进程退出不会影响它们
+        for f in image_files:
+            try:
+                blocks[f] = _allocate_shared(os.path.join(input_dir, f))
+            except Exception as e:
+                print(f" 处理失败 {f}: {e}")
+                failed[f] = str(e)
+        _check_shared_capacity(blocks)
+        
+        # 第一步: 并行处理所有图片（黑边检测 + 去背景 + 裁剪；片段模式只抠图）
+        tasks = [
+            (os.path.join(input_dir, f), shm.name, tolerance, auto_crop, crop_padding, clip)
+            for f, shm in blocks.items()
+        ]
+        for filename, size, error in _run_tasks(_matte_to_shared, tasks, num_workers, lambda task: os.path.basename(task[0])):
+            if error is not None:
+                print(f" 处理失败 {filename}: {error}")
+                failed[filename] = error
+            else:
+                print(f"✓ 已处理: {filename} {size}")
+                processed[filename] = size
+        
+        if not processed:
+            print(" 没有成功处理的图片")
+            return {'succeeded': succeeded, 'failed': failed}
+        
+        # 片段模式: 时间平滑抑制闪烁，平滑之后再计算裁剪框
+        if clip is not None:
+            print(f"\n时间平滑 {len(processed)} 帧...")
+            boxes = _smooth_shared(blocks, processed, auto_crop, crop_padding)
+        
+        # 第二步: 统一宽度 (只需要尺寸，不读回像素)
+        widths = []
+        for filename, size in processed.items():
+            box = boxes.get(filename)
+            widths.append(box[2] - box[0] if box is not None else size[0])
+        target_width = max(widths)
+        print(f"\n统一所有图片宽度...")
+        print(f"统一宽度至: {target_width}px")
+        
+        # 第三步: 并行补齐宽度并保存结果
+        print(f"\n保存处理后的图片...")
+        tasks = [
+            (blocks[filename].name, size, boxes.get(filename), target_width, os.path.join(output_dir, filename))
+            for filename, size in sorted(processed.items())
+        ]
+        for filename, success, error in _run_tasks(_save_from_shared, tasks, num_workers, lambda task: os.path.basename(task[4])):
+            if success:
+                print(f"✓ 已保存: {filename}")
+                succeeded.append(filename)
+            else:
+                print(f" 保存失败 {filename}: {error}")
+                failed[filename] = error
+    finally:
+        for shm in blocks.values():
+            shm.close()
+            shm.unlink()
+    
+    success_count = len(succeeded)
+    fail_count = len(failed)
     print(f"\n{'='*60}")
     print(f"批量处理完成!")
     print(f"  - 成功: {success_count}")
     print(f"  - 失败: {fail_count}")
     print(f"  - 输出目录: {output_dir}")
+    for filename, error in sorted(failed.items()):
+        print(f"  ✗ {filename}: {error}")
     print(f"{'='*60}")
+    
+    return {'succeeded': sorted(succeeded), 'failed': failed}
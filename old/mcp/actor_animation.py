@@ -738,7 +738,8 @@ ANIMATION STYLE:
                     remove_bg=self.config.remove_background,
                     bg_method=bg_method,
                     bg_tolerance=self.config.bg_tolerance,
-                    bg_edge_shrink=self.config.bg_edge_shrink
+                    bg_edge_shrink=self.config.bg_edge_shrink,
+                    clip_model=True  # 同一视角的帧来自同一段视频
                 )
                 
                 results["frames"][view_name] = saved_paths
@@ -6,11 +6,18 @@ Video Frame Extractor (MCP Standalone)
 """
 
 import os
+import sys
 import cv2
 import numpy as np
 from typing import List, Optional, Tuple
 from PIL import Image
-from scipy import ndimage
+
+try:
+    from lib.matting import apply_alpha, estimate_clip_background, get_engine, sample_indices, smooth_alpha_sequence
+except ImportError:
+    # 独立运行时把 old/ 根目录加入路径，与 lib/remove_background 共用抠图引擎
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from lib.matting import apply_alpha, estimate_clip_background, get_engine, sample_indices, smooth_alpha_sequence
 
 
 def detect_background_color(image: Image.Image, border_skip: int = 20) -> Tuple[int, int, int]:
@@ -76,82 +83,24 @@ def remove_background_smart(
         image = image.convert('RGBA')
     
     img_array = np.array(image)
-    h, w = img_array.shape[:2]
     
     # 智能检测背景色
     bg_color = detect_background_color(image, border_skip)
     print(f"[SmartBG] Detected background color: RGB{bg_color}")
     
-    # 提取 RGB 通道
-    rgb = img_array[:, :, :3].astype(np.int32)
-    bg = np.array(bg_color, dtype=np.int32)
-    gray = rgb.mean(axis=2)
-    
-    # 计算颜色差异
-    diff = np.sqrt(np.sum((rgb - bg) ** 2, axis=2))
-    
-    # 创建背景掩码 - 使用基础容差
-    bg_mask = (diff < tolerance).astype(np.uint8)
-    
     # 判断背景是否为浅色（白色/灰色）
-    # 只有浅色背景才需要检测暗边框
+    # 只有浅色背景才需要检测暗边框（视频边缘可能有黑色边框）
     bg_brightness = sum(bg_color) / 3
-    is_light_background = bg_brightness > 200  # 背景亮度 > 200 才算浅色
-    
-    if is_light_background:
-        # 浅色背景：同时检测暗边框（视频边缘可能有黑色边框）
-        dark_mask = (gray < 40).astype(np.uint8)  # 非常暗的区域
-        combined_bg_mask = np.maximum(bg_mask, dark_mask)
+    if bg_brightness > 200:
         print(f"[SmartBG] Light background detected, enabling dark border detection")
     else:
-        # 彩色背景（如绿幕）：只用颜色匹配，不检测暗色
-        combined_bg_mask = bg_mask
         print(f"[SmartBG] Colored background detected, using color match only")
     
-    # 使用形态学膨胀连接断开的背景区域
-    kernel = np.ones((3, 3), np.uint8)  # 减小kernel避免过度膨胀
-    dilated_mask = cv2.dilate(combined_bg_mask, kernel, iterations=1)
-    
-    # 使用连通区域分析
-    labeled, num_features = ndimage.label(dilated_mask)
-    
-    # 找到与边缘连通的标签（包括外边缘和内边缘）
-    edge_labels = set()
-    # 外边缘
-    edge_labels.update(labeled[0, :].flatten())
-    edge_labels.update(labeled[h-1, :].flatten())
-    edge_labels.update(labeled[:, 0].flatten())
-    edge_labels.update(labeled[:, w-1].flatten())
-    # 内边缘（跳过暗边框）
-    inner = border_skip
-    if inner < h - inner and inner < w - inner:
-        edge_labels.update(labeled[inner, inner:w-inner].flatten())
-        edge_labels.update(labeled[h-1-inner, inner:w-inner].flatten())
-        edge_labels.update(labeled[inner:h-inner, inner].flatten())
-        edge_labels.update(labeled[inner:h-inner, w-1-inner].flatten())
-    edge_labels.discard(0)
-    
-    # 创建膨胀后的连通区域掩码
-    dilated_edge_mask = np.zeros((h, w), dtype=np.uint8)
-    for label in edge_labels:
-        dilated_edge_mask[labeled == label] = 1
-    
-    # 只保留原始掩码中与边缘连通的部分
-    final_bg_mask = combined_bg_mask & dilated_edge_mask
-    
-    # 边缘内缩（腐蚀前景）
-    if edge_shrink > 0:
-        foreground = (1 - final_bg_mask).astype(np.uint8)
-        kernel = np.ones((edge_shrink * 2 + 1, edge_shrink * 2 + 1), np.uint8)
-        foreground_eroded = cv2.erode(foreground, kernel, iterations=1)
-        final_bg_mask = 1 - foreground_eroded
-    
-    # 边缘平滑
-    foreground = (1 - final_bg_mask).astype(np.uint8) * 255
-    foreground = cv2.GaussianBlur(foreground, (3, 3), 0)
-    
-    # 创建 alpha 通道
-    alpha = foreground.astype(np.uint8)
+    # 颜色匹配 + 边缘连通 (含内边框) + 内缩 + 平滑，见 lib/matting.py 的 smart 策略
+    alpha = get_engine().matte(
+        img_array, "smart", bg_color=bg_color,
+        tolerance=tolerance, edge_shrink=edge_shrink, border_skip=border_skip,
+    )
     img_array[:, :, 3] = alpha
     
     # 统计
@@ -187,69 +136,12 @@ def remove_background_floodfill(
         image = image.convert('RGBA')
     
     img_array = np.array(image)
-    h, w = img_array.shape[:2]
-    
-    # 提取 RGB 通道
-    rgb = img_array[:, :, :3].astype(np.int32)
-    
-    # 计算每个像素与背景色的差异
-    bg = np.array(bg_color, dtype=np.int32)
-    diff = np.sqrt(np.sum((rgb - bg) ** 2, axis=2))
-    
-    # 创建背景掩码（接近背景色的像素）
-    bg_mask = (diff < tolerance).astype(np.uint8)
-    
-    # 创建边缘种子掩码（从图像边缘开始 flood fill）
-    seed_mask = np.zeros((h, w), dtype=np.uint8)
-    
-    # 设置四条边为种子点
-    seed_mask[0, :] = 1      # 上边
-    seed_mask[h-1, :] = 1    # 下边
-    seed_mask[:, 0] = 1      # 左边
-    seed_mask[:, w-1] = 1    # 右边
-    
-    # 只保留边缘上属于背景的种子点
-    seed_mask = seed_mask & bg_mask
-    
-    # 使用 flood fill 找到从边缘连通的所有背景区域
-    # 这样角色内部的白色不会被移除
-    labeled, num_features = ndimage.label(bg_mask)
-    
-    # 找到与边缘连通的标签
-    edge_labels = set()
-    edge_labels.update(labeled[0, :].flatten())      # 上边
-    edge_labels.update(labeled[h-1, :].flatten())    # 下边
-    edge_labels.update(labeled[:, 0].flatten())      # 左边
-    edge_labels.update(labeled[:, w-1].flatten())    # 右边
-    edge_labels.discard(0)  # 移除非背景标签
-    
-    # 创建最终的背景掩码（只包含与边缘连通的背景区域）
-    final_bg_mask = np.zeros((h, w), dtype=np.uint8)
-    for label in edge_labels:
-        final_bg_mask[labeled == label] = 1
-    
-    # 边缘内缩处理（腐蚀操作去除边框）
-    if edge_shrink > 0:
-        # 对前景区域（非背景）进行腐蚀，相当于内缩
-        foreground = (1 - final_bg_mask).astype(np.uint8)
-        kernel = np.ones((edge_shrink * 2 + 1, edge_shrink * 2 + 1), np.uint8)
-        foreground_eroded = cv2.erode(foreground, kernel, iterations=1)
-        
-        # 更新背景掩码
-        final_bg_mask = 1 - foreground_eroded
-    
-    # 边缘平滑处理
-    if edge_smooth > 0:
-        kernel_size = edge_smooth * 2 + 1
-        kernel = np.ones((kernel_size, kernel_size), np.uint8)
-        # 对前景进行形态学闭操作，平滑边缘
-        foreground = (1 - final_bg_mask).astype(np.uint8) * 255
-        foreground = cv2.morphologyEx(foreground, cv2.MORPH_CLOSE, kernel)
-        foreground = cv2.GaussianBlur(foreground, (3, 3), 0)
-        final_bg_mask = (foreground < 128).astype(np.uint8)
-    
-    # 创建 alpha 通道
-    alpha = ((1 - final_bg_mask) * 255).astype(np.uint8)
+    
+    # 只移除与图像边缘连通的背景区域，角色内部的白色不会被移除
+    alpha = get_engine().matte(
+        img_array, "flood", bg_color=bg_color,
+        tolerance=tolerance, edge_shrink=edge_shrink, edge_smooth=edge_smooth,
+    )
     
     # 合并 alpha 通道
     img_array[:, :, 3] = alpha
@@ -282,28 +174,8 @@ def remove_background(
     # 转为 numpy 数组
     img_array = np.array(image)
     
-    # 提取 RGB 通道
-    rgb = img_array[:, :, :3].astype(np.int32)
-    
-    # 计算与背景色的差异
-    bg = np.array(bg_color, dtype=np.int32)
-    diff = np.sqrt(np.sum((rgb - bg) ** 2, axis=2))
-    
-    # 创建 alpha 通道
-    # 差异小于容差的像素设为透明
-    alpha = np.where(diff < tolerance, 0, 255).astype(np.uint8)
-    
-    # 边缘平滑处理
-    if edge_smooth > 0:
-        # 使用形态学操作平滑边缘
-        kernel_size = edge_smooth * 2 + 1
-        kernel = np.ones((kernel_size, kernel_size), np.uint8)
-        
-        # 先膨胀再腐蚀，去除锯齿
-        alpha = cv2.morphologyEx(alpha, cv2.MORPH_CLOSE, kernel)
-        
-        # 轻微模糊边缘
-        alpha = cv2.GaussianBlur(alpha, (3, 3), 0)
+    # 差异小于容差的像素设为透明，再闭运算 + 轻微模糊平滑边缘
+    alpha = get_engine().matte(img_array, "color", bg_color=bg_color, tolerance=tolerance, edge_smooth=edge_smooth)
     
     # 合并 alpha 通道
     img_array[:, :, 3] = alpha
@@ -342,6 +214,50 @@ def remove_background_advanced(
     return remove_background_smart(image, tolerance, edge_shrink)
 
 
+def remove_background_clip(
+    frames: List[Image.Image],
+    tolerance: int = 50,
+    edge_shrink: int = 3,
+    border_skip: int = 20
+) -> Optional[List[Image.Image]]:
+    """
+    片段级背景移除：同一段视频的所有帧共用一个背景模型
+    
+    背景色（以及渐变）只从抽样帧估计一次，每帧只做抠图；
+    之后对静止区域做时间平滑，抑制帧间背景闪烁。
+    
+    Args:
+        frames: 同一段视频的帧（尺寸一致）
+        tolerance: 颜色容差
+        edge_shrink: 边缘内缩像素数
+        border_skip: 跳过边框像素数（用于检测背景色）
+    
+    Returns:
+        带透明通道的 RGBA 图片列表；帧尺寸不一致时返回 None
+    """
+    rgbs = [np.asarray(frame.convert('RGB')) for frame in frames]
+    if len({rgb.shape for rgb in rgbs}) > 1:
+        print("[ClipBG] Frame sizes differ, falling back to per-frame removal")
+        return None
+    
+    clip = estimate_clip_background(
+        [rgbs[i] for i in sample_indices(len(rgbs))],
+        border_skip=border_skip, tolerance=tolerance, detect_crop=False,
+    )
+    h, w = rgbs[0].shape[:2]
+    background = clip.background(h, w)
+    print(f"[ClipBG] Background model: RGB{clip.bg_color}, gradient: {'yes' if clip.gradient is not None else 'no'}")
+    
+    engine = get_engine()
+    alphas = (
+        engine.matte(rgb, "smart", bg_color=background, tolerance=tolerance,
+                     edge_shrink=edge_shrink, border_skip=border_skip)
+        for rgb in rgbs
+    )
+    smoothed = smooth_alpha_sequence(zip(rgbs, alphas))
+    return [Image.fromarray(apply_alpha(rgb, alpha), 'RGBA') for rgb, alpha in zip(rgbs, smoothed)]
+
+
 def extract_frames_from_video(
     video_path: str,
     start_time: float = 0.0,
@@ -436,7 +352,8 @@ def save_frames(
     remove_bg: bool = False,
     bg_method: str = "white",
     bg_tolerance: int = 30,
-    bg_edge_shrink: int = 5
+    bg_edge_shrink: int = 5,
+    clip_model: bool = False
 ) -> List[str]:
     """
     保存帧到指定目录，可选抠图
@@ -450,6 +367,7 @@ def save_frames(
         bg_method: 背景移除方法 ("white", "green", "auto")
         bg_tolerance: 颜色容差
         bg_edge_shrink: 边缘内缩像素数（去除边框）
+        clip_model: 所有帧共用一个背景模型并做时间平滑（帧来自同一段视频时使用）
     
     Returns:
         保存的文件路径列表
@@ -459,10 +377,18 @@ def save_frames(
     if remove_bg:
         print(f"[FrameExtractor] Background removal enabled (method: {bg_method}, tolerance: {bg_tolerance}, edge_shrink: {bg_edge_shrink})")
     
+    # 片段模式: 一次性抠完所有帧，逐帧路径只在模型不可用时使用
+    per_frame = remove_bg
+    if remove_bg and clip_model and len(frames) > 1:
+        matted = remove_background_clip(frames, tolerance=bg_tolerance, edge_shrink=bg_edge_shrink)
+        if matted is not None:
+            frames = matted
+            per_frame = False
+    
     saved_paths = []
     for i, frame in enumerate(frames):
         # 抠图处理
-        if remove_bg:
+        if per_frame:
             frame = remove_background_advanced(frame, method=bg_method, tolerance=bg_tolerance, edge_shrink=bg_edge_shrink)
         
         filename = f"{prefix}_{start_index + i:04d}.png"
@@ -372,7 +372,8 @@ Effects: NONE
             tolerance=int(tolerance),
             num_workers=None,
             auto_crop=auto_crop,
-            crop_padding=int(crop_padding)
+            crop_padding=int(crop_padding),
+            clip_model=True
         )
         
         nobg_files = sorted([f for f in os.listdir(nobg_dir) if f.endswith('.png')])
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""Build a tiled, multi-resolution world mosaic from generated FMG chunks.
+
+Each chunk owns the part of its rect up to the middle of every overlap with a
+neighbour, so overlaps are resolved the same way on every run. The full
+resolution level is written one tile row at a time, keeping only the chunk
+images that intersect the current row decoded; every coarser level is built
+from 2x2 tiles of the level below. The world canvas is never allocated.
+
+Output:
+
+    <output-dir>/mosaic.json
+    <output-dir>/tiles/<level>/<x>_<y>.<format>
+
+Level 0 is a single tile showing the whole world; the highest level is full
+resolution.
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import json
+import math
+from pathlib import Path
+from typing import Any
+
+from PIL import Image
+
+from fmg_raster import MappedRaster
+
+
+DEFAULT_CHUNK_SIZE = 4096
+MAPPED_RASTER_MIN_PIXELS = DEFAULT_CHUNK_SIZE * DEFAULT_CHUNK_SIZE
+DEFAULT_TILE_SIZE = 512
+LAYER_FILES = {
+    "base": Path("base") / "base-1.png",
+    "preview": Path("layered-preview.png"),
+}
+
+
+def read_json(path: Path) -> dict[str, Any]:
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def write_json(path: Path, data: dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def parse_generated(value: str) -> tuple[str, Path]:
+    if "=" not in value:
+        raise argparse.ArgumentTypeError("Expected CHUNK_ID=IMAGE_PATH")
+    chunk_id, path = value.split("=", 1)
+    chunk_id = chunk_id.strip()
+    if not chunk_id:
+        raise argparse.ArgumentTypeError("Missing CHUNK_ID")
+    return chunk_id, Path(path.strip())
+
+
+def rect_from_chunk(chunk: dict[str, Any]) -> dict[str, float]:
+    origin = chunk.get("sourceOrigin") or chunk.get("origin") or {}
+    size = chunk.get("size") or {}
+    x = float(origin.get("x", 0))
+    y = float(origin.get("y", 0))
+    width = float(size.get("width", DEFAULT_CHUNK_SIZE))
+    height = float(size.get("height", DEFAULT_CHUNK_SIZE))
+    return {"xMin": x, "yMin": y, "xMax": x + width, "yMax": y + height}
+
+
+def find_chunk_images(index: dict[str, Any], root: Path, layer: str) -> dict[str, Path]:
+    """Chunk images under a `generate_fmg_chunk_pipeline.py --all-chunks` output dir."""
+    images: dict[str, Path] = {}
+    for chunk_id in index.get("chunks") or {}:
+        path = root / chunk_id / LAYER_FILES[layer]
+        checkpoint = root / chunk_id / "chunk_checkpoint.json"
+        if layer == "base" and checkpoint.is_file():
+            path = Path(str(read_json(checkpoint).get("base_image") or path))
+        if path.is_file():
+            images[chunk_id] = path
+    return images
+
+
+def _cuts(intervals: list[tuple[float, float]]) -> list[int]:
+    """Boundaries between consecutive intervals, split at the middle of each overlap."""
+    cuts = [int(math.floor(intervals[0][0]))]
+    for (_start, prev_end), (next_start, _end) in zip(intervals, intervals[1:]):
+        cuts.append(int(round((prev_end + next_start) / 2)))
+    cuts.append(int(math.ceil(intervals[-1][1])))
+    return cuts
+
+
+def plan_ownership(chunks: dict[str, Any]) -> dict[str, Any]:
+    """Split the world into non-overlapping core rects, one per chunk of the grid."""
+    rects = {chunk_id: rect_from_chunk(chunk) for chunk_id, chunk in chunks.items() if isinstance(chunk, dict)}
+    xs = sorted({rect["xMin"] for rect in rects.values()})
+    ys = sorted({rect["yMin"] for rect in rects.values()})
+    columns = [
+        (x, max(rect["xMax"] for rect in rects.values() if rect["xMin"] == x)) for x in xs
+    ]
+    rows = [
+        (y, max(rect["yMax"] for rect in rects.values() if rect["yMin"] == y)) for y in ys
+    ]
+    x_cuts = _cuts(columns)
+    y_cuts = _cuts(rows)
+    grid: dict[tuple[int, int], str] = {}
+    cores: dict[str, dict[str, int]] = {}
+    for chunk_id, rect in rects.items():
+        column, row = xs.index(rect["xMin"]), ys.index(rect["yMin"])
+        grid[(column, row)] = chunk_id
+        cores[chunk_id] = {
+            "xMin": x_cuts[column],
+            "yMin": y_cuts[row],
+            "xMax": x_cuts[column + 1],
+            "yMax": y_cuts[row + 1],
+        }
+    return {"rects": rects, "cores": cores, "grid": grid, "x_cuts": x_cuts, "y_cuts": y_cuts}
+
+
+def _span(cuts: list[int], start: int, end: int) -> range:
+    """Indexes of the cut intervals that intersect [start, end)."""
+    first = max(0, bisect.bisect_right(cuts, start) - 1)
+    last = min(len(cuts) - 1, bisect.bisect_left(cuts, end))
+    return range(first, last)
+
+
+class ChunkImages:
+    """Decoded chunk images, kept only while the current tile row still needs them.
+
+    Chunks larger than 4096x4096 are spilled into memory-mapped rasters under
+    `spill_dir` instead of being held decoded.
+    """
+
+    def __init__(self, images: dict[str, Path], rects: dict[str, dict[str, float]], *, spill_dir: Path | None = None) -> None:
+        self.paths = images
+        self.rects = rects
+        self.spill_dir = spill_dir
+        self._open: dict[str, Image.Image | MappedRaster] = {}
+        self.decoded = 0
+
+    def get(self, chunk_id: str) -> Image.Image | MappedRaster:
+        image = self._open.get(chunk_id)
+        if image is None:
+            rect = self.rects[chunk_id]
+            size = (int(round(rect["xMax"] - rect["xMin"])), int(round(rect["yMax"] - rect["yMin"])))
+            if size[0] * size[1] > MAPPED_RASTER_MIN_PIXELS:
+                image = MappedRaster.from_image_file(self.paths[chunk_id], size=size, directory=self.spill_dir)
+            else:
+                # Keep the decoded mode (usually RGB); only the cropped pieces become RGBA.
+                image = Image.open(self.paths[chunk_id])
+                image.load()
+                if image.size != size:
+                    image = image.resize(size, Image.Resampling.LANCZOS)
+            self._open[chunk_id] = image
+            self.decoded += 1
+        return image
+
+    def release_above(self, y: int, cores: dict[str, dict[str, int]]) -> None:
+        for chunk_id in [chunk_id for chunk_id in self._open if cores[chunk_id]["yMax"] <= y]:
+            image = self._open.pop(chunk_id)
+            if isinstance(image, MappedRaster):
+                image.close()
+
+
+def _save_tile(tile: Image.Image, path: Path, image_format: str, quality: int) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if image_format == "webp":
+        tile.save(path, "WEBP", quality=quality, method=4)
+    else:
+        tile.save(path, "PNG", optimize=False)
+
+
+def build_mosaic(
+    index: dict[str, Any],
+    images: dict[str, Path],
+    output_dir: Path,
+    *,
+    tile_size: int = DEFAULT_TILE_SIZE,
+    image_format: str = "png",
+    quality: int = 90,
+    layer: str = "base",
+) -> dict[str, Any]:
+    chunks = index.get("chunks") if isinstance(index.get("chunks"), dict) else {}
+    if not chunks:
+        raise SystemExit("FMG index has no chunks")
+    plan = plan_ownership(chunks)
+    x_cuts, y_cuts = plan["x_cuts"], plan["y_cuts"]
+    origin_x, origin_y = x_cuts[0], y_cuts[0]
+    world_width, world_height = x_cuts[-1] - origin_x, y_cuts[-1] - origin_y
+    max_level = max(0, math.ceil(math.log2(max(world_width, world_height) / tile_size)))
+    extension = "webp" if image_format == "webp" else "png"
+    tiles_root = output_dir / "tiles"
+
+    def tile_path(level: int, x: int, y: int) -> Path:
+        return tiles_root / str(level) / f"{x}_{y}.{extension}"
+
+    # Full resolution: one tile row at a time from the chunks that own it.
+    cache = ChunkImages(images, plan["rects"], spill_dir=output_dir)
+    columns = math.ceil(world_width / tile_size)
+    rows = math.ceil(world_height / tile_size)
+    for ty in range(rows):
+        y0 = origin_y + ty * tile_size
+        y1 = min(origin_y + world_height, y0 + tile_size)
+        cache.release_above(y0, plan["cores"])
+        for tx in range(columns):
+            x0 = origin_x + tx * tile_size
+            x1 = min(origin_x + world_width, x0 + tile_size)
+            tile = Image.new("RGBA", (x1 - x0, y1 - y0), (0, 0, 0, 0))
+            for row in _span(y_cuts, y0, y1):
+                for column in _span(x_cuts, x0, x1):
+                    chunk_id = plan["grid"].get((column, row))
+                    if chunk_id is None or chunk_id not in images:
+                        continue
+                    core = plan["cores"][chunk_id]
+                    rect = plan["rects"][chunk_id]
+                    left, top = max(x0, core["xMin"]), max(y0, core["yMin"])
+                    right, bottom = min(x1, core["xMax"]), min(y1, core["yMax"])
+                    if right <= left or bottom <= top:
+                        continue
+                    box = (
+                        int(left - rect["xMin"]),
+                        int(top - rect["yMin"]),
+                        int(right - rect["xMin"]),
+                        int(bottom - rect["yMin"]),
+                    )
+                    tile.paste(cache.get(chunk_id).crop(box).convert("RGBA"), (left - x0, top - y0))
+            _save_tile(tile, tile_path(max_level, tx, ty), image_format, quality)
+    cache.release_above(origin_y + world_height + 1, plan["cores"])
+
+    # Coarser levels: each tile is 2x2 tiles of the level below, halved.
+    levels = [
+        {
+            "level": max_level,
+            "scale": 1.0,
+            "width": world_width,
+            "height": world_height,
+            "columns": columns,
+            "rows": rows,
+        }
+    ]
+    for level in range(max_level - 1, -1, -1):
+        below = levels[-1]
+        width, height = math.ceil(below["width"] / 2), math.ceil(below["height"] / 2)
+        level_columns, level_rows = math.ceil(width / tile_size), math.ceil(height / tile_size)
+        for ty in range(level_rows):
+            for tx in range(level_columns):
+                canvas = Image.new("RGBA", (tile_size * 2, tile_size * 2), (0, 0, 0, 0))
+                for dy in range(2):
+                    for dx in range(2):
+                        child = tile_path(level + 1, tx * 2 + dx, ty * 2 + dy)
+                        if child.is_file():
+                            with Image.open(child) as image:
+                                canvas.paste(image.convert("RGBA"), (dx * tile_size, dy * tile_size))
+                tile_width = min(tile_size, width - tx * tile_size)
+                tile_height = min(tile_size, height - ty * tile_size)
+                tile = canvas.resize((tile_size, tile_size), Image.Resampling.LANCZOS)
+                _save_tile(tile.crop((0, 0, tile_width, tile_height)), tile_path(level, tx, ty), image_format, quality)
+        levels.append(
+            {
+                "level": level,
+                "scale": below["scale"] / 2,
+                "width": width,
+                "height": height,
+                "columns": level_columns,
+                "rows": level_rows,
+            }
+        )
+
+    manifest = {
+        "version": 1,
+        "kind": "snowweave-world-mosaic",
+        "layer": layer,
+        "tile_size": tile_size,
+        "format": extension,
+        "tile_path": f"tiles/{{level}}/{{x}}_{{y}}.{extension}",
+        "world": {"x": origin_x, "y": origin_y, "width": world_width, "height": world_height},
+        "min_level": 0,
+        "max_level": max_level,
+        "levels": sorted(levels, key=lambda item: item["level"]),
+        "chunks": {
+            chunk_id: {
+                "image": str(images[chunk_id].resolve()) if chunk_id in images else None,
+                "rect": plan["rects"][chunk_id],
+                "owned_rect": plan["cores"][chunk_id],
+            }
+            for chunk_id in plan["cores"]
+        },
+        "missing_chunks": sorted(chunk_id for chunk_id in plan["cores"] if chunk_id not in images),
+        "chunks_decoded": cache.decoded,
+    }
+    write_json(output_dir / "mosaic.json", manifest)
+    return manifest
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", type=Path, required=True)
+    parser.add_argument(
+        "--generated-root",
+        type=Path,
+        help="Output dir of generate_fmg_chunk_pipeline.py --all-chunks (one subdirectory per chunk).",
+    )
+    parser.add_argument("--generated", action="append", type=parse_generated, default=[], help="Chunk image as CHUNK_ID=PATH. Repeatable; overrides --generated-root.")
+    parser.add_argument("--layer", choices=sorted(LAYER_FILES), default="base", help="base-1.png or layered-preview.png.")
+    parser.add_argument("--output-dir", type=Path, required=True)
+    parser.add_argument("--tile-size", type=int, default=DEFAULT_TILE_SIZE)
+    parser.add_argument("--format", choices=["png", "webp"], default="png")
+    parser.add_argument("--quality", type=int, default=90, help="WebP quality.")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    index = read_json(args.index)
+    images = find_chunk_images(index, args.generated_root, args.layer) if args.generated_root else {}
+    images.update(dict(args.generated))
+    if not images:
+        raise SystemExit("No chunk images found; pass --generated-root or --generated.")
+    manifest = build_mosaic(
+        index,
+        images,
+        args.output_dir,
+        tile_size=args.tile_size,
+        image_format=args.format,
+        quality=args.quality,
+        layer=args.layer,
+    )
+    summary = {key: manifest[key] for key in ("world", "max_level", "levels", "missing_chunks", "chunks_decoded")}
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
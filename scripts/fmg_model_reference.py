@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""Cache model-ready copies of FMG reference images.
+
+Image models do not need the raw 4096px (or larger) chunk PNG: every call
+would decode, downscale and re-encode it before upload. This module keeps a
+content-addressed cache of reference images already scaled to the model's
+max edge and encoded as WebP or JPEG, keyed by
+
+    (sha256 of the source PNG, max edge, format, quality)
+
+so repeated runs against the same chunk or stitched reference reuse the
+small file without touching the source pixels.
+
+Layout:
+
+    <cache-root>/<key[:2]>/<key>.webp|jpg
+
+Threads that prepare references concurrently go through `LEASES`, so a prune
+started by one thread never deletes a file another thread is about to send.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import uuid
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+from PIL import Image
+
+import fmg_unpack_atlas_bundle as fmg_unpack
+
+
+DEFAULT_MAX_EDGE = 2048
+DEFAULT_QUALITY = 90
+DEFAULT_FORMAT = "webp"
+DEFAULT_CACHE_MAX_BYTES = 1024**3
+# Longest edge sent to a model, by model-name prefix. Larger inputs are
+# downscaled by the provider anyway, so uploading them only costs time.
+MODEL_MAX_EDGE = {
+    "gemini": 3072,
+}
+FORMATS = {"webp": ("WEBP", "webp"), "jpeg": ("JPEG", "jpg")}
+CACHE_KEY_VERSION = 1
+
+
+def max_edge_for_model(model: str) -> int:
+    for prefix, edge in MODEL_MAX_EDGE.items():
+        if model.lower().startswith(prefix):
+            return edge
+    return DEFAULT_MAX_EDGE
+
+
+def cache_key(source_sha256: str, max_edge: int, image_format: str, quality: int) -> str:
+    encoded = json.dumps(
+        [CACHE_KEY_VERSION, source_sha256, max_edge, image_format, quality], separators=(",", ":")
+    )
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def reference_path(
+    source: Path,
+    cache_root: Path,
+    *,
+    max_edge: int = DEFAULT_MAX_EDGE,
+    image_format: str = DEFAULT_FORMAT,
+    quality: int = DEFAULT_QUALITY,
+) -> Path:
+    """Cache path `prepare_model_reference` uses for `source` with these settings."""
+    if image_format not in FORMATS:
+        raise ValueError(f"Unknown reference format: {image_format}")
+    key = cache_key(fmg_unpack.bundle_sha256(source), max_edge, image_format, quality)
+    return cache_root / key[:2] / f"{key}.{FORMATS[image_format][1]}"
+
+
+def _encode(source: Path, target: Path, *, max_edge: int, image_format: str, quality: int) -> tuple[int, int]:
+    pil_format, _extension = FORMATS[image_format]
+    with Image.open(source) as image:
+        # Pillow shrinks by an integer factor first, then resamples the rest.
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        if image_format == "jpeg":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temp = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            if image_format == "webp":
+                image.save(temp, pil_format, quality=quality, method=4)
+            else:
+                image.save(temp, pil_format, quality=quality, optimize=True)
+            os.replace(temp, target)
+        finally:
+            temp.unlink(missing_ok=True)
+        return image.size
+
+
+def prepare_model_reference(
+    source: Path,
+    cache_root: Path,
+    *,
+    max_edge: int = DEFAULT_MAX_EDGE,
+    image_format: str = DEFAULT_FORMAT,
+    quality: int = DEFAULT_QUALITY,
+) -> dict[str, Any]:
+    """Return a cached model-ready copy of `source`, creating it on first use.
+
+    A hit only hashes the source (memoised by size and mtime) and stats the
+    cached file. Concurrent misses encode independently and the last atomic
+    rename wins; the content is the same either way.
+    """
+    target = reference_path(source, cache_root, max_edge=max_edge, image_format=image_format, quality=quality)
+    source_sha256 = fmg_unpack.bundle_sha256(source)
+    cached = target.is_file()
+    if cached:
+        os.utime(target)
+        with Image.open(target) as image:
+            size = image.size
+    else:
+        size = _encode(source, target, max_edge=max_edge, image_format=image_format, quality=quality)
+    return {
+        "path": str(target.resolve()),
+        "source": str(source.resolve()),
+        "source_sha256": source_sha256,
+        "format": image_format,
+        "quality": quality,
+        "max_edge": max_edge,
+        "size": list(size),
+        "bytes": target.stat().st_size,
+        "cached": cached,
+    }
+
+
+def prune_model_references(cache_root: Path, max_bytes: int, *, keep: Iterable[Path] = ()) -> dict[str, int]:
+    """Evict least recently used cached references until the cache fits `max_bytes`.
+
+    Paths in `keep` are never removed but still count towards the total.
+    """
+    kept = {path.resolve() for path in keep}
+    entries: list[tuple[float, int, Path]] = []
+    total = 0
+    for path in cache_root.glob("*/*"):
+        if path.name.startswith(".") or not path.is_file():
+            continue
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        total += stat.st_size
+        if path.resolve() not in kept:
+            entries.append((stat.st_mtime, stat.st_size, path))
+    removed = 0
+    freed = 0
+    for _mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        freed += size
+        removed += 1
+    return {"removed": removed, "freed_bytes": freed, "total_bytes": total}
+
+
+class ReferenceLeases:
+    """Cached references in use by this process; `prune` leaves them in place.
+
+    Take the lease before `prepare_model_reference` and keep it until the model
+    call has read the file. Pruning runs under the same lock, so a reference
+    leased by another thread cannot be deleted between its creation and use.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._held: Counter[Path] = Counter()
+
+    @contextmanager
+    def hold(self, path: Path) -> Iterator[Path]:
+        path = path.resolve()
+        with self._lock:
+            self._held[path] += 1
+        try:
+            yield path
+        finally:
+            with self._lock:
+                self._held[path] -= 1
+                if self._held[path] <= 0:
+                    del self._held[path]
+
+    def prune(self, cache_root: Path, max_bytes: int) -> dict[str, int]:
+        with self._lock:
+            return prune_model_references(cache_root, max_bytes, keep=list(self._held))
+
+
+LEASES = ReferenceLeases()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Create (or reuse) a model-ready copy of an FMG reference image.")
+    parser.add_argument("image", type=Path)
+    parser.add_argument("--cache-root", type=Path, required=True)
+    parser.add_argument("--max-edge", type=int, default=DEFAULT_MAX_EDGE)
+    parser.add_argument("--format", choices=sorted(FORMATS), default=DEFAULT_FORMAT)
+    parser.add_argument("--quality", type=int, default=DEFAULT_QUALITY)
+    parser.add_argument("--cache-max-bytes", type=int, default=DEFAULT_CACHE_MAX_BYTES)
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    if not args.image.is_file():
+        raise SystemExit(f"Image not found: {args.image}")
+    reference = prepare_model_reference(
+        args.image,
+        args.cache_root,
+        max_edge=args.max_edge,
+        image_format=args.format,
+        quality=args.quality,
+    )
+    prune_model_references(args.cache_root, args.cache_max_bytes)
+    json.dump(reference, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""Memory-mapped RGBA rasters for large FMG chunks.
+
+A `MappedRaster` keeps its pixels in a temporary file mapped into memory and
+is only ever touched in horizontal bands, so stitching or tiling an
+8192/16384px chunk does not hold a full RGBA canvas in RAM. PNG output is
+encoded as a stream of rows.
+
+PNG input is decoded as a stream of row bands as well (`iter_png_bands`):
+the IDAT stream is inflated incrementally and each band is handed to Pillow
+as a small PNG of its own, seeded with the previous band's last row so the
+row filters still resolve. Peak memory for reading a source is one band
+(plus the resampling window), not the decoded image. PNGs the band reader
+does not handle (interlaced, bit depths other than 8) and other formats are
+decoded whole, as before.
+"""
+
+from __future__ import annotations
+
+import io
+import math
+import mmap
+import struct
+import tempfile
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from PIL import Image
+
+
+DEFAULT_BAND_ROWS = 512
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_IDAT_BYTES = 1024 * 1024
+
+
+# Pillow's LANCZOS support in source pixels at scale 1; widened by the downscale factor.
+LANCZOS_SUPPORT = 3
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+class UnsupportedPng(ValueError):
+    """Raised when a file cannot be decoded band by band."""
+
+
+def _png_chunk(handle: BinaryIO, kind: bytes, data: bytes) -> None:
+    handle.write(struct.pack(">I", len(data)))
+    handle.write(kind)
+    handle.write(data)
+    handle.write(struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+
+def _iter_png_chunks(handle: BinaryIO) -> Iterator[tuple[bytes, bytes]]:
+    if handle.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+        raise UnsupportedPng("not a PNG file")
+    while True:
+        header = handle.read(8)
+        if len(header) < 8:
+            raise UnsupportedPng("truncated PNG")
+        length, kind = struct.unpack(">I4s", header)
+        data = handle.read(length)
+        handle.read(4)
+        if len(data) < length:
+            raise UnsupportedPng("truncated PNG")
+        yield kind, data
+        if kind == b"IEND":
+            return
+
+
+class _BandDecoder:
+    """Turns filtered scanlines into images through Pillow's own PNG decoder."""
+
+    def __init__(self, ihdr: bytes, extra: bytes) -> None:
+        self.width, self.height, depth, color, _compression, _filter, interlace = struct.unpack(">IIBBBBB", ihdr)
+        if depth != 8 or interlace or color not in PNG_CHANNELS:
+            raise UnsupportedPng(f"band decoding needs 8-bit non-interlaced PNG (depth={depth}, interlace={interlace})")
+        self.row_bytes = 1 + self.width * PNG_CHANNELS[color]
+        self._ihdr_tail = ihdr[8:]
+        self._extra = extra
+        self._previous: bytes | None = None
+
+    def decode(self, rows: bytes) -> Image.Image:
+        """Decode whole filtered rows that follow the rows decoded so far."""
+        count = len(rows) // self.row_bytes
+        if self._previous is not None:
+            rows = b"\x00" + self._previous + rows
+            count += 1
+        buffer = io.BytesIO()
+        buffer.write(PNG_SIGNATURE)
+        _png_chunk(buffer, b"IHDR", struct.pack(">II", self.width, count) + self._ihdr_tail)
+        buffer.write(self._extra)
+        _png_chunk(buffer, b"IDAT", zlib.compress(rows, 1))
+        _png_chunk(buffer, b"IEND", b"")
+        buffer.seek(0)
+        with Image.open(buffer) as image:
+            image.load()
+            band = image.copy()
+        self._previous = band.crop((0, count - 1, self.width, count)).tobytes()
+        return band
+
+
+def iter_png_bands(path: Path, band_rows: int = DEFAULT_BAND_ROWS) -> Iterator[tuple[int, Image.Image]]:
+    """Yield `(y0, band)` for consecutive row bands of a PNG, in Pillow's native mode.
+
+    Raises `UnsupportedPng` before yielding anything when the file is not an
+    8-bit non-interlaced PNG.
+    """
+    with path.open("rb") as handle:
+        chunks = _iter_png_chunks(handle)
+        kind, ihdr = next(chunks)
+        if kind != b"IHDR":
+            raise UnsupportedPng("PNG does not start with IHDR")
+        extra = io.BytesIO()
+        decoder: _BandDecoder | None = None
+        inflater = zlib.decompressobj()
+        pending = bytearray()
+        y = 0
+        for kind, data in chunks:
+            if kind in (b"PLTE", b"tRNS"):
+                _png_chunk(extra, kind, data)
+                continue
+            if kind != b"IDAT":
+                continue
+            if decoder is None:
+                decoder = _BandDecoder(ihdr, extra.getvalue())
+            band_bytes = decoder.row_bytes * band_rows
+            while data:
+                # Inflate at most one band at a time; highly compressible maps expand 100x.
+                pending += inflater.decompress(data, band_bytes)
+                data = inflater.unconsumed_tail
+                while len(pending) >= band_bytes and y < decoder.height:
+                    rows = min(band_rows, decoder.height - y)
+                    band = decoder.decode(bytes(pending[:rows * decoder.row_bytes]))
+                    del pending[:rows * decoder.row_bytes]
+                    yield y, _without_seed_row(band, rows)
+                    y += rows
+        if decoder is None:
+            raise UnsupportedPng("PNG has no image data")
+        pending += inflater.flush()
+        while y < decoder.height:
+            rows = min(band_rows, decoder.height - y, len(pending) // decoder.row_bytes)
+            if rows <= 0:
+                raise UnsupportedPng("truncated PNG image data")
+            band = decoder.decode(bytes(pending[:rows * decoder.row_bytes]))
+            del pending[:rows * decoder.row_bytes]
+            yield y, _without_seed_row(band, rows)
+            y += rows
+
+
+def _without_seed_row(band: Image.Image, rows: int) -> Image.Image:
+    if band.height == rows:
+        return band
+    return band.crop((0, band.height - rows, band.width, band.height))
+
+
+def _blank_like(image: Image.Image, size: tuple[int, int]) -> Image.Image:
+    """Zero-filled image of `size` with the mode, palette and transparency of `image`."""
+    blank = Image.new(image.mode, size)
+    if image.mode == "P":
+        blank.putpalette(image.getpalette())
+    blank.info.update(image.info)
+    return blank
+
+
+def _stack(top: Image.Image, bottom: Image.Image) -> Image.Image:
+    """`bottom` appended below `top`, keeping the mode, palette and transparency."""
+    merged = _blank_like(top, (top.width, top.height + bottom.height))
+    merged.paste(top, (0, 0))
+    merged.paste(bottom, (0, top.height))
+    return merged
+
+
+def read_png_boxes(path: Path, boxes: list[tuple[int, int, int, int]], band_rows: int = DEFAULT_BAND_ROWS) -> list[Image.Image]:
+    """RGBA crops of `boxes` from an image, read band by band so only the crops are held.
+
+    Files the band reader does not handle are decoded whole.
+    """
+    crops: list[Image.Image] = []
+    bottom = max((box[3] for box in boxes), default=0)
+    try:
+        for y0, band in iter_png_bands(path, band_rows):
+            if not crops:
+                # Crops start in the source mode, so areas outside the image match Image.crop.
+                crops = [_blank_like(band, (x1 - x0, y1 - y0)) for x0, y0, x1, y1 in boxes]
+            if y0 >= bottom:
+                break
+            y1 = y0 + band.height
+            for crop, (bx0, by0, bx1, by1) in zip(crops, boxes):
+                top, low = max(y0, by0), min(y1, by1)
+                if top < low:
+                    crop.paste(band.crop((bx0, top - y0, bx1, low - y0)), (0, top - by0))
+    except UnsupportedPng:
+        with Image.open(path) as image:
+            return [image.crop(box).convert("RGBA") for box in boxes]
+    return [crop.convert("RGBA") for crop in crops]
+
+
+class MappedRaster:
+    def __init__(self, width: int, height: int, *, directory: Path | None = None, band_rows: int = DEFAULT_BAND_ROWS) -> None:
+        if width <= 0 or height <= 0:
+            raise ValueError(f"Invalid raster size {width}x{height}")
+        self.width = width
+        self.height = height
+        self.band_rows = band_rows
+        self.stride = width * 4
+        if directory is not None:
+            directory.mkdir(parents=True, exist_ok=True)
+        self._file = tempfile.TemporaryFile(prefix="fmg-raster-", suffix=".rgba", dir=directory)
+        self._file.truncate(self.stride * height)
+        self._map = mmap.mmap(self._file.fileno(), self.stride * height)
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.width, self.height
+
+    @classmethod
+    def from_image_file(
+        cls,
+        path: Path,
+        *,
+        size: tuple[int, int] | None = None,
+        directory: Path | None = None,
+        band_rows: int = DEFAULT_BAND_ROWS,
+    ) -> "MappedRaster":
+        """Copy `path` into a new raster, resampling to `size` if given.
+
+        PNGs are read band by band (see `iter_png_bands`); anything else is
+        decoded whole. Resampling works per band with a source box over a
+        window that covers the filter support, so bands join without seams;
+        the result matches a whole-image resize up to one level of float
+        rounding on a few pixels.
+        """
+        with Image.open(path) as probe:
+            source_size, source_format = probe.size, probe.format
+        width, height = size or source_size
+        raster = cls(width, height, directory=directory, band_rows=band_rows)
+        try:
+            if source_format == "PNG":
+                try:
+                    raster._fill_from_bands(iter_png_bands(path, band_rows), source_size)
+                    return raster
+                except UnsupportedPng:
+                    pass
+            with Image.open(path) as image:
+                image.load()
+                raster._fill_from_bands(iter([(0, image)]), source_size)
+        except BaseException:
+            raster.close()
+            raise
+        return raster
+
+    def _fill_from_bands(self, bands: Iterator[tuple[int, Image.Image]], source_size: tuple[int, int]) -> None:
+        """Write consecutive source bands into the raster, resampling when the sizes differ."""
+        source_width, source_height = source_size
+        if (self.width, self.height) == source_size:
+            for y0, band in bands:
+                for top in range(0, band.height, self.band_rows):
+                    bottom = min(band.height, top + self.band_rows)
+                    self.write_band(y0 + top, band.crop((0, top, band.width, bottom)).convert("RGBA"))
+            return
+
+        scale_y = source_height / self.height
+        # Output rows per step, so the source window stays near `band_rows` rows when downscaling.
+        step = max(1, self.band_rows // max(1, math.ceil(scale_y)))
+        margin = math.ceil(LANCZOS_SUPPORT * max(scale_y, 1.0)) + 1
+        window: Image.Image | None = None
+        window_top = window_bottom = 0
+        for y0 in range(0, self.height, step):
+            y1 = min(self.height, y0 + step)
+            need_top = max(0, math.floor(y0 * scale_y) - margin)
+            need_bottom = min(source_height, math.ceil(y1 * scale_y) + margin)
+            while window_bottom < need_bottom:
+                source_y, band = next(bands)
+                window = band if window is None else _stack(window, band)
+                window_bottom = source_y + band.height
+            assert window is not None
+            if need_top > window_top:
+                window = window.crop((0, need_top - window_top, source_width, window.height))
+                window_top = need_top
+            band = window.resize(
+                (self.width, y1 - y0),
+                Image.Resampling.LANCZOS,
+                box=(0, y0 * scale_y - window_top, source_width, y1 * scale_y - window_top),
+            )
+            self.write_band(y0, band.convert("RGBA"))
+
+    def _offset(self, y: int) -> int:
+        return y * self.stride
+
+    def read_band(self, y0: int, y1: int) -> Image.Image:
+        """Copy of rows [y0, y1) as an RGBA image."""
+        data = self._map[self._offset(y0):self._offset(y1)]
+        return Image.frombytes("RGBA", (self.width, y1 - y0), data)
+
+    def write_band(self, y0: int, band: Image.Image) -> None:
+        if band.mode != "RGBA":
+            band = band.convert("RGBA")
+        if band.width != self.width:
+            raise ValueError(f"Band width {band.width} does not match raster width {self.width}")
+        self._map[self._offset(y0):self._offset(y0 + band.height)] = band.tobytes()
+
+    def crop(self, box: tuple[int, int, int, int]) -> Image.Image:
+        """RGBA copy of `box`, reading only the bytes inside it."""
+        x0, y0, x1, y1 = box
+        data = b"".join(
+            self._map[self._offset(y) + x0 * 4:self._offset(y) + x1 * 4] for y in range(y0, y1)
+        )
+        return Image.frombytes("RGBA", (x1 - x0, y1 - y0), data)
+
+    def paste(self, image: Image.Image, xy: tuple[int, int]) -> None:
+        """Paste `image` at `xy`, one band at a time."""
+        x, y = xy
+        top = max(0, y)
+        bottom = min(self.height, y + image.height)
+        for y0 in range(top, bottom, self.band_rows):
+            y1 = min(bottom, y0 + self.band_rows)
+            band = self.read_band(y0, y1)
+            band.paste(image.crop((0, y0 - y, image.width, y1 - y)), (x, 0))
+            self.write_band(y0, band)
+
+    def save_png(self, path: Path, *, compress_level: int = 6) -> Path:
+        """Write an 8-bit RGBA PNG, streaming rows out of the mapping."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        compressor = zlib.compressobj(compress_level)
+        with path.open("wb") as handle:
+            handle.write(PNG_SIGNATURE)
+            _png_chunk(handle, b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, 6, 0, 0, 0))
+            pending = bytearray()
+            for y in range(self.height):
+                # Filter type 0 (None) per row.
+                pending += compressor.compress(b"\x00" + self._map[self._offset(y):self._offset(y + 1)])
+                if len(pending) >= PNG_IDAT_BYTES:
+                    _png_chunk(handle, b"IDAT", bytes(pending))
+                    pending.clear()
+            pending += compressor.flush()
+            _png_chunk(handle, b"IDAT", bytes(pending))
+            _png_chunk(handle, b"IEND", b"")
+        return path
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "MappedRaster":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
@@ -1,22 +1,36 @@
 #!/usr/bin/env python3
 """Create a stitched reference image for an FMG chunk.
 
-The current chunk remains 4096x4096. Any overlap with already generated
+The current chunk keeps its size. Any overlap with already generated
 basemaps is replaced by pixels from those generated basemaps so later chunks
 inherit the established SnowWeave visual style.
+
+With `--output-dir`, references for many chunks are stitched in one process
+and every generated basemap is decoded only once.
+
+Chunks larger than 4096x4096 are stitched in a memory-mapped raster (see
+`fmg_raster`), so 8192/16384px chunks never hold a full RGBA canvas in RAM.
 """
 
 from __future__ import annotations
 
 import argparse
 import json
+import math
 from pathlib import Path
 from typing import Any
 
 from PIL import Image
 
+from fmg_raster import MappedRaster, read_png_boxes
+
 
 DEFAULT_CHUNK_SIZE = 4096
+MAPPED_RASTER_MIN_PIXELS = DEFAULT_CHUNK_SIZE * DEFAULT_CHUNK_SIZE
+
+
+class StitchError(RuntimeError):
+    """A chunk or basemap needed for stitching is missing."""
 
 
 def read_json(path: Path) -> dict[str, Any]:
@@ -74,75 +88,265 @@ def local_box(global_rect: dict[str, int], chunk_rect: dict[str, float]) -> tupl
 def load_chunk(index: dict[str, Any], chunk_id: str) -> dict[str, Any]:
     chunks = index.get("chunks")
     if not isinstance(chunks, dict) or chunk_id not in chunks:
-        raise SystemExit(f"Chunk not found in index: {chunk_id}")
+        raise StitchError(f"Chunk not found in index: {chunk_id}")
     chunk = chunks[chunk_id]
     if not isinstance(chunk, dict):
-        raise SystemExit(f"Invalid chunk entry: {chunk_id}")
+        raise StitchError(f"Invalid chunk entry: {chunk_id}")
     return chunk
 
 
-def build_parser() -> argparse.ArgumentParser:
-    parser = argparse.ArgumentParser(description=__doc__)
-    parser.add_argument("--index", type=Path, required=True)
-    parser.add_argument("--chunk-id", required=True)
-    parser.add_argument("--generated", action="append", type=parse_generated, default=[], help="Already generated basemap as CHUNK_ID=PATH. Repeatable.")
-    parser.add_argument("--output", type=Path, required=True)
-    parser.add_argument("--report", type=Path)
-    return parser
+class ChunkGrid:
+    """Uniform grid over chunk rects, so overlap queries only test nearby chunks."""
 
+    def __init__(self, rects: dict[str, dict[str, float]]) -> None:
+        sizes = [max(rect["xMax"] - rect["xMin"], rect["yMax"] - rect["yMin"]) for rect in rects.values()]
+        self.cell = max(sizes, default=0) or DEFAULT_CHUNK_SIZE
+        self.rects = rects
+        self._cells: dict[tuple[int, int], list[str]] = {}
+        for chunk_id, rect in rects.items():
+            for key in self._keys(rect):
+                self._cells.setdefault(key, []).append(chunk_id)
 
-def main() -> None:
-    args = build_parser().parse_args()
-    index = read_json(args.index)
-    current = load_chunk(index, args.chunk_id)
-    current_rect = rect_from_chunk(current)
+    def _keys(self, rect: dict[str, float]) -> list[tuple[int, int]]:
+        x0, y0 = math.floor(rect["xMin"] / self.cell), math.floor(rect["yMin"] / self.cell)
+        x1, y1 = math.ceil(rect["xMax"] / self.cell), math.ceil(rect["yMax"] / self.cell)
+        return [(x, y) for x in range(x0, max(x1, x0 + 1)) for y in range(y0, max(y1, y0 + 1))]
+
+    def overlapping(self, rect: dict[str, float]) -> list[tuple[str, dict[str, int]]]:
+        seen: set[str] = set()
+        hits = []
+        for key in self._keys(rect):
+            for chunk_id in self._cells.get(key, ()):
+                if chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+                overlap = intersect(rect, self.rects[chunk_id])
+                if overlap:
+                    hits.append((chunk_id, overlap))
+        return hits
+
+
+def _write_stitched(
+    chunk_id: str,
+    current: dict[str, Any],
+    steps: list[dict[str, Any]],
+    patches: dict[tuple[str, str], Image.Image],
+    output: Path,
+    report_path: Path,
+) -> dict[str, Any]:
     current_png = Path(str(current["png"]))
     if not current_png.exists():
-        raise SystemExit(f"Current chunk PNG not found: {current_png}")
+        raise StitchError(f"Current chunk PNG not found: {current_png}")
 
-    canvas = Image.open(current_png).convert("RGBA")
+    with Image.open(current_png) as image:
+        width, height = image.size
+    if width * height > MAPPED_RASTER_MIN_PIXELS:
+        canvas: Image.Image | MappedRaster = MappedRaster.from_image_file(current_png, directory=output.parent)
+    else:
+        with Image.open(current_png) as image:
+            canvas = image.convert("RGBA")
     replacements: list[dict[str, Any]] = []
+    try:
+        for step in steps:
+            patch = patches[(chunk_id, step["from_chunk"])]
+            dst_box = step["target_paste_box"]
+            expected_size = (dst_box[2] - dst_box[0], dst_box[3] - dst_box[1])
+            if patch.size != expected_size:
+                patch = patch.resize(expected_size, Image.Resampling.LANCZOS)
+            canvas.paste(patch, (dst_box[0], dst_box[1]))
+            replacements.append(step)
 
-    for source_chunk_id, basemap_path in args.generated:
-        source = load_chunk(index, source_chunk_id)
-        source_rect = rect_from_chunk(source)
-        overlap = intersect(current_rect, source_rect)
-        if not overlap:
-            continue
-        if not basemap_path.exists():
-            raise SystemExit(f"Generated basemap not found: {basemap_path}")
-
-        src_box = local_box(overlap, source_rect)
-        dst_box = local_box(overlap, current_rect)
-        patch = Image.open(basemap_path).convert("RGBA").crop(src_box)
-        expected_size = (dst_box[2] - dst_box[0], dst_box[3] - dst_box[1])
-        if patch.size != expected_size:
-            patch = patch.resize(expected_size, Image.Resampling.LANCZOS)
-        canvas.paste(patch, (dst_box[0], dst_box[1]))
-        replacements.append(
-            {
-                "from_chunk": source_chunk_id,
-                "from_basemap": str(basemap_path.resolve()),
-                "global_overlap": overlap,
-                "source_crop_box": src_box,
-                "target_paste_box": dst_box,
-            }
-        )
-
-    args.output.parent.mkdir(parents=True, exist_ok=True)
-    canvas.save(args.output)
-
-    report_path = args.report or args.output.with_suffix(".stitch_report.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(canvas, MappedRaster):
+            canvas.save_png(output)
+        else:
+            canvas.save(output)
+    finally:
+        if isinstance(canvas, MappedRaster):
+            canvas.close()
     report = {
         "version": 1,
-        "chunk_id": args.chunk_id,
+        "chunk_id": chunk_id,
         "input_png": str(current_png.resolve()),
-        "output": str(args.output.resolve()),
-        "current_rect": current_rect,
+        "output": str(output.resolve()),
+        "current_rect": rect_from_chunk(current),
         "replacements": replacements,
     }
     write_json(report_path, report)
-    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return report
+
+
+def stitch_batch(
+    index: dict[str, Any],
+    generated: list[tuple[str, Path]],
+    outputs: dict[str, Path],
+    *,
+    report_paths: dict[str, Path] | None = None,
+) -> list[dict[str, Any]]:
+    """Stitch references for every chunk in `outputs` in one pass over the basemaps.
+
+    Overlaps are found through a `ChunkGrid` of the generated chunks. Each
+    basemap is read once (band by band above 4096x4096, see `read_png_boxes`),
+    only its overlap strips are cropped and kept, and a target is written (and
+    its strips released) as soon as its last source has been read. Where two
+    sources cover the same target pixels, the later one in `generated` wins.
+    Returns one report per target, in the order targets were completed.
+    """
+    paths = dict(generated)
+    order = {chunk_id: position for position, (chunk_id, _path) in enumerate(generated)}
+    grid = ChunkGrid({chunk_id: rect_from_chunk(load_chunk(index, chunk_id)) for chunk_id in paths})
+
+    plans: dict[str, list[dict[str, Any]]] = {}
+    readers: dict[str, list[str]] = {}
+    for chunk_id in outputs:
+        current_rect = rect_from_chunk(load_chunk(index, chunk_id))
+        hits = sorted(
+            (hit for hit in grid.overlapping(current_rect) if hit[0] != chunk_id),
+            key=lambda hit: order[hit[0]],
+        )
+        plans[chunk_id] = [
+            {
+                "from_chunk": source_id,
+                "from_basemap": str(paths[source_id].resolve()),
+                "global_overlap": overlap,
+                "source_crop_box": local_box(overlap, grid.rects[source_id]),
+                "target_paste_box": local_box(overlap, current_rect),
+            }
+            for source_id, overlap in hits
+        ]
+        for step in plans[chunk_id]:
+            readers.setdefault(step["from_chunk"], []).append(chunk_id)
+
+    reports: list[dict[str, Any]] = []
+    patches: dict[tuple[str, str], Image.Image] = {}
+    remaining = {chunk_id: len(steps) for chunk_id, steps in plans.items()}
+
+    def finish(chunk_id: str) -> None:
+        output = outputs[chunk_id]
+        reports.append(
+            _write_stitched(
+                chunk_id,
+                load_chunk(index, chunk_id),
+                plans[chunk_id],
+                patches,
+                output,
+                (report_paths or {}).get(chunk_id) or output.with_suffix(".stitch_report.json"),
+            )
+        )
+        for step in plans[chunk_id]:
+            patches.pop((chunk_id, step["from_chunk"]), None)
+
+    for chunk_id in [chunk_id for chunk_id, count in remaining.items() if count == 0]:
+        finish(chunk_id)
+    for source_id, _path in generated:
+        targets = readers.get(source_id)
+        if not targets:
+            continue
+        basemap_path = paths[source_id]
+        if not basemap_path.exists():
+            raise StitchError(f"Generated basemap not found: {basemap_path}")
+        boxes = [
+            tuple(next(step for step in plans[chunk_id] if step["from_chunk"] == source_id)["source_crop_box"])
+            for chunk_id in targets
+        ]
+        with Image.open(basemap_path) as basemap:
+            width, height = basemap.size
+            if width * height <= MAPPED_RASTER_MIN_PIXELS:
+                crops = [basemap.crop(box).convert("RGBA") for box in boxes]
+        if width * height > MAPPED_RASTER_MIN_PIXELS:
+            crops = read_png_boxes(basemap_path, boxes)
+        for chunk_id, crop in zip(targets, crops):
+            patches[(chunk_id, source_id)] = crop
+        for chunk_id in targets:
+            remaining[chunk_id] -= 1
+            if remaining[chunk_id] == 0:
+                finish(chunk_id)
+    return reports
+
+
+def stitch_chunk_reference(
+    index: dict[str, Any],
+    chunk_id: str,
+    generated: list[tuple[str, Path]],
+    output: Path,
+    *,
+    report_path: Path | None = None,
+) -> dict[str, Any]:
+    """Paste the overlaps of already generated basemaps into a chunk's FMG reference.
+
+    Writes the stitched PNG to `output` and a report next to it, and returns
+    the report.
+    """
+    report_paths = {chunk_id: report_path} if report_path is not None else None
+    return stitch_batch(index, generated, {chunk_id: output}, report_paths=report_paths)[0]
+
+
+def generated_from_root(index: dict[str, Any], root: Path) -> list[tuple[str, Path]]:
+    """Basemaps of a `generate_fmg_chunk_pipeline.py --all-chunks` output dir, in generation order."""
+    found: list[tuple[str, Path]] = []
+    chunks = index.get("chunks") if isinstance(index.get("chunks"), dict) else {}
+    for chunk_id in index.get("generation_order") or list(chunks):
+        checkpoint = root / chunk_id / "chunk_checkpoint.json"
+        if checkpoint.is_file():
+            path = Path(str(read_json(checkpoint).get("base_image", "")))
+        else:
+            path = root / chunk_id / "base" / "base-1.png"
+        if path.is_file():
+            found.append((chunk_id, path))
+    return found
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--index", type=Path, required=True)
+    parser.add_argument(
+        "--chunk-id",
+        action="append",
+        dest="chunk_ids",
+        default=[],
+        help="Chunk to stitch. Repeatable; with --output-dir and no --chunk-id every chunk without a basemap is stitched.",
+    )
+    parser.add_argument("--generated", action="append", type=parse_generated, default=[], help="Already generated basemap as CHUNK_ID=PATH. Repeatable.")
+    parser.add_argument(
+        "--generated-root",
+        type=Path,
+        help="Output dir of generate_fmg_chunk_pipeline.py --all-chunks; its finished basemaps are used as --generated.",
+    )
+    parser.add_argument("--output", type=Path, help="Stitched PNG for a single --chunk-id.")
+    parser.add_argument("--output-dir", type=Path, help="Batch mode: write <chunk_id>-reference-stitched.png here.")
+    parser.add_argument("--report", type=Path)
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    index = read_json(args.index)
+    generated = list(args.generated)
+    if args.generated_root:
+        explicit = {chunk_id for chunk_id, _path in generated}
+        generated = [item for item in generated_from_root(index, args.generated_root) if item[0] not in explicit] + generated
+
+    try:
+        if args.output_dir:
+            done = {chunk_id for chunk_id, _path in generated}
+            chunks = index.get("chunks") if isinstance(index.get("chunks"), dict) else {}
+            order = index.get("generation_order") or list(chunks)
+            targets = args.chunk_ids or [chunk_id for chunk_id in order if chunk_id not in done]
+            outputs = {chunk_id: args.output_dir / f"{chunk_id}-reference-stitched.png" for chunk_id in targets}
+            result: Any = stitch_batch(index, generated, outputs)
+        else:
+            if len(args.chunk_ids) != 1 or not args.output:
+                raise SystemExit("Single-chunk mode needs exactly one --chunk-id and --output; use --output-dir for batches.")
+            result = stitch_chunk_reference(
+                index,
+                args.chunk_ids[0],
+                generated,
+                args.output,
+                report_path=args.report,
+            )
+    except StitchError as exc:
+        raise SystemExit(str(exc)) from None
+    print(json.dumps(result, ensure_ascii=False, indent=2))
 
 
 if __name__ == "__main__":
@@ -2,23 +2,54 @@
 """Fetch or unpack a Fantasy Map Generator atlas bundle for SnowWeave.
 
 This script is intentionally data-prep only. It extracts the bundle and writes
-an index that SnowWeave's map pipeline can consume.
+an index that SnowWeave's map pipeline can consume. The same logic is importable
+as `unpack_atlas_bundle()` so the map pipeline API can call it in-process.
+
+`prepare_cached_reference()` keeps one extracted copy per bundle hash in a
+shared cache directory and links it into per-task reference directories.
 """
 
 from __future__ import annotations
 
 import argparse
+import base64
+import hashlib
 import json
+import os
 import shutil
+import sys
+import threading
+import time
+import uuid
 import zipfile
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any
+from http.client import IncompleteRead
+from typing import Any, Callable, Iterator
+from urllib.error import HTTPError, URLError
 from urllib.parse import urlencode
-from urllib.request import urlopen
+from urllib.request import Request, urlopen
 
 
 DEFAULT_FMG_BACKEND_URL = "http://127.0.0.1:8765"
 DEFAULT_CHUNK_SIZE = 4096
+# Largest chunk edge accepted. Chunks above 4096px are stitched and tiled
+# through memory-mapped rasters (see fmg_raster), so this is a memory/time
+# budget rather than a format limit.
+MAX_CHUNK_SIZE = 16384
+DEFAULT_INDEX_NAME = "fmg_reference_index.json"
+DEFAULT_CACHE_MAX_BYTES = 8 * 1024**3
+CACHE_COMPLETE_MARKER = ".complete"
+DOWNLOAD_BLOCK_BYTES = 1024 * 1024
+DOWNLOAD_PROGRESS_INTERVAL_SECONDS = 0.5
+
+_cache_lock = threading.Lock()
+_digest_cache: dict[str, tuple[int, int, str]] = {}
+_index_cache: dict[str, dict[str, Any]] = {}
+
+
+class FmgBundleError(RuntimeError):
+    """The bundle is missing, malformed, or lacks a requested file."""
 
 
 def read_json(path: Path) -> dict[str, Any]:
@@ -30,21 +61,170 @@ def write_json(path: Path, data: dict[str, Any]) -> None:
     path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
 
 
-def fetch_bundle(*, backend_url: str, seed: str | None, chunk_size: int, output_zip: Path) -> Path:
+def bundle_sha256(path: Path) -> str:
+    """SHA-256 of the bundle zip, cached by (size, mtime) for the process lifetime."""
+    stat = path.stat()
+    key = str(path.resolve())
+    with _cache_lock:
+        cached = _digest_cache.get(key)
+    if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(block)
+    value = digest.hexdigest()
+    with _cache_lock:
+        _digest_cache[key] = (stat.st_size, stat.st_mtime_ns, value)
+    return value
+
+
+ProgressCallback = Callable[[int, "int | None"], None]
+
+
+def _bundle_url(backend_url: str, seed: str | None, chunk_size: int) -> str:
     query: dict[str, str] = {"chunk_size": str(chunk_size)}
     if seed:
         query["seed"] = seed
-    url = f"{backend_url.rstrip('/')}/exports/atlas.bundle.zip?{urlencode(query)}"
+    return f"{backend_url.rstrip('/')}/exports/atlas.bundle.zip?{urlencode(query)}"
+
+
+def _digest_from_headers(headers: Any) -> str | None:
+    """SHA-256 announced by the backend, as `X-Content-SHA256` or RFC 3230 `Digest`."""
+    value = headers.get("X-Content-SHA256")
+    if value:
+        return value.strip().lower()
+    for part in (headers.get("Digest") or "").split(","):
+        algorithm, _, encoded = part.strip().partition("=")
+        if algorithm.lower() == "sha-256" and encoded:
+            try:
+                return base64.b64decode(encoded).hex()
+            except ValueError:
+                return None
+    return None
+
+
+def _sidecar_digest(url: str) -> str | None:
+    """Read `<bundle url>.sha256` if the backend publishes one."""
+    base, sep, query = url.partition("?")
+    try:
+        with urlopen(f"{base}.sha256{sep}{query}", timeout=30) as response:
+            text = response.read(1024).decode("ascii", "replace")
+    except (HTTPError, URLError, OSError):
+        return None
+    token = text.split()[0].lower() if text.split() else ""
+    return token if len(token) == 64 and all(char in "0123456789abcdef" for char in token) else None
+
+
+def _hash_file(path: Path, digest: Any) -> int:
+    size = 0
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(DOWNLOAD_BLOCK_BYTES), b""):
+            digest.update(block)
+            size += len(block)
+    return size
+
+
+def fetch_bundle(
+    *,
+    backend_url: str,
+    seed: str | None,
+    chunk_size: int,
+    output_zip: Path,
+    progress: ProgressCallback | None = None,
+    expected_sha256: str | None = None,
+    resume: bool = True,
+    retries: int = 3,
+    timeout: float = 600,
+) -> Path:
+    """Stream the bundle to `<output_zip>.part` and move it into place when verified.
+
+    An existing `.part` file is resumed with an HTTP Range request, guarded by
+    `If-Range` when the backend sent an ETag; a 200 reply restarts the file.
+    The SHA-256 is checked against `expected_sha256`, the backend's digest
+    header or a `.sha256` sidecar, whichever is available first. `progress`
+    is called with (bytes_done, bytes_total_or_None) at most a few times a
+    second and once at the end.
+    """
+    url = _bundle_url(backend_url, seed, chunk_size)
     output_zip.parent.mkdir(parents=True, exist_ok=True)
-    with urlopen(url, timeout=600) as response:
-        output_zip.write_bytes(response.read())
+    part = output_zip.with_name(output_zip.name + ".part")
+    meta_path = output_zip.with_name(output_zip.name + ".part.json")
+    meta = read_json(meta_path) if resume and meta_path.is_file() and part.is_file() else {}
+    if not resume or not meta:
+        part.unlink(missing_ok=True)
+    expected = (expected_sha256 or "").lower() or None
+
+    attempt = 0
+    while True:
+        digest = hashlib.sha256()
+        done = _hash_file(part, digest) if part.is_file() else 0
+        request = Request(url)
+        if done:
+            request.add_header("Range", f"bytes={done}-")
+            if meta.get("etag"):
+                request.add_header("If-Range", str(meta["etag"]))
+        try:
+            with urlopen(request, timeout=timeout) as response:
+                if done and response.status != 206:
+                    # Server ignored the range or the bundle changed; start over.
+                    digest = hashlib.sha256()
+                    done = 0
+                length = response.headers.get("Content-Length")
+                total = done + int(length) if length and length.isdigit() else None
+                expected = expected or _digest_from_headers(response.headers) or meta.get("sha256")
+                meta = {"url": url, "etag": response.headers.get("ETag"), "sha256": expected, "total": total}
+                write_json(meta_path, meta)
+                last_report = 0.0
+                with part.open("ab" if done else "wb") as handle:
+                    for block in iter(lambda: response.read(DOWNLOAD_BLOCK_BYTES), b""):
+                        handle.write(block)
+                        digest.update(block)
+                        done += len(block)
+                        now = time.monotonic()
+                        if progress and now - last_report >= DOWNLOAD_PROGRESS_INTERVAL_SECONDS:
+                            last_report = now
+                            progress(done, total)
+                if total is not None and done < total:
+                    raise IncompleteRead(b"", total - done)
+            break
+        except HTTPError as exc:
+            if exc.code == 416 and done:
+                # Our partial file is no longer valid for this resource.
+                part.unlink(missing_ok=True)
+                meta = {}
+            elif exc.code < 500:
+                raise FmgBundleError(f"Bundle download failed: HTTP {exc.code} for {url}") from exc
+            attempt += 1
+            if attempt > retries:
+                raise FmgBundleError(f"Bundle download failed after {retries} retries: {exc}") from exc
+            if exc.code != 416:
+                time.sleep(min(30.0, 2.0 ** attempt))
+        except (URLError, OSError, IncompleteRead) as exc:
+            attempt += 1
+            if attempt > retries:
+                raise FmgBundleError(f"Bundle download failed after {retries} retries: {exc}") from exc
+            time.sleep(min(30.0, 2.0 ** attempt))
+
+    if progress:
+        progress(done, done)
+    expected = expected or _sidecar_digest(url)
+    actual = digest.hexdigest()
+    if expected and actual != expected:
+        part.unlink(missing_ok=True)
+        meta_path.unlink(missing_ok=True)
+        raise FmgBundleError(f"Bundle checksum mismatch for {url}: expected {expected}, got {actual}")
+    os.replace(part, output_zip)
+    meta_path.unlink(missing_ok=True)
+    with _cache_lock:
+        stat = output_zip.stat()
+        _digest_cache[str(output_zip.resolve())] = (stat.st_size, stat.st_mtime_ns, actual)
     return output_zip
 
 
-def extract_bundle(zip_path: Path, output_dir: Path) -> None:
-    output_dir.mkdir(parents=True, exist_ok=True)
-    with zipfile.ZipFile(zip_path) as archive:
-        archive.extractall(output_dir)
+def check_chunk_size(chunk_size: int, max_chunk_size: int = MAX_CHUNK_SIZE) -> None:
+    if not 0 < chunk_size <= max_chunk_size:
+        raise FmgBundleError(f"FMG chunk size must be between 1 and {max_chunk_size}px, got {chunk_size}.")
 
 
 def rect_from_chunk(chunk: dict[str, Any]) -> dict[str, float]:
@@ -57,6 +237,49 @@ def rect_from_chunk(chunk: dict[str, Any]) -> dict[str, float]:
     return {"xMin": x, "yMin": y, "xMax": x + width, "yMax": y + height}
 
 
+def _rects_overlap(a: dict[str, float], b: dict[str, float]) -> bool:
+    return min(a["xMax"], b["xMax"]) > max(a["xMin"], b["xMin"]) and min(a["yMax"], b["yMax"]) > max(
+        a["yMin"], b["yMin"]
+    )
+
+
+def plan_wavefront(chunks: dict[str, Any]) -> dict[str, Any]:
+    """Generation order, anti-diagonal waves and overlap dependencies for any grid.
+
+    A chunk's wave is column + row (ranked from origins when the manifest
+    has no grid coordinates). It depends on every overlapping chunk in an
+    earlier wave, so chunks of one wave can be generated concurrently: their
+    own corner overlaps are already covered by a shared earlier neighbour.
+    """
+    rects = {chunk_id: rect_from_chunk(chunk) for chunk_id, chunk in chunks.items() if isinstance(chunk, dict)}
+    xs = sorted({rect["xMin"] for rect in rects.values()})
+    ys = sorted({rect["yMin"] for rect in rects.values()})
+    coords: dict[str, tuple[int, int]] = {}
+    for chunk_id, rect in rects.items():
+        chunk = chunks[chunk_id]
+        column, row = chunk.get("column"), chunk.get("row")
+        if not isinstance(column, int) or not isinstance(row, int):
+            column, row = xs.index(rect["xMin"]), ys.index(rect["yMin"])
+        coords[chunk_id] = (column, row)
+
+    order = sorted(rects, key=lambda chunk_id: (sum(coords[chunk_id]), coords[chunk_id][1], coords[chunk_id][0]))
+    waves: list[list[str]] = []
+    for chunk_id in order:
+        wave = sum(coords[chunk_id])
+        while len(waves) <= wave:
+            waves.append([])
+        waves[wave].append(chunk_id)
+    dependencies = {
+        chunk_id: [
+            other
+            for other in order
+            if sum(coords[other]) < sum(coords[chunk_id]) and _rects_overlap(rects[chunk_id], rects[other])
+        ]
+        for chunk_id in order
+    }
+    return {"generation_order": order, "waves": [wave for wave in waves if wave], "dependencies": dependencies}
+
+
 def has_items(value: Any) -> bool:
     return isinstance(value, list) and len(value) > 0
 
@@ -101,94 +324,769 @@ def build_legend_context(chunk_manifest: dict[str, Any]) -> str:
     return "\n".join(lines)
 
 
-def build_index(extract_dir: Path, output_index: Path, *, seed: str | None, source_zip: Path) -> dict[str, Any]:
-    manifest_path = extract_dir / "manifest.json"
-    if not manifest_path.exists():
-        raise SystemExit(f"Missing manifest.json in {extract_dir}")
+def _chunk_member(chunk: dict[str, Any], key: str) -> str:
+    chunk_id = str(chunk["id"])
+    default = f"chunks/{chunk_id}.png" if key == "png" else f"chunks/{chunk_id}.json"
+    return str(chunk.get(key, default))
 
-    manifest = read_json(manifest_path)
-    chunks: dict[str, Any] = {}
-    for chunk in manifest.get("chunks", []):
-        if not isinstance(chunk, dict) or not chunk.get("id"):
-            continue
-        chunk_id = str(chunk["id"])
-        chunk_manifest_path = extract_dir / str(chunk.get("manifest", f"chunks/{chunk_id}.json"))
-        chunk_png_path = extract_dir / str(chunk.get("png", f"chunks/{chunk_id}.png"))
-        if not chunk_manifest_path.exists():
-            raise SystemExit(f"Missing chunk manifest: {chunk_manifest_path}")
-        if not chunk_png_path.exists():
-            raise SystemExit(f"Missing chunk PNG: {chunk_png_path}")
-
-        chunk_manifest = read_json(chunk_manifest_path)
-        chunks[chunk_id] = {
-            "id": chunk_id,
-            "column": chunk.get("column"),
-            "row": chunk.get("row"),
-            "png": str(chunk_png_path.resolve()),
-            "manifest": str(chunk_manifest_path.resolve()),
-            "sourceOrigin": chunk.get("sourceOrigin") or chunk.get("origin"),
-            "origin": chunk.get("origin"),
-            "size": chunk.get("size"),
-            "bounds": chunk.get("bounds") or rect_from_chunk(chunk),
-            "overlap": chunk.get("overlap"),
-            "legend_context": build_legend_context(chunk_manifest),
-        }
-
-    index = {
+
+def _chunk_entry(extract_dir: Path, chunk: dict[str, Any]) -> dict[str, Any]:
+    chunk_id = str(chunk["id"])
+    return {
+        "id": chunk_id,
+        "column": chunk.get("column"),
+        "row": chunk.get("row"),
+        "png": str((extract_dir / _chunk_member(chunk, "png")).resolve()),
+        "manifest": str((extract_dir / _chunk_member(chunk, "manifest")).resolve()),
+        "sourceOrigin": chunk.get("sourceOrigin") or chunk.get("origin"),
+        "origin": chunk.get("origin"),
+        "size": chunk.get("size"),
+        "bounds": chunk.get("bounds") or rect_from_chunk(chunk),
+        "overlap": chunk.get("overlap"),
+    }
+
+
+def _index_from_manifest(
+    manifest: dict[str, Any],
+    extract_dir: Path,
+    *,
+    seed: str | None,
+    source_zip: Path,
+    bundle_digest: str,
+    chunks: dict[str, Any],
+) -> dict[str, Any]:
+    atlas_png = extract_dir / "atlas.png"
+    return {
         "version": 1,
         "kind": "snowweave-fmg-reference-index",
         "seed": seed or manifest.get("seed"),
         "source_zip": str(source_zip.resolve()),
+        "bundle_sha256": bundle_digest,
         "extract_dir": str(extract_dir.resolve()),
-        "atlas_png": str((extract_dir / "atlas.png").resolve()) if (extract_dir / "atlas.png").exists() else "",
-        "manifest": str(manifest_path.resolve()),
+        "atlas_png": str(atlas_png.resolve()) if atlas_png.exists() else "",
+        "manifest": str((extract_dir / "manifest.json").resolve()),
         "chunk_size": manifest.get("chunkSize", DEFAULT_CHUNK_SIZE),
         "map_size": manifest.get("mapSize"),
         "grid": manifest.get("grid"),
         "chunks": chunks,
-        "generation_order": ["chunk_0_0", "chunk_1_0", "chunk_0_1", "chunk_1_1"],
+        **plan_wavefront(chunks),
+    }
+
+
+def zip_members(archive: zipfile.ZipFile) -> dict[str, dict[str, int]]:
+    """CRC-32 and size of every file entry, read from the zip central directory."""
+    return {
+        info.filename: {"crc": info.CRC, "size": info.file_size}
+        for info in archive.infolist()
+        if not info.is_dir()
     }
+
+
+def _member_current(extract_dir: Path, name: str, member: dict[str, int] | None, previous: dict[str, Any]) -> bool:
+    """True if `name` is on disk with the same CRC/size the previous extraction recorded."""
+    if member is None or (previous.get("members") or {}).get(name) != member:
+        return False
+    try:
+        return (extract_dir / name).stat().st_size == member["size"]
+    except OSError:
+        return False
+
+
+def build_lazy_index(
+    zip_path: Path,
+    extract_dir: Path,
+    output_index: Path,
+    *,
+    seed: str | None,
+    bundle_digest: str | None = None,
+    previous: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    """Index a bundle from its `manifest.json` and zip directory, without extracting any chunk.
+
+    Chunk entries start with `"extracted": false` and no `legend_context`;
+    `materialize_chunks()` fills them in on demand. The index records every
+    member's CRC-32 and size. Given the `previous` index of the same
+    directory, chunks whose PNG and JSON members are unchanged and still on
+    disk keep their entry and `legend_context`, so only changed chunks are
+    extracted again.
+    """
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            members = zip_members(archive)
+            try:
+                manifest = json.loads(archive.read("manifest.json").decode("utf-8"))
+            except KeyError:
+                raise FmgBundleError(f"Missing manifest.json in {zip_path}") from None
+    except zipfile.BadZipFile as exc:
+        raise FmgBundleError(f"Invalid bundle zip {zip_path}: {exc}") from exc
+    write_json(extract_dir / "manifest.json", manifest)
+
+    previous = previous if previous and previous.get("extract_dir") == str(extract_dir.resolve()) else {}
+    previous_chunks = previous.get("chunks") if isinstance(previous.get("chunks"), dict) else {}
+    chunks: dict[str, Any] = {}
+    for chunk in manifest.get("chunks", []):
+        if not isinstance(chunk, dict) or not chunk.get("id"):
+            continue
+        entry = _chunk_entry(extract_dir, chunk)
+        entry["extracted"] = False
+        old = previous_chunks.get(entry["id"])
+        names = [_chunk_member(chunk, "png"), _chunk_member(chunk, "manifest")]
+        if (
+            isinstance(old, dict)
+            and old.get("extracted", True) is not False
+            and old.get("legend_context") is not None
+            and all(_member_current(extract_dir, name, members.get(name), previous) for name in names)
+        ):
+            entry["extracted"] = True
+            entry["legend_context"] = old["legend_context"]
+        chunks[entry["id"]] = entry
+
+    index = _index_from_manifest(
+        manifest,
+        extract_dir,
+        seed=seed,
+        source_zip=zip_path,
+        bundle_digest=bundle_digest or bundle_sha256(zip_path),
+        chunks=chunks,
+    )
+    if index["atlas_png"] and not _member_current(extract_dir, "atlas.png", members.get("atlas.png"), previous):
+        index["atlas_png"] = ""
+    stat = zip_path.stat()
+    index["source_zip_stat"] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    index["members"] = members
+    index["lazy"] = True
     write_json(output_index, index)
     return index
 
 
-def build_parser() -> argparse.ArgumentParser:
-    parser = argparse.ArgumentParser(description=__doc__)
-    parser.add_argument("--zip", type=Path, help="Existing atlas bundle zip. If omitted, the script fetches one.")
-    parser.add_argument("--backend-url", default=DEFAULT_FMG_BACKEND_URL)
-    parser.add_argument("--seed")
-    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
-    parser.add_argument("--output-dir", type=Path, required=True)
-    parser.add_argument("--index-name", default="fmg_reference_index.json")
-    parser.add_argument("--force", action="store_true", help="Remove output dir before extracting.")
-    return parser
+def sync_bundle_files(index: dict[str, Any], previous: dict[str, Any] | None = None) -> list[str]:
+    """Extract non-chunk members that changed since `previous` and drop removed ones.
 
+    Chunk PNG/JSON members are left to `materialize_chunks()`. Returns the
+    names that were extracted.
+    """
+    extract_dir = Path(str(index["extract_dir"]))
+    members: dict[str, dict[str, int]] = index.get("members") or {}
+    chunk_files = {
+        Path(str(chunk[key])).relative_to(extract_dir).as_posix()
+        for chunk in (index.get("chunks") or {}).values()
+        for key in ("png", "manifest")
+    }
+    previous = previous if previous and previous.get("extract_dir") == str(extract_dir) else {}
+    for name in set(previous.get("members") or {}) - set(members):
+        target = (extract_dir / name).resolve()
+        if extract_dir in target.parents:
+            target.unlink(missing_ok=True)
+
+    stale = [
+        name
+        for name in members
+        if name != "manifest.json"
+        and name not in chunk_files
+        and not _member_current(extract_dir, name, members[name], previous)
+    ]
+    if stale:
+        try:
+            with zipfile.ZipFile(Path(str(index["source_zip"]))) as archive:
+                for name in stale:
+                    _extract_member(archive, name, extract_dir)
+        except zipfile.BadZipFile as exc:
+            raise FmgBundleError(f"Invalid bundle zip {index['source_zip']}: {exc}") from exc
+    if "atlas.png" in members:
+        index["atlas_png"] = str((extract_dir / "atlas.png").resolve())
+    return stale
+
+
+def _extract_member(archive: zipfile.ZipFile, name: str, extract_dir: Path) -> Path:
+    """Stream one zip member to its place under `extract_dir` via a temp file."""
+    target = (extract_dir / name).resolve()
+    if extract_dir.resolve() not in target.parents:
+        raise FmgBundleError(f"Refusing to extract {name!r} outside {extract_dir}")
+    try:
+        info = archive.getinfo(name)
+    except KeyError:
+        raise FmgBundleError(f"Missing bundle member: {name}") from None
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with archive.open(info) as source, temp.open("wb") as handle:
+            shutil.copyfileobj(source, handle, DOWNLOAD_BLOCK_BYTES)
+        os.replace(temp, target)
+    finally:
+        temp.unlink(missing_ok=True)
+    return target
+
+
+def _chunk_ready(chunk: Any) -> bool:
+    return (
+        isinstance(chunk, dict)
+        and chunk.get("extracted", True) is not False
+        and Path(str(chunk.get("png", ""))).is_file()
+        and Path(str(chunk.get("manifest", ""))).is_file()
+    )
+
+
+def materialize_chunks(
+    index: dict[str, Any],
+    chunk_ids: list[str] | None = None,
+    *,
+    index_path: Path | None = None,
+    previous: dict[str, Any] | None = None,
+) -> list[str]:
+    """Extract the listed chunks (all chunks and atlas.png if None) of a lazy index.
+
+    Fills in `legend_context` from the chunk manifest the first time a chunk
+    is extracted, updates `index` in place, rewrites `index_path` if anything
+    changed and returns the chunk ids that were extracted. Files that
+    `previous` recorded with the same CRC and that are still on disk are not
+    extracted again.
+    """
+    chunks = index.get("chunks")
+    if not isinstance(chunks, dict):
+        raise FmgBundleError("Index has no chunks")
+    wanted = list(chunks) if chunk_ids is None else list(chunk_ids)
+    missing = [chunk_id for chunk_id in wanted if chunk_id not in chunks]
+    if missing:
+        raise FmgBundleError(f"FMG chunk not found: {', '.join(missing)}")
+    pending = [chunk_id for chunk_id in wanted if not _chunk_ready(chunks[chunk_id])]
+    need_atlas = chunk_ids is None and not index.get("atlas_png")
+    if not pending and not need_atlas:
+        return []
+
+    zip_path = Path(str(index["source_zip"]))
+    extract_dir = Path(str(index["extract_dir"]))
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            for chunk_id in pending:
+                chunk = chunks[chunk_id]
+                for key in ("png", "manifest"):
+                    member = Path(str(chunk[key])).relative_to(extract_dir).as_posix()
+                    if previous and _member_current(
+                        extract_dir, member, (index.get("members") or {}).get(member), previous
+                    ):
+                        continue
+                    _extract_member(archive, member, extract_dir)
+                chunk["legend_context"] = build_legend_context(read_json(Path(str(chunk["manifest"]))))
+                chunk["extracted"] = True
+            if need_atlas and "atlas.png" in archive.namelist():
+                index["atlas_png"] = str(_extract_member(archive, "atlas.png", extract_dir))
+    except zipfile.BadZipFile as exc:
+        raise FmgBundleError(f"Invalid bundle zip {zip_path}: {exc}") from exc
+    except FileNotFoundError as exc:
+        raise FmgBundleError(f"Bundle zip not found: {zip_path}") from exc
+    if index_path is not None:
+        write_json(index_path, index)
+    return pending
+
+
+def _index_files_exist(index: dict[str, Any], chunk_ids: list[str] | None = None) -> bool:
+    chunks = index.get("chunks")
+    if not isinstance(chunks, dict):
+        return False
+    if chunk_ids is None:
+        return all(_chunk_ready(chunk) for chunk in chunks.values() if isinstance(chunk, dict))
+    return all(_chunk_ready(chunks.get(chunk_id)) for chunk_id in chunk_ids)
+
+
+def _trusted_digest(previous: dict[str, Any] | None, zip_path: Path) -> str | None:
+    """The recorded SHA-256 if the zip's path, size and mtime still match the index."""
+    if not previous or previous.get("source_zip") != str(zip_path) or not previous.get("bundle_sha256"):
+        return None
+    stat = zip_path.stat()
+    if previous.get("source_zip_stat") != {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}:
+        return None
+    return str(previous["bundle_sha256"])
 
-def main() -> None:
-    args = build_parser().parse_args()
-    if args.chunk_size != DEFAULT_CHUNK_SIZE:
-        raise SystemExit("SnowWeave FMG basemap integration currently requires fixed 4096px chunks.")
 
-    output_dir = args.output_dir.resolve()
-    if args.force and output_dir.exists():
+def _find_cached_index(digest: str, chunk_ids: list[str] | None) -> dict[str, Any] | None:
+    with _cache_lock:
+        candidates = [index for index in _index_cache.values() if index.get("bundle_sha256") == digest]
+    for index in candidates:
+        if _index_files_exist(index, chunk_ids):
+            return index
+    return None
+
+
+def unpack_atlas_bundle(
+    output_dir: Path,
+    *,
+    zip_path: Path | None = None,
+    backend_url: str = DEFAULT_FMG_BACKEND_URL,
+    seed: str | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    index_name: str = DEFAULT_INDEX_NAME,
+    force: bool = False,
+    progress: ProgressCallback | None = None,
+    chunk_ids: list[str] | None = None,
+) -> dict[str, Any]:
+    """Fetch or reuse a bundle, extract it and write the reference index.
+
+    Parsed indexes are cached in memory, keyed by index path, and reused by
+    bundle SHA-256: when the same bundle was already extracted in this process
+    and its files are still on disk, they are linked into `output_dir` and no
+    extraction happens. Rerunning on the same `output_dir` is incremental:
+    if the zip's size and mtime match the index its hash is trusted, and only
+    members whose CRC-32 changed are extracted again, with `legend_context`
+    rebuilt for the affected chunks only. `force` removes `output_dir` first
+    and always re-extracts. With `chunk_ids`, only `manifest.json` and those
+    chunks are extracted; a later call for other chunks adds them to the same
+    directory.
+
+    Without `zip_path` the bundle is downloaded to `output_dir/atlas-bundle.zip`.
+    For a seeded bundle a download there from the same backend URL is reused
+    (pass `force` to fetch again), and an interrupted one is resumed; an unseeded request always
+    fetches, since the backend generates a new map each time.
+    """
+    output_dir = output_dir.resolve()
+    if force and output_dir.exists():
         shutil.rmtree(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    zip_path = args.zip
     if zip_path:
         zip_path = zip_path.resolve()
         if not zip_path.exists():
-            raise SystemExit(f"Bundle zip not found: {zip_path}")
+            raise FmgBundleError(f"Bundle zip not found: {zip_path}")
+    else:
+        zip_path = output_dir / "atlas-bundle.zip"
+        source_path = zip_path.with_name(zip_path.name + ".source.json")
+        url = _bundle_url(backend_url, seed, chunk_size)
+        source = read_json(source_path) if source_path.is_file() else {}
+        # A seeded bundle is deterministic, so an earlier download of the same URL is reused.
+        if not (seed and zip_path.is_file() and source.get("url") == url):
+            source_path.unlink(missing_ok=True)
+            fetch_bundle(
+                backend_url=backend_url,
+                seed=seed,
+                chunk_size=chunk_size,
+                output_zip=zip_path,
+                progress=progress,
+            )
+            write_json(source_path, {"url": url})
+
+    output_index = output_dir / index_name
+    previous = read_json(output_index) if output_index.is_file() and not force else None
+    digest = _trusted_digest(previous, zip_path) or bundle_sha256(zip_path)
+    if (
+        previous
+        and previous.get("bundle_sha256") == digest
+        and previous.get("extract_dir") == str(output_dir)
+        and previous.get("members")
+        and _index_files_exist(previous, chunk_ids)
+        and (chunk_ids is not None or not previous.get("members", {}).get("atlas.png") or previous.get("atlas_png"))
+    ):
+        # Unchanged bundle, files still in place: nothing to read or write.
+        with _cache_lock:
+            _index_cache[str(output_index)] = previous
+        return json.loads(json.dumps(previous))
+    if not force:
+        cached = _find_cached_index(digest, chunk_ids)
+        if cached is not None and cached.get("extract_dir") != str(output_dir):
+            # Link the other directory's files here, so the index never points outside output_dir.
+            index = link_cached_bundle(Path(str(cached["extract_dir"])), cached, output_dir, index_name=index_name)
+            index.pop("cache_dir", None)
+            stat = zip_path.stat()
+            index["source_zip"] = str(zip_path)
+            index["source_zip_stat"] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            write_json(output_index, index)
+            with _cache_lock:
+                _index_cache[str(output_index)] = index
+            return json.loads(json.dumps(index))
+
+    if previous and previous.get("extract_dir") != str(output_dir):
+        previous = None
+    index = build_lazy_index(zip_path, output_dir, output_index, seed=seed, bundle_digest=digest, previous=previous)
+    if chunk_ids is None:
+        sync_bundle_files(index, previous)
+    materialize_chunks(index, chunk_ids, index_path=output_index, previous=previous)
+    with _cache_lock:
+        _index_cache[str(output_index)] = index
+    return json.loads(json.dumps(index))
+
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    """Exclusive lock on `path`, shared by threads and processes on this host."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a+b") as handle:
+        if os.name == "nt":
+            import msvcrt
+
+            while True:
+                handle.seek(0)
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ~10 seconds; keep waiting.
+                    continue
+            try:
+                yield
+            finally:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def _tree_size(path: Path) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += (Path(root) / name).stat().st_size
+            except OSError:
+                continue
+    return total
+
+
+def _link_or_copy(source: Path, target: Path) -> str:
+    """Hardlink `source` to `target`, falling back to a symlink, then a copy."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if target.exists() or target.is_symlink():
+        target.unlink()
+    try:
+        os.link(source, target)
+        return "hardlink"
+    except OSError:
+        pass
+    try:
+        target.symlink_to(source)
+        return "symlink"
+    except OSError:
+        shutil.copy2(source, target)
+        return "copy"
+
+
+def _download_name(*, backend_url: str, seed: str, chunk_size: int) -> str:
+    key = hashlib.sha256(f"{backend_url.rstrip('/')}\n{seed}\n{chunk_size}".encode("utf-8")).hexdigest()
+    return f"seed-{key[:24]}-{chunk_size}.zip"
+
+
+def cached_bundle_zip(
+    cache_root: Path,
+    *,
+    backend_url: str = DEFAULT_FMG_BACKEND_URL,
+    seed: str | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    refresh: bool = False,
+    progress: ProgressCallback | None = None,
+    expected_sha256: str | None = None,
+) -> Path:
+    """Fetch the bundle for (seed, chunk_size) once and reuse it afterwards.
+
+    Without a seed the backend generates a new map on every request, so the
+    download is kept under a unique name, never resumed and never reused.
+    An interrupted seeded download leaves a `.part` file that the next call
+    resumes.
+    """
+    downloads = cache_root / "downloads"
+    if not seed:
+        return fetch_bundle(
+            backend_url=backend_url,
+            seed=None,
+            chunk_size=chunk_size,
+            output_zip=downloads / f"unseeded-{uuid.uuid4().hex}-{chunk_size}.zip",
+            progress=progress,
+            expected_sha256=expected_sha256,
+            resume=False,
+        )
+    target = downloads / _download_name(backend_url=backend_url, seed=seed, chunk_size=chunk_size)
+    sidecar = target.with_name(target.name + ".sha256.json")
+    with _file_lock(target.with_suffix(".lock")):
+        if target.is_file() and not refresh:
+            digest = _read_digest_record(target, sidecar)
+            os.utime(target)
+            if digest:
+                _write_digest_record(target, sidecar, digest)
+            return target
+        fetch_bundle(
+            backend_url=backend_url,
+            seed=seed,
+            chunk_size=chunk_size,
+            output_zip=target,
+            progress=progress,
+            expected_sha256=expected_sha256,
+            resume=not refresh,
+        )
+        _write_digest_record(target, sidecar, bundle_sha256(target))
+    return target
+
+
+def _read_digest_record(target: Path, record: Path) -> str | None:
+    """SHA-256 recorded at download time, if the zip's size and mtime still match."""
+    try:
+        recorded = read_json(record)
+        stat = target.stat()
+    except (OSError, ValueError):
+        return None
+    if (recorded.get("size"), recorded.get("mtime_ns")) != (stat.st_size, stat.st_mtime_ns):
+        return None
+    return str(recorded.get("sha256") or "") or None
+
+
+def _write_digest_record(target: Path, record: Path, digest: str) -> None:
+    """Record the zip's digest next to it and seed the in-process digest cache,
+    so later processes reusing the download do not hash the whole zip again."""
+    stat = target.stat()
+    write_json(record, {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest})
+    with _cache_lock:
+        _digest_cache[str(target.resolve())] = (stat.st_size, stat.st_mtime_ns, digest)
+
+
+def ensure_cached_bundle(
+    cache_root: Path,
+    zip_path: Path,
+    *,
+    seed: str | None = None,
+    index_name: str = DEFAULT_INDEX_NAME,
+    chunk_ids: list[str] | None = None,
+) -> tuple[Path, dict[str, Any]]:
+    """Make `cache_root/bundles/<sha256>` hold the requested chunks and return (dir, index).
+
+    The entry starts as a lazy index built from `manifest.json`; chunks (all
+    of them if `chunk_ids` is None) are extracted into it on first request.
+    Everything happens under the bundle's file lock, files are published with
+    renames and the completion marker is written last, so concurrent tasks
+    either wait for the extraction or reuse its result.
+    """
+    cache_root = cache_root.resolve()
+    digest = bundle_sha256(zip_path)
+    bundle_dir = cache_root / "bundles" / digest
+    index_path = bundle_dir / index_name
+    marker = bundle_dir / CACHE_COMPLETE_MARKER
+
+    with _cache_lock:
+        cached = _index_cache.get(str(index_path))
+    if cached is not None and marker.is_file() and _index_files_exist(cached, chunk_ids):
+        os.utime(marker)
+        return bundle_dir, json.loads(json.dumps(cached))
+
+    with _file_lock(bundle_dir.with_name(f"{digest}.lock")):
+        if marker.is_file() and index_path.is_file():
+            index = read_json(index_path)
+            # Same digest, same content: extract from whichever copy exists now.
+            index["source_zip"] = str(zip_path.resolve())
+        else:
+            if bundle_dir.exists():
+                shutil.rmtree(bundle_dir)
+            bundle_dir.mkdir(parents=True)
+            index = build_lazy_index(zip_path, bundle_dir, index_path, seed=seed, bundle_digest=digest)
+        if materialize_chunks(index, chunk_ids, index_path=index_path) or not marker.is_file():
+            write_json(marker, {"bundle_sha256": digest, "bytes": _tree_size(bundle_dir), "created_at": time.time()})
+        os.utime(marker)
+
+    with _cache_lock:
+        _index_cache[str(index_path)] = index
+    return bundle_dir, json.loads(json.dumps(index))
+
+
+def _reroot(value: Any, source: str, target: str) -> Any:
+    if isinstance(value, dict):
+        return {key: _reroot(item, source, target) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_reroot(item, source, target) for item in value]
+    if isinstance(value, str) and value.startswith(source):
+        return target + value[len(source):]
+    return value
+
+
+def link_cached_bundle(
+    bundle_dir: Path,
+    index: dict[str, Any],
+    output_dir: Path,
+    *,
+    index_name: str = DEFAULT_INDEX_NAME,
+) -> dict[str, Any]:
+    """Link the files an index refers to into `output_dir` and write its own index.
+
+    Hardlinks keep a task's reference alive even after the cache entry is
+    evicted; symlinks and copies are fallbacks for filesystems without them.
+    """
+    bundle_dir = bundle_dir.resolve()
+    output_dir = output_dir.resolve()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = [Path(str(index.get("manifest", "")))]
+    if index.get("atlas_png"):
+        paths.append(Path(str(index["atlas_png"])))
+    for chunk in (index.get("chunks") or {}).values():
+        if isinstance(chunk, dict):
+            paths.extend(Path(str(chunk[key])) for key in ("png", "manifest") if chunk.get(key))
+    for source in paths:
+        try:
+            relative = source.resolve().relative_to(bundle_dir)
+        except ValueError:
+            continue
+        if source.is_file():
+            _link_or_copy(source, output_dir / relative)
+
+    task_index = _reroot(index, str(bundle_dir), str(output_dir))
+    task_index["cache_dir"] = str(bundle_dir)
+    write_json(output_dir / index_name, task_index)
+    return task_index
+
+
+def prune_bundle_cache(cache_root: Path, max_bytes: int, *, keep: set[str] | None = None) -> dict[str, int]:
+    """Evict least recently used bundles and downloads until the cache fits `max_bytes`."""
+    keep = keep or set()
+    entries: list[tuple[float, int, Path]] = []
+    for bundle_dir in (cache_root / "bundles").glob("*"):
+        marker = bundle_dir / CACHE_COMPLETE_MARKER
+        if not bundle_dir.is_dir() or bundle_dir.name.startswith(".") or not marker.is_file():
+            continue
+        try:
+            size = int(read_json(marker).get("bytes") or 0) or _tree_size(bundle_dir)
+            entries.append((marker.stat().st_mtime, size, bundle_dir))
+        except (OSError, ValueError):
+            continue
+    for download in (cache_root / "downloads").glob("*.zip"):
+        try:
+            stat = download.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, download))
+
+    total = sum(size for _mtime, size, _path in entries)
+    removed = 0
+    freed = 0
+    for _mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path.name in keep or path.stem in keep:
+            continue
+        lock_path = path.with_name(f"{path.name}.lock") if path.is_dir() else path.with_suffix(".lock")
+        with _file_lock(lock_path):
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+                with _cache_lock:
+                    for key in [key for key in _index_cache if Path(key).parent == path]:
+                        del _index_cache[key]
+            else:
+                path.unlink(missing_ok=True)
+                path.with_name(path.name + ".sha256.json").unlink(missing_ok=True)
+        total -= size
+        freed += size
+        removed += 1
+    return {"removed": removed, "freed_bytes": freed, "total_bytes": total}
+
+
+def prepare_cached_reference(
+    output_dir: Path,
+    *,
+    cache_root: Path,
+    zip_path: Path | None = None,
+    backend_url: str = DEFAULT_FMG_BACKEND_URL,
+    seed: str | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    index_name: str = DEFAULT_INDEX_NAME,
+    max_cache_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+    refresh: bool = False,
+    progress: ProgressCallback | None = None,
+    chunk_ids: list[str] | None = None,
+) -> dict[str, Any]:
+    """Like `unpack_atlas_bundle()`, but through the shared bundle cache.
+
+    The bundle is fetched at most once per (seed, chunk_size), each chunk is
+    extracted at most once per zip SHA-256, and `output_dir` only receives
+    links. With `chunk_ids`, only those chunks are extracted.
+    """
+    cache_root = cache_root.resolve()
+    if zip_path:
+        zip_path = zip_path.resolve()
+        if not zip_path.exists():
+            raise FmgBundleError(f"Bundle zip not found: {zip_path}")
     else:
-        zip_path = fetch_bundle(
-            backend_url=args.backend_url,
-            seed=args.seed,
-            chunk_size=args.chunk_size,
-            output_zip=output_dir / "atlas-bundle.zip",
+        zip_path = cached_bundle_zip(
+            cache_root,
+            backend_url=backend_url,
+            seed=seed,
+            chunk_size=chunk_size,
+            refresh=refresh,
+            progress=progress,
         )
 
-    extract_bundle(zip_path, output_dir)
-    index = build_index(output_dir, output_dir / args.index_name, seed=args.seed, source_zip=zip_path)
+    bundle_dir, index = ensure_cached_bundle(
+        cache_root, zip_path, seed=seed, index_name=index_name, chunk_ids=chunk_ids
+    )
+    output_dir = output_dir.resolve()
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+    task_index = link_cached_bundle(bundle_dir, index, output_dir, index_name=index_name)
+    prune_bundle_cache(cache_root, max_cache_bytes, keep={bundle_dir.name, zip_path.name})
+    return task_index
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--zip", type=Path, help="Existing atlas bundle zip. If omitted, the script fetches one.")
+    parser.add_argument("--backend-url", default=DEFAULT_FMG_BACKEND_URL)
+    parser.add_argument("--seed")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--max-chunk-size", type=int, default=MAX_CHUNK_SIZE)
+    parser.add_argument("--output-dir", type=Path, required=True)
+    parser.add_argument("--index-name", default=DEFAULT_INDEX_NAME)
+    parser.add_argument(
+        "--force", action="store_true", help="Remove output dir (including a downloaded zip) before extracting."
+    )
+    parser.add_argument(
+        "--chunk-id",
+        action="append",
+        dest="chunk_ids",
+        help="Extract only this chunk (repeatable). Other chunks stay in the zip until requested.",
+    )
+    parser.add_argument(
+        "--cache-root",
+        type=Path,
+        help="Shared bundle cache. Output dir then receives links into the cache instead of an extraction.",
+    )
+    parser.add_argument("--cache-max-bytes", type=int, default=DEFAULT_CACHE_MAX_BYTES)
+    return parser
+
+
+def print_progress(done: int, total: int | None) -> None:
+    if total:
+        print(f"[FMG] download {done / 1024**2:.1f}/{total / 1024**2:.1f} MiB", file=sys.stderr, flush=True)
+    else:
+        print(f"[FMG] download {done / 1024**2:.1f} MiB", file=sys.stderr, flush=True)
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    try:
+        check_chunk_size(args.chunk_size, args.max_chunk_size)
+        if args.cache_root:
+            index = prepare_cached_reference(
+                args.output_dir,
+                cache_root=args.cache_root,
+                zip_path=args.zip,
+                backend_url=args.backend_url,
+                seed=args.seed,
+                chunk_size=args.chunk_size,
+                index_name=args.index_name,
+                max_cache_bytes=args.cache_max_bytes,
+                refresh=args.force,
+                progress=print_progress,
+                chunk_ids=args.chunk_ids,
+            )
+        else:
+            index = unpack_atlas_bundle(
+                args.output_dir,
+                zip_path=args.zip,
+                backend_url=args.backend_url,
+                seed=args.seed,
+                chunk_size=args.chunk_size,
+                index_name=args.index_name,
+                force=args.force,
+                progress=print_progress,
+                chunk_ids=args.chunk_ids,
+            )
+    except FmgBundleError as exc:
+        raise SystemExit(str(exc)) from None
     print(json.dumps(index, ensure_ascii=False, indent=2))
 
 
@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
-"""Run the SnowWeave full map pipeline from one FMG 4K chunk reference."""
+"""Run the SnowWeave full map pipeline from one FMG 4K chunk reference.
+
+With `--all-chunks`, every chunk of the atlas is generated in wavefront order:
+chunks on one anti-diagonal run concurrently, and each chunk's reference is
+stitched from the basemaps of the overlapping chunks generated before it.
+"""
 
 from __future__ import annotations
 
 import argparse
 import json
 import os
-import subprocess
 import sys
 import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import ExitStack
 from pathlib import Path
 from typing import Any
 
@@ -17,16 +23,31 @@ SNOWWEAVE_ROOT = Path(__file__).resolve().parents[1]
 ASF_SCRIPTS = SNOWWEAVE_ROOT / "dependencies" / "agent-sprite-forge" / "scripts"
 DEFAULT_FMG_BACKEND_URL = "http://127.0.0.1:8765"
 DEFAULT_OUTPUT_ROOT = SNOWWEAVE_ROOT / "out" / "maps"
+DEFAULT_FMG_CACHE_ROOT = SNOWWEAVE_ROOT / "out" / "fmg_refs"
+DEFAULT_MODEL_REF_ROOT = SNOWWEAVE_ROOT / "out" / "model_refs"
 DEFAULT_CHUNK_SIZE = 4096
+CHECKPOINT_NAME = "chunk_checkpoint.json"
 
 sys.path.insert(0, str(ASF_SCRIPTS))
 import asf  # type: ignore  # noqa: E402
 
+sys.path.insert(0, str(SNOWWEAVE_ROOT / "scripts"))
+import fmg_model_reference  # noqa: E402
+import fmg_stitch_chunk_reference as fmg_stitch  # noqa: E402
+import fmg_unpack_atlas_bundle as fmg_unpack  # noqa: E402
+
 
 def read_json(path: Path) -> dict[str, Any]:
     return json.loads(path.read_text(encoding="utf-8"))
 
 
+def write_json(path: Path, data: dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_name(f".{path.name}.tmp")
+    temp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(temp, path)
+
+
 def api_key_from_env() -> str | None:
     for name in ("OPENROUTER_API_KEY", "NAGA_API_KEY", "OPENAI_API_KEY"):
         value = os.environ.get(name)
@@ -35,27 +56,24 @@ def api_key_from_env() -> str | None:
     return None
 
 
-def run_unpack(args: argparse.Namespace, output_dir: Path) -> Path:
+def run_unpack(args: argparse.Namespace, output_dir: Path, chunk_ids: list[str] | None) -> Path:
     ref_dir = output_dir / "fmg-reference"
-    command = [
-        sys.executable,
-        str(SNOWWEAVE_ROOT / "scripts" / "fmg_unpack_atlas_bundle.py"),
-        "--output-dir",
-        str(ref_dir),
-        "--backend-url",
-        args.fmg_backend_url,
-        "--chunk-size",
-        str(args.fmg_chunk_size),
-        "--force",
-    ]
-    if args.fmg_seed:
-        command.extend(["--seed", args.fmg_seed])
-    if args.fmg_bundle_zip:
-        command.extend(["--zip", str(args.fmg_bundle_zip)])
-
-    print("[FMG] unpack command:", " ".join(command), flush=True)
-    subprocess.check_call(command)
-    return ref_dir / "fmg_reference_index.json"
+    print(f"[FMG] unpack bundle -> {ref_dir}", flush=True)
+    try:
+        fmg_unpack.prepare_cached_reference(
+            ref_dir,
+            cache_root=args.fmg_cache_root,
+            zip_path=args.fmg_bundle_zip,
+            backend_url=args.fmg_backend_url,
+            seed=args.fmg_seed,
+            chunk_size=args.fmg_chunk_size,
+            max_cache_bytes=args.fmg_cache_max_bytes,
+            progress=fmg_unpack.print_progress,
+            chunk_ids=chunk_ids,
+        )
+    except fmg_unpack.FmgBundleError as exc:
+        raise SystemExit(str(exc)) from None
+    return ref_dir / fmg_unpack.DEFAULT_INDEX_NAME
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -69,9 +87,30 @@ def build_parser() -> argparse.ArgumentParser:
     parser.add_argument("--prompt-context", default="")
     parser.add_argument("--fmg-seed")
     parser.add_argument("--fmg-chunk-id", default="chunk_0_0")
+    parser.add_argument(
+        "--all-chunks",
+        action="store_true",
+        help="Generate every chunk in wavefront order. Re-running with the same output dir resumes.",
+    )
+    parser.add_argument("--chunk-workers", type=int, default=2, help="Chunks generated concurrently with --all-chunks.")
     parser.add_argument("--fmg-chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--fmg-max-chunk-size", type=int, default=fmg_unpack.MAX_CHUNK_SIZE)
     parser.add_argument("--fmg-backend-url", default=DEFAULT_FMG_BACKEND_URL)
     parser.add_argument("--fmg-bundle-zip", type=Path)
+    parser.add_argument("--fmg-cache-root", type=Path, default=DEFAULT_FMG_CACHE_ROOT)
+    parser.add_argument("--fmg-cache-max-bytes", type=int, default=fmg_unpack.DEFAULT_CACHE_MAX_BYTES)
+    parser.add_argument(
+        "--reference-format",
+        choices=["webp", "jpeg", "png"],
+        default="png",
+        help="png sends the original FMG reference; webp/jpeg send a cached downscaled copy instead.",
+    )
+    parser.add_argument("--reference-max-edge", type=int, default=0, help="0 uses the per-model default.")
+    parser.add_argument("--reference-quality", type=int, default=fmg_model_reference.DEFAULT_QUALITY)
+    parser.add_argument("--reference-cache-root", type=Path, default=DEFAULT_MODEL_REF_ROOT)
+    parser.add_argument(
+        "--reference-cache-max-bytes", type=int, default=fmg_model_reference.DEFAULT_CACHE_MAX_BYTES
+    )
     parser.add_argument("--sub-diff-threshold", type=float, default=30.0)
     parser.add_argument("--sub-min-component-area", type=int, default=100)
     parser.add_argument("--sub-no-shadow-suppression", action="store_true")
@@ -88,65 +127,251 @@ def build_parser() -> argparse.ArgumentParser:
     return parser
 
 
+def generate_chunk(
+    args: argparse.Namespace,
+    *,
+    output_dir: Path,
+    index_path: Path,
+    chunk_id: str,
+    chunk: dict[str, Any],
+    reference_image: Path,
+    stitch_report: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    with ExitStack() as held:
+        model_image = reference_image
+        model_reference = None
+        if args.reference_format != "png":
+            settings = {
+                "max_edge": args.reference_max_edge or fmg_model_reference.max_edge_for_model(args.model),
+                "image_format": args.reference_format,
+                "quality": args.reference_quality,
+            }
+            # --all-chunks threads share the cache; the lease keeps other threads' prunes off this file.
+            held.enter_context(
+                fmg_model_reference.LEASES.hold(
+                    fmg_model_reference.reference_path(reference_image, args.reference_cache_root, **settings)
+                )
+            )
+            model_reference = fmg_model_reference.prepare_model_reference(
+                reference_image, args.reference_cache_root, **settings
+            )
+            if not model_reference["cached"]:
+                fmg_model_reference.LEASES.prune(args.reference_cache_root, args.reference_cache_max_bytes)
+            model_image = Path(model_reference["path"])
+        image_paths = [model_image, *args.image]
+        prompt_context = "\n\n".join(
+            text for text in [args.prompt_context.strip(), str(chunk.get("legend_context") or "").strip()] if text
+        )
+        fmg_reference: dict[str, Any] = {
+            "index_path": str(index_path.resolve()),
+            "chunk_id": chunk_id,
+            "chunk": chunk,
+        }
+        if stitch_report is not None:
+            fmg_reference["stitch_report"] = stitch_report
+        if model_reference is not None:
+            fmg_reference["model_image"] = model_reference
+
+        print(f"[SnowWeave] {chunk_id}: fmg_reference={reference_image} model_image={model_image}", flush=True)
+        print(
+            f"[SnowWeave] {chunk_id}: starting ASF full pipeline: base -> dressed -> subtract props -> preview",
+            flush=True,
+        )
+
+        return asf.generate_map_pipeline(
+            prompt=args.prompt,
+            output_dir=output_dir,
+            image_paths=image_paths,
+            prompt_context=prompt_context,
+            reference_metadata={"fmg_reference": fmg_reference},
+            model=args.model,
+            map_mode=args.map_mode,
+            api_key=api_key_from_env(),
+            no_catalog=args.no_catalog,
+            timeout=args.timeout,
+            sub_diff_threshold=args.sub_diff_threshold,
+            sub_min_component_area=args.sub_min_component_area,
+            sub_no_shadow_suppression=args.sub_no_shadow_suppression,
+            sub_no_edge_delta=args.sub_no_edge_delta,
+            sub_edge_threshold=args.sub_edge_threshold,
+            sub_edge_grow_radius=args.sub_edge_grow_radius,
+            sub_edge_support_radius=args.sub_edge_support_radius,
+            sub_no_fill_holes=args.sub_no_fill_holes,
+            sub_matting_backend=args.sub_matting_backend,
+            sub_no_rembg_alpha_matting=args.sub_no_rembg_alpha_matting,
+            sub_no_constrain_rembg_to_diff_mask=args.sub_no_constrain_rembg_to_diff_mask,
+        )
+
+
+def load_checkpoint(chunk_dir: Path) -> dict[str, Any] | None:
+    path = chunk_dir / CHECKPOINT_NAME
+    if not path.is_file():
+        return None
+    checkpoint = read_json(path)
+    if checkpoint.get("status") != "completed" or not Path(str(checkpoint.get("base_image", ""))).is_file():
+        return None
+    return checkpoint
+
+
+def run_wavefront_chunk(
+    args: argparse.Namespace,
+    *,
+    root: Path,
+    index_path: Path,
+    index: dict[str, Any],
+    chunk_id: str,
+    generated: dict[str, Path],
+) -> Path:
+    """Stitch one chunk's reference from finished neighbours, generate it and checkpoint it."""
+    chunk_dir = root / chunk_id
+    chunk_dir.mkdir(parents=True, exist_ok=True)
+    chunk = index["chunks"][chunk_id]
+    reference_image = Path(str(chunk["png"]))
+    stitch_report = None
+    if generated:
+        stitched = chunk_dir / "fmg-reference-stitched.png"
+        stitch_report = fmg_stitch.stitch_chunk_reference(index, chunk_id, sorted(generated.items()), stitched)
+        reference_image = stitched
+
+    started = time.time()
+    result = generate_chunk(
+        args,
+        output_dir=chunk_dir,
+        index_path=index_path,
+        chunk_id=chunk_id,
+        chunk=chunk,
+        reference_image=reference_image,
+        stitch_report=stitch_report,
+    )
+    base_image = Path(str(result.get("base_image") or chunk_dir / "base" / "base-1.png"))
+    if not base_image.is_file():
+        raise RuntimeError(f"{chunk_id}: pipeline finished without a basemap ({base_image})")
+    write_json(
+        chunk_dir / CHECKPOINT_NAME,
+        {
+            "version": 1,
+            "status": "completed",
+            "chunk_id": chunk_id,
+            "base_image": str(base_image.resolve()),
+            "stitched_from": sorted(generated),
+            "reference_image": str(reference_image.resolve()),
+            "duration_seconds": round(time.time() - started, 1),
+            "completed_at": time.time(),
+        },
+    )
+    return base_image
+
+
+def run_all_chunks(args: argparse.Namespace, root: Path) -> dict[str, Any]:
+    """Generate every chunk, starting each one as soon as its overlap dependencies finish.
+
+    Completed chunks are recorded in `<chunk>/chunk_checkpoint.json` and
+    skipped on the next run, so an interrupted world resumes where it stopped.
+    """
+    index_path = run_unpack(args, root, None)
+    index = read_json(index_path)
+    chunks = index.get("chunks") if isinstance(index.get("chunks"), dict) else {}
+    plan = fmg_unpack.plan_wavefront(chunks)
+    order: list[str] = plan["generation_order"]
+    dependencies: dict[str, list[str]] = plan["dependencies"]
+    print(f"[SnowWeave] {len(order)} chunks in {len(plan['waves'])} waves, workers={args.chunk_workers}", flush=True)
+
+    done: dict[str, Path] = {}
+    for chunk_id in order:
+        checkpoint = load_checkpoint(root / chunk_id)
+        if checkpoint:
+            done[chunk_id] = Path(str(checkpoint["base_image"]))
+            print(f"[SnowWeave] {chunk_id}: resumed from checkpoint", flush=True)
+
+    pending = [chunk_id for chunk_id in order if chunk_id not in done]
+    failed: dict[str, str] = {}
+    running: dict[Future[Path], str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, args.chunk_workers), thread_name_prefix="fmg-chunk") as pool:
+        while pending or running:
+            for chunk_id in list(pending):
+                deps = dependencies.get(chunk_id, [])
+                blocked = [dep for dep in deps if dep in failed]
+                if blocked:
+                    pending.remove(chunk_id)
+                    failed[chunk_id] = f"blocked by {', '.join(blocked)}"
+                    print(f"[SnowWeave] {chunk_id}: skipped, {failed[chunk_id]}", flush=True)
+                    continue
+                if len(running) >= max(1, args.chunk_workers) or any(dep not in done for dep in deps):
+                    continue
+                pending.remove(chunk_id)
+                future = pool.submit(
+                    run_wavefront_chunk,
+                    args,
+                    root=root,
+                    index_path=index_path,
+                    index=index,
+                    chunk_id=chunk_id,
+                    generated={dep: done[dep] for dep in deps},
+                )
+                running[future] = chunk_id
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                chunk_id = running.pop(future)
+                try:
+                    done[chunk_id] = future.result()
+                    print(f"[SnowWeave] {chunk_id}: completed ({len(done)}/{len(order)})", flush=True)
+                except Exception as exc:
+                    failed[chunk_id] = f"{type(exc).__name__}: {exc}"
+                    print(f"[SnowWeave] {chunk_id}: failed: {failed[chunk_id]}", flush=True)
+
+    summary = {
+        "version": 1,
+        "index_path": str(index_path.resolve()),
+        "waves": plan["waves"],
+        "dependencies": dependencies,
+        "completed": {chunk_id: str(path) for chunk_id, path in done.items()},
+        "failed": failed,
+    }
+    write_json(root / "wavefront.json", summary)
+    return summary
+
+
 def main() -> None:
     args = build_parser().parse_args()
-    if args.fmg_chunk_size != DEFAULT_CHUNK_SIZE:
-        raise SystemExit("FMG SnowWeave pipeline currently requires fixed 4096px chunks.")
+    try:
+        fmg_unpack.check_chunk_size(args.fmg_chunk_size, args.fmg_max_chunk_size)
+    except fmg_unpack.FmgBundleError as exc:
+        raise SystemExit(str(exc)) from exc
 
     output_dir = args.output_dir
     if output_dir is None:
-        output_name = args.output_name or f"fmg-{args.fmg_chunk_id}-{time.strftime('%Y%m%d-%H%M%S')}"
+        default_name = "fmg-world" if args.all_chunks else f"fmg-{args.fmg_chunk_id}"
+        output_name = args.output_name or f"{default_name}-{time.strftime('%Y%m%d-%H%M%S')}"
         output_dir = DEFAULT_OUTPUT_ROOT / output_name
     output_dir = output_dir.resolve()
     output_dir.mkdir(parents=True, exist_ok=True)
 
     print(f"[SnowWeave] output_dir={output_dir}", flush=True)
-    print(f"[SnowWeave] chunk={args.fmg_chunk_id} size={args.fmg_chunk_size}", flush=True)
+    if args.all_chunks:
+        summary = run_all_chunks(args, output_dir)
+        print(json.dumps(summary, ensure_ascii=False, indent=2), flush=True)
+        if summary["failed"]:
+            raise SystemExit(f"{len(summary['failed'])} chunk(s) did not complete; re-run to resume.")
+        print("[SnowWeave] completed", flush=True)
+        return
 
-    index_path = run_unpack(args, output_dir)
+    print(f"[SnowWeave] chunk={args.fmg_chunk_id} size={args.fmg_chunk_size}", flush=True)
+    index_path = run_unpack(args, output_dir, [args.fmg_chunk_id])
     index = read_json(index_path)
     chunks = index.get("chunks") if isinstance(index.get("chunks"), dict) else {}
     chunk = chunks.get(args.fmg_chunk_id)
     if not isinstance(chunk, dict):
         raise SystemExit(f"Chunk not found in FMG index: {args.fmg_chunk_id}")
 
-    fmg_image = Path(str(chunk["png"]))
-    image_paths = [fmg_image, *args.image]
-    prompt_context = "\n\n".join(
-        text for text in [args.prompt_context.strip(), str(chunk.get("legend_context") or "").strip()] if text
-    )
-
-    print(f"[SnowWeave] fmg_reference={fmg_image}", flush=True)
-    print("[SnowWeave] starting ASF full pipeline: base -> dressed -> subtract props -> preview", flush=True)
-
-    result = asf.generate_map_pipeline(
-        prompt=args.prompt,
+    result = generate_chunk(
+        args,
         output_dir=output_dir,
-        image_paths=image_paths,
-        prompt_context=prompt_context,
-        reference_metadata={
-            "fmg_reference": {
-                "index_path": str(index_path.resolve()),
-                "chunk_id": args.fmg_chunk_id,
-                "chunk": chunk,
-            }
-        },
-        model=args.model,
-        map_mode=args.map_mode,
-        api_key=api_key_from_env(),
-        no_catalog=args.no_catalog,
-        timeout=args.timeout,
-        sub_diff_threshold=args.sub_diff_threshold,
-        sub_min_component_area=args.sub_min_component_area,
-        sub_no_shadow_suppression=args.sub_no_shadow_suppression,
-        sub_no_edge_delta=args.sub_no_edge_delta,
-        sub_edge_threshold=args.sub_edge_threshold,
-        sub_edge_grow_radius=args.sub_edge_grow_radius,
-        sub_edge_support_radius=args.sub_edge_support_radius,
-        sub_no_fill_holes=args.sub_no_fill_holes,
-        sub_matting_backend=args.sub_matting_backend,
-        sub_no_rembg_alpha_matting=args.sub_no_rembg_alpha_matting,
-        sub_no_constrain_rembg_to_diff_mask=args.sub_no_constrain_rembg_to_diff_mask,
+        index_path=index_path,
+        chunk_id=args.fmg_chunk_id,
+        chunk=chunk,
+        reference_image=Path(str(chunk["png"])),
     )
     print("[SnowWeave] completed", flush=True)
     print(json.dumps(result, ensure_ascii=False, indent=2), flush=True)
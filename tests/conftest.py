@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+# The API imports its sibling modules and scripts/ by path rather than as a package.
+SNOWWEAVE_ROOT = Path(__file__).resolve().parent.parent
+for path in (SNOWWEAVE_ROOT, SNOWWEAVE_ROOT / "scripts"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
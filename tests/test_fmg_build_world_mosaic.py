@@ -0,0 +1,84 @@
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from fmg_build_world_mosaic import build_mosaic, plan_ownership
+
+SIZE = 100
+STEP = 80
+
+
+def _index(columns=3, rows=2):
+    return {
+        "chunks": {
+            f"chunk_{column}_{row}": {
+                "origin": {"x": column * STEP, "y": row * STEP},
+                "size": {"width": SIZE, "height": SIZE},
+            }
+            for row in range(rows)
+            for column in range(columns)
+        }
+    }
+
+
+def _color(column, row):
+    return (60 + column * 80, 40 + row * 150, 90, 255)
+
+
+def test_ownership_cuts_at_the_middle_of_each_overlap():
+    plan = plan_ownership(_index()["chunks"])
+
+    assert plan["x_cuts"] == [0, 90, 170, 260]
+    assert plan["y_cuts"] == [0, 90, 180]
+    assert plan["grid"][(2, 1)] == "chunk_2_1"
+    assert plan["cores"]["chunk_1_1"] == {"xMin": 90, "yMin": 90, "xMax": 170, "yMax": 180}
+    # Cores tile the world exactly: no gaps, no double ownership.
+    area = sum((core["xMax"] - core["xMin"]) * (core["yMax"] - core["yMin"]) for core in plan["cores"].values())
+    assert area == 260 * 180
+
+
+def test_mosaic_levels_tiles_and_ownership(tmp_path):
+    index = _index()
+    images = {}
+    for chunk_id in index["chunks"]:
+        _, column, row = chunk_id.split("_")
+        if chunk_id == "chunk_2_0":
+            continue
+        path = tmp_path / "chunks" / f"{chunk_id}.png"
+        path.parent.mkdir(exist_ok=True)
+        Image.new("RGB", (SIZE, SIZE), _color(int(column), int(row))[:3]).save(path)
+        images[chunk_id] = path
+    output = tmp_path / "mosaic"
+
+    manifest = build_mosaic(index, images, output, tile_size=64)
+
+    assert manifest["world"] == {"x": 0, "y": 0, "width": 260, "height": 180}
+    assert manifest["max_level"] == 3
+    assert [(level["width"], level["height"], level["columns"], level["rows"]) for level in manifest["levels"]] == [
+        (33, 23, 1, 1),
+        (65, 45, 2, 1),
+        (130, 90, 3, 2),
+        (260, 180, 5, 3),
+    ]
+    assert manifest["missing_chunks"] == ["chunk_2_0"]
+    assert manifest["chunks_decoded"] == len(images)
+    for level in manifest["levels"]:
+        for ty in range(level["rows"]):
+            for tx in range(level["columns"]):
+                with Image.open(output / "tiles" / str(level["level"]) / f"{tx}_{ty}.png") as tile:
+                    assert tile.size == (
+                        min(64, level["width"] - tx * 64),
+                        min(64, level["height"] - ty * 64),
+                    )
+
+    def world_pixel(x, y):
+        with Image.open(output / "tiles" / "3" / f"{x // 64}_{y // 64}.png") as tile:
+            return tile.convert("RGBA").getpixel((x % 64, y % 64))
+
+    # Either side of the x cut at 90 and the y cut at 90, inside the 80..100 overlaps.
+    assert world_pixel(89, 10) == _color(0, 0)
+    assert world_pixel(90, 10) == _color(1, 0)
+    assert world_pixel(10, 89) == _color(0, 0)
+    assert world_pixel(10, 90) == _color(0, 1)
+    assert world_pixel(200, 10) == (0, 0, 0, 0)
+    assert world_pixel(200, 150) == _color(2, 1)
@@ -0,0 +1,64 @@
+import os
+from pathlib import Path
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from fmg_model_reference import ReferenceLeases, prepare_model_reference, prune_model_references, reference_path
+
+
+def _source(tmp_path, name, color):
+    path = tmp_path / f"{name}.png"
+    Image.new("RGB", (64, 48), color).save(path)
+    return path
+
+
+def test_prepare_uses_reference_path_and_reports_hits(tmp_path):
+    source = _source(tmp_path, "chunk", (10, 120, 30))
+    cache_root = tmp_path / "refs"
+
+    first = prepare_model_reference(source, cache_root, max_edge=32)
+    second = prepare_model_reference(source, cache_root, max_edge=32)
+
+    assert first["path"] == second["path"] == str(reference_path(source, cache_root, max_edge=32).resolve())
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert first["size"] == [32, 24]
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        reference_path(_source(tmp_path, "chunk", (0, 0, 0)), tmp_path, image_format="png")
+
+
+def test_prune_evicts_oldest_but_skips_kept_paths(tmp_path):
+    cache_root = tmp_path / "refs"
+    paths = []
+    for index in range(3):
+        reference = prepare_model_reference(_source(tmp_path, f"c{index}", (index * 80, 0, 0)), cache_root)
+        path = reference["path"]
+        os.utime(path, (1000 + index, 1000 + index))
+        paths.append(path)
+    sizes = [os.path.getsize(path) for path in paths]
+
+    report = prune_model_references(cache_root, sizes[2], keep=[Path(paths[0])])
+
+    assert os.path.exists(paths[0])
+    assert not os.path.exists(paths[1])
+    assert not os.path.exists(paths[2])
+    assert report["removed"] == 2
+    assert report["total_bytes"] == sizes[0]
+
+
+def test_leased_reference_survives_prune(tmp_path):
+    cache_root = tmp_path / "refs"
+    leases = ReferenceLeases()
+    source = _source(tmp_path, "chunk", (200, 200, 0))
+
+    with leases.hold(reference_path(source, cache_root)):
+        reference = prepare_model_reference(source, cache_root)
+        leases.prune(cache_root, 0)
+        assert os.path.exists(reference["path"])
+
+    leases.prune(cache_root, 0)
+    assert not os.path.exists(reference["path"])
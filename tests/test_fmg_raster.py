@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+ImageChops = pytest.importorskip("PIL.ImageChops")
+
+from fmg_raster import MappedRaster, UnsupportedPng, iter_png_bands, read_png_boxes
+
+
+def _noisy(mode, size, seed=0):
+    rng = random.Random(seed)
+    bands = len(Image.new(mode, (1, 1)).getbands())
+    noise = Image.frombytes(mode, size, bytes(rng.getrandbits(8) for _ in range(size[0] * size[1] * bands)))
+    gradient = Image.radial_gradient("L").resize(size)
+    return Image.blend(noise, Image.merge(mode, [gradient] * bands), 0.7)
+
+
+@pytest.fixture(params=["RGB", "RGBA", "L", "LA", "P"])
+def png(request, tmp_path):
+    image = _noisy("RGB", (83, 71)).quantize(32) if request.param == "P" else _noisy(request.param, (83, 71))
+    path = tmp_path / f"{request.param}.png"
+    image.save(path)
+    with Image.open(path) as reference:
+        reference.load()
+        yield path, reference.copy()
+
+
+def test_bands_reassemble_the_decoded_image(png):
+    path, reference = png
+    bands = list(iter_png_bands(path, band_rows=16))
+
+    assert [y0 for y0, _band in bands] == list(range(0, reference.height, 16))
+    for y0, band in bands:
+        expected = reference.crop((0, y0, reference.width, y0 + band.height))
+        assert band.convert("RGBA").tobytes() == expected.convert("RGBA").tobytes()
+
+
+def test_mapped_raster_from_png_matches_whole_decode(png):
+    path, reference = png
+    with MappedRaster.from_image_file(path, band_rows=16) as raster:
+        assert raster.read_band(0, raster.height).tobytes() == reference.convert("RGBA").tobytes()
+
+
+@pytest.mark.parametrize("size", [(37, 23), (61, 97), (200, 300)])
+def test_mapped_raster_resample_matches_whole_resize(png, size):
+    path, reference = png
+    with MappedRaster.from_image_file(path, size=size, band_rows=16) as raster:
+        got = raster.read_band(0, raster.height)
+    expected = reference.resize(size, Image.Resampling.LANCZOS).convert("RGBA")
+    # Premultiplied, so one level of rounding is not amplified by a tiny alpha.
+    difference = ImageChops.difference(got.convert("RGBa"), expected.convert("RGBa"))
+    assert max(high for _low, high in difference.getextrema()) <= 1
+
+
+def test_read_png_boxes_matches_crop(png):
+    path, reference = png
+    boxes = [(0, 0, 10, 10), (5, 17, 50, 60), (30, 40, 83, 71), (0, 68, 83, 73)]
+
+    crops = read_png_boxes(path, boxes, band_rows=7)
+
+    for box, crop in zip(boxes, crops):
+        assert crop.tobytes() == reference.crop(box).convert("RGBA").tobytes()
+
+
+def test_sixteen_bit_png_falls_back_to_whole_decode(tmp_path):
+    path = tmp_path / "deep.png"
+    Image.frombytes("I;16", (20, 10), bytes(400)).save(path)
+
+    with pytest.raises(UnsupportedPng):
+        next(iter_png_bands(path))
+    with MappedRaster.from_image_file(path, band_rows=4) as raster:
+        assert raster.size == (20, 10)
+    assert [crop.size for crop in read_png_boxes(path, [(0, 0, 5, 5)])] == [(5, 5)]
@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+import fmg_stitch_chunk_reference as stitch
+from fmg_stitch_chunk_reference import ChunkGrid, intersect, stitch_batch
+
+SIZE = 100
+STEP = 90
+COLORS = {"chunk_0_0": (255, 0, 0, 255), "chunk_1_0": (0, 0, 255, 255), "chunk_0_1": (0, 255, 0, 255)}
+FMG = (128, 128, 128, 255)
+
+
+def test_grid_overlaps_match_brute_force():
+    rng = random.Random(7)
+    rects = {}
+    for i in range(60):
+        x, y = rng.uniform(-500, 500), rng.uniform(-500, 500)
+        w, h = rng.uniform(1, 150), rng.uniform(1, 150)
+        rects[f"c{i}"] = {"xMin": x, "yMin": y, "xMax": x + w, "yMax": y + h}
+    grid = ChunkGrid(rects)
+
+    for _ in range(40):
+        x, y = rng.uniform(-600, 600), rng.uniform(-600, 600)
+        query = {"xMin": x, "yMin": y, "xMax": x + rng.uniform(1, 300), "yMax": y + rng.uniform(1, 300)}
+        expected = {chunk_id: intersect(query, rect) for chunk_id, rect in rects.items()}
+        expected = {chunk_id: overlap for chunk_id, overlap in expected.items() if overlap}
+        assert dict(grid.overlapping(query)) == expected
+
+
+def test_empty_grid_has_no_overlaps():
+    assert ChunkGrid({}).overlapping({"xMin": 0, "yMin": 0, "xMax": 10, "yMax": 10}) == []
+
+
+@pytest.fixture
+def grid_index(tmp_path):
+    chunks = {}
+    for row in range(2):
+        for column in range(2):
+            chunk_id = f"chunk_{column}_{row}"
+            png = tmp_path / "fmg" / f"{chunk_id}.png"
+            png.parent.mkdir(exist_ok=True)
+            Image.new("RGBA", (SIZE, SIZE), FMG).save(png)
+            chunks[chunk_id] = {
+                "png": str(png),
+                "origin": {"x": column * STEP, "y": row * STEP},
+                "size": {"width": SIZE, "height": SIZE},
+            }
+    generated = []
+    for chunk_id, color in COLORS.items():
+        path = tmp_path / "generated" / f"{chunk_id}.png"
+        path.parent.mkdir(exist_ok=True)
+        Image.new("RGBA", (SIZE, SIZE), color).save(path)
+        generated.append((chunk_id, path))
+    return {"chunks": chunks}, generated
+
+
+def _pixels(path):
+    with Image.open(path) as image:
+        image = image.convert("RGBA")
+        return {name: image.getpixel(xy) for name, xy in {
+            "corner": (5, 5), "top": (50, 5), "left": (5, 50), "inside": (50, 50),
+        }.items()}
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_later_sources_win_where_they_overlap(tmp_path, grid_index, reverse):
+    index, generated = grid_index
+    generated = generated[::-1] if reverse else generated
+    output = tmp_path / "out" / "chunk_1_1.png"
+
+    (report,) = stitch_batch(index, generated, {"chunk_1_1": output})
+
+    assert [step["from_chunk"] for step in report["replacements"]] == [chunk_id for chunk_id, _ in generated]
+    assert output.with_suffix(".stitch_report.json").is_file()
+    pixels = _pixels(output)
+    assert pixels["corner"] == COLORS[generated[-1][0]]
+    assert pixels["top"] == COLORS["chunk_1_0"]
+    assert pixels["left"] == COLORS["chunk_0_1"]
+    assert pixels["inside"] == FMG
+
+
+def test_batch_reads_each_basemap_once(tmp_path, grid_index, monkeypatch):
+    index, generated = grid_index
+    opened = []
+    original = stitch.Image.open
+
+    def open_image(path, *args, **kwargs):
+        opened.append(str(path))
+        return original(path, *args, **kwargs)
+
+    monkeypatch.setattr(stitch.Image, "open", open_image)
+    outputs = {chunk_id: tmp_path / "out" / f"{chunk_id}.png" for chunk_id in ("chunk_1_1", "chunk_1_0")}
+
+    reports = stitch_batch(index, generated, outputs)
+
+    assert sorted(report["chunk_id"] for report in reports) == sorted(outputs)
+    for _chunk_id, path in generated:
+        assert opened.count(str(path)) == 1
+    # chunk_1_0 never takes pixels from itself, only from its two generated neighbours.
+    report = next(report for report in reports if report["chunk_id"] == "chunk_1_0")
+    assert [step["from_chunk"] for step in report["replacements"]] == ["chunk_0_0", "chunk_0_1"]
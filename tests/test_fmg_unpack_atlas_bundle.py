@@ -0,0 +1,188 @@
+import json
+import shutil
+import zipfile
+from pathlib import Path
+
+import pytest
+
+import fmg_unpack_atlas_bundle as fmg_unpack
+
+
+def _write_bundle(path, chunk_ids=("chunk_0_0",), chunk_json=None):
+    manifest = {
+        "chunkSize": 16,
+        "chunks": [
+            {"id": chunk_id, "column": i, "row": 0, "origin": {"x": i * 16, "y": 0}, "size": {"width": 16, "height": 16}}
+            for i, chunk_id in enumerate(chunk_ids)
+        ],
+    }
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("manifest.json", json.dumps(manifest))
+        for chunk_id in chunk_ids:
+            archive.writestr(f"chunks/{chunk_id}.png", b"png")
+            archive.writestr(f"chunks/{chunk_id}.json", json.dumps((chunk_json or {}).get(chunk_id, {"id": chunk_id})))
+    return path
+
+
+@pytest.fixture
+def fake_fetch(monkeypatch):
+    calls = []
+
+    def fetch_bundle(*, backend_url, seed, chunk_size, output_zip, progress=None, **kwargs):
+        calls.append((seed, chunk_size))
+        return _write_bundle(output_zip)
+
+    monkeypatch.setattr(fmg_unpack, "fetch_bundle", fetch_bundle)
+    return calls
+
+
+def test_seeded_download_is_reused_across_runs(tmp_path, fake_fetch):
+    out = tmp_path / "ref"
+    first = fmg_unpack.unpack_atlas_bundle(out, seed="42", chunk_size=16)
+    second = fmg_unpack.unpack_atlas_bundle(out, seed="42", chunk_size=16)
+
+    assert fake_fetch == [("42", 16)]
+    assert first["bundle_sha256"] == second["bundle_sha256"]
+    assert (out / "chunks" / "chunk_0_0.png").read_bytes() == b"png"
+
+
+def test_download_is_refetched_for_other_params_or_force(tmp_path, fake_fetch):
+    out = tmp_path / "ref"
+    fmg_unpack.unpack_atlas_bundle(out, seed="42", chunk_size=16)
+    fmg_unpack.unpack_atlas_bundle(out, seed="43", chunk_size=16)
+    fmg_unpack.unpack_atlas_bundle(out, seed="43", chunk_size=16, force=True)
+
+    assert fake_fetch == [("42", 16), ("43", 16), ("43", 16)]
+
+
+def test_unseeded_download_is_never_reused(tmp_path, fake_fetch):
+    out = tmp_path / "ref"
+    fmg_unpack.unpack_atlas_bundle(out, chunk_size=16)
+    fmg_unpack.unpack_atlas_bundle(out, chunk_size=16)
+
+    assert fake_fetch == [(None, 16), (None, 16)]
+
+
+def test_bundle_extracted_elsewhere_is_linked_into_output_dir(tmp_path):
+    bundle = _write_bundle(tmp_path / "bundle.zip", chunk_ids=("chunk_a_0", "chunk_a_1"))
+    first_dir, second_dir = tmp_path / "first", tmp_path / "second"
+    fmg_unpack.unpack_atlas_bundle(first_dir, zip_path=bundle)
+
+    index = fmg_unpack.unpack_atlas_bundle(second_dir, zip_path=bundle)
+    shutil.rmtree(first_dir)
+
+    written = json.loads((second_dir / fmg_unpack.DEFAULT_INDEX_NAME).read_text(encoding="utf-8"))
+    assert written == index
+    assert index["extract_dir"] == str(second_dir.resolve())
+    for chunk in index["chunks"].values():
+        for key in ("png", "manifest"):
+            assert Path(chunk[key]).parent.parent == second_dir.resolve()
+            assert Path(chunk[key]).is_file()
+
+
+@pytest.fixture
+def extracted(monkeypatch):
+    names = []
+    original = fmg_unpack._extract_member
+
+    def extract_member(archive, name, extract_dir):
+        names.append(name)
+        return original(archive, name, extract_dir)
+
+    monkeypatch.setattr(fmg_unpack, "_extract_member", extract_member)
+    return names
+
+
+def test_changed_member_is_the_only_one_extracted_again(tmp_path, extracted):
+    chunk_ids = ("chunk_c_0", "chunk_c_1")
+    bundle = _write_bundle(tmp_path / "bundle.zip", chunk_ids=chunk_ids)
+    out = tmp_path / "ref"
+    first = fmg_unpack.unpack_atlas_bundle(out, zip_path=bundle)
+    assert sorted(extracted) == sorted(f"chunks/{chunk_id}.{ext}" for chunk_id in chunk_ids for ext in ("png", "json"))
+
+    extracted.clear()
+    changed = {"chunk_c_1": {"id": "chunk_c_1", "biomes": [{"name": "Glacier"}]}}
+    _write_bundle(bundle, chunk_ids=chunk_ids, chunk_json=changed)
+    second = fmg_unpack.unpack_atlas_bundle(out, zip_path=bundle)
+
+    assert extracted == ["chunks/chunk_c_1.json"]
+    assert second["bundle_sha256"] != first["bundle_sha256"]
+    assert second["chunks"]["chunk_c_0"]["legend_context"] == first["chunks"]["chunk_c_0"]["legend_context"]
+    assert json.loads((out / "chunks" / "chunk_c_1.json").read_text(encoding="utf-8")) == changed["chunk_c_1"]
+
+
+def test_chunks_are_extracted_only_when_requested(tmp_path, extracted):
+    bundle = _write_bundle(tmp_path / "bundle.zip", chunk_ids=("chunk_l_0", "chunk_l_1"))
+    out = tmp_path / "ref"
+
+    index = fmg_unpack.unpack_atlas_bundle(out, zip_path=bundle, chunk_ids=["chunk_l_0"])
+
+    assert extracted == ["chunks/chunk_l_0.png", "chunks/chunk_l_0.json"]
+    assert index["chunks"]["chunk_l_0"]["extracted"] is True
+    assert index["chunks"]["chunk_l_1"]["extracted"] is False
+    assert "legend_context" not in index["chunks"]["chunk_l_1"]
+    assert not (out / "chunks" / "chunk_l_1.png").exists()
+
+    extracted.clear()
+    index_path = out / fmg_unpack.DEFAULT_INDEX_NAME
+    assert fmg_unpack.materialize_chunks(index, ["chunk_l_1"], index_path=index_path) == ["chunk_l_1"]
+    assert fmg_unpack.materialize_chunks(index, ["chunk_l_0", "chunk_l_1"], index_path=index_path) == []
+
+    assert extracted == ["chunks/chunk_l_1.png", "chunks/chunk_l_1.json"]
+    written = json.loads(index_path.read_text(encoding="utf-8"))
+    assert written["chunks"]["chunk_l_1"]["extracted"] is True
+    assert written["chunks"]["chunk_l_1"]["legend_context"] is not None
+    with pytest.raises(fmg_unpack.FmgBundleError):
+        fmg_unpack.materialize_chunks(index, ["chunk_missing"])
+
+
+def _grid(columns, rows, *, size=100, overlap=10, with_coords=True):
+    step = size - overlap
+    chunks = {}
+    for row in range(rows):
+        for column in range(columns):
+            chunk = {"origin": {"x": column * step, "y": row * step}, "size": {"width": size, "height": size}}
+            if with_coords:
+                chunk.update(column=column, row=row)
+            chunks[f"chunk_{column}_{row}"] = chunk
+    return chunks
+
+
+def test_plan_wavefront_groups_anti_diagonals():
+    plan = fmg_unpack.plan_wavefront(_grid(3, 2))
+
+    assert plan["waves"] == [
+        ["chunk_0_0"],
+        ["chunk_1_0", "chunk_0_1"],
+        ["chunk_2_0", "chunk_1_1"],
+        ["chunk_2_1"],
+    ]
+    assert plan["generation_order"] == [chunk_id for wave in plan["waves"] for chunk_id in wave]
+    assert plan["dependencies"]["chunk_0_0"] == []
+    assert plan["dependencies"]["chunk_1_0"] == ["chunk_0_0"]
+    assert sorted(plan["dependencies"]["chunk_1_1"]) == ["chunk_0_0", "chunk_0_1", "chunk_1_0"]
+    assert sorted(plan["dependencies"]["chunk_2_1"]) == ["chunk_1_0", "chunk_1_1", "chunk_2_0"]
+
+
+def test_plan_wavefront_dependencies_only_point_to_earlier_waves():
+    plan = fmg_unpack.plan_wavefront(_grid(4, 4))
+    wave_of = {chunk_id: i for i, wave in enumerate(plan["waves"]) for chunk_id in wave}
+
+    for chunk_id, dependencies in plan["dependencies"].items():
+        assert all(wave_of[other] < wave_of[chunk_id] for other in dependencies)
+    for wave in plan["waves"]:
+        assert not any(other in wave for chunk_id in wave for other in plan["dependencies"][chunk_id])
+
+
+def test_plan_wavefront_ranks_origins_without_grid_coordinates():
+    with_coords = fmg_unpack.plan_wavefront(_grid(2, 2))
+    without = fmg_unpack.plan_wavefront(_grid(2, 2, with_coords=False))
+
+    assert without == with_coords
+
+
+def test_plan_wavefront_without_overlap_has_no_dependencies():
+    plan = fmg_unpack.plan_wavefront(_grid(2, 2, overlap=0))
+
+    assert all(dependencies == [] for dependencies in plan["dependencies"].values())
+    assert len(plan["waves"]) == 3
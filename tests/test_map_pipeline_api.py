@@ -0,0 +1,65 @@
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+os.environ.setdefault("MAP_PIPELINE_TASK_STORE", "memory")
+os.environ.setdefault("MAP_PIPELINE_WARMUP", "0")
+
+import map_pipeline_api as api
+from map_pipeline_cache import InFlight, ResultCache
+from map_pipeline_scheduler import JobScheduler
+from map_pipeline_store import MemoryTaskStore
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """API state with one worker held busy, so submitted tasks stay queued."""
+    release = threading.Event()
+    scheduler = JobScheduler(workers=1, max_queue=8)
+    monkeypatch.setattr(api, "_store", MemoryTaskStore())
+    monkeypatch.setattr(api, "_result_cache", ResultCache(":memory:"))
+    monkeypatch.setattr(api, "_inflight", InFlight())
+    monkeypatch.setattr(api, "_scheduler", scheduler)
+    monkeypatch.setattr(api, "DEFAULT_OUT", tmp_path / "maps")
+    scheduler.start()
+    scheduler.submit("busy", lambda task_id: release.wait(10), {}, priority=0)
+    yield api
+    api._cancel_queued(scheduler.stop())
+    release.set()
+
+
+def _completed_output(service, task_id, name):
+    output_dir = service.DEFAULT_OUT / name
+    output_dir.mkdir(parents=True)
+    (output_dir / "pipeline_result.json").write_text(
+        f'{{"output_dir": "{output_dir.as_posix()}", "props": []}}', encoding="utf-8"
+    )
+    fingerprint = service._store.get(task_id)["fingerprint"]
+    service._result_cache.put(fingerprint, task_id=task_id, output_dir=output_dir)
+
+
+def test_seeded_fmg_requests_share_inflight_and_cached_results(service):
+    payload = {"prompt": "island", "use_fmg_reference": True, "fmg_seed": "42"}
+    first = service.generate({**payload, "output_name": "a"})
+    second = service.generate({**payload, "output_name": "b"})
+    assert second == {**second, "task_id": first["task_id"], "deduplicated": True}
+
+    _completed_output(service, first["task_id"], "a")
+    service._inflight.release(service._store.get(first["task_id"])["fingerprint"], first["task_id"])
+    assert service.generate({**payload, "output_name": "c"})["cached"] is True
+
+
+def test_unseeded_fmg_requests_skip_cache_and_inflight(service):
+    payload = {"prompt": "island", "use_fmg_reference": True}
+    first = service.generate({**payload, "output_name": "a"})
+    second = service.generate({**payload, "output_name": "b"})
+    assert second["task_id"] != first["task_id"]
+    assert "deduplicated" not in second
+
+    _completed_output(service, first["task_id"], "a")
+    third = service.generate({**payload, "output_name": "c"})
+    assert "cached" not in third
+    assert third["status"] == "pending"
@@ -0,0 +1,106 @@
+import hashlib
+import os
+
+import pytest
+
+from map_pipeline_artifacts import BlobStore, parse_range, sync_plan
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_ingest_links_artifact_instead_of_copying(tmp_path):
+    source = tmp_path / "out" / "base.png"
+    sha = _write(source, b"basemap")
+    blobs = BlobStore(tmp_path / "blobs")
+
+    target = blobs.ingest(source, sha)
+
+    assert target.read_bytes() == b"basemap"
+    assert os.path.samefile(target, source)
+    assert blobs.ingest(source, sha) == target
+    assert blobs.get(sha) == target
+
+
+def test_ingest_keeps_artifact_mtime(tmp_path):
+    source = tmp_path / "out" / "placements.json"
+    sha = _write(source, b"[]")
+    os.utime(source, ns=(1_000_000_000, 1_000_000_000))
+    blobs = BlobStore(tmp_path / "blobs")
+
+    blobs.ingest(source, sha)
+    blobs.get(sha)
+
+    assert source.stat().st_mtime_ns == 1_000_000_000
+
+
+def test_get_drops_blob_rewritten_in_place(tmp_path):
+    source = tmp_path / "out" / "placements.json"
+    sha = _write(source, b"[1]")
+    blobs = BlobStore(tmp_path / "blobs")
+    blobs.ingest(source, sha)
+
+    source.write_bytes(b"[2]")
+
+    assert blobs.get(sha) is None
+    assert not blobs.path_for(sha).exists()
+
+
+def test_prune_evicts_only_unlinked_blobs(tmp_path):
+    blobs = BlobStore(tmp_path / "blobs")
+    kept = tmp_path / "out" / "kept.png"
+    kept_sha = _write(kept, b"k" * 100)
+    gone = tmp_path / "out" / "gone.png"
+    gone_sha = _write(gone, b"g" * 100)
+    blobs.ingest(kept, kept_sha)
+    blobs.ingest(gone, gone_sha)
+    gone.unlink()
+
+    assert blobs.prune(0) == 1
+    assert blobs.path_for(kept_sha).exists()
+    assert not blobs.path_for(gone_sha).exists()
+
+
+def test_path_for_rejects_bad_hash(tmp_path):
+    with pytest.raises(ValueError):
+        BlobStore(tmp_path).path_for("../etc/passwd")
+
+
+def test_parse_range():
+    assert parse_range(None, 10) is None
+    assert parse_range("bytes=2-", 10) == (2, 9)
+    assert parse_range("bytes=-3", 10) == (7, 9)
+    assert parse_range("bytes=0-100", 10) == (0, 9)
+    with pytest.raises(ValueError):
+        parse_range("bytes=10-", 10)
+
+
+def test_sync_plan_skips_held_hashes():
+    files = [
+        {"relative_path": "a.png", "sha256": "1", "size": 5},
+        {"relative_path": "b.png", "sha256": "2", "size": 7},
+        {"relative_path": "c.png", "sha256": "3", "size": 9},
+    ]
+    plan = sync_plan(files, {"a.png": "1", "old.png": "2", "gone.png": "9"})
+
+    assert plan["unchanged"] == ["a.png"]
+    assert [entry["relative_path"] for entry in plan["files"]] == ["b.png", "c.png"]
+    assert plan["files"][0]["cached_as_blob"] is True
+    assert plan["removed"] == ["gone.png", "old.png"]
+    assert plan["transfer_bytes"] == 9
+
+
+def test_sync_plan_against_blob_cache():
+    files = [
+        {"relative_path": "a.png", "sha256": "1", "size": 5},
+        {"relative_path": "b.png", "sha256": "2", "size": 7},
+    ]
+    plan = sync_plan(files, ["1"])
+
+    assert plan["unchanged"] == ["a.png"]
+    assert [entry["relative_path"] for entry in plan["files"]] == ["b.png"]
+    assert plan["removed"] == []
+    assert plan["transfer_bytes"] == 7
@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+from map_pipeline_cache import InFlight, ResultCache, request_fingerprint
+
+
+def _output(root, name, size):
+    output_dir = root / name
+    output_dir.mkdir(parents=True)
+    (output_dir / "pipeline_result.json").write_text("{}", encoding="utf-8")
+    (output_dir / "base.png").write_bytes(b"x" * size)
+    return output_dir
+
+
+@pytest.fixture
+def cache():
+    cache = ResultCache(":memory:")
+    yield cache
+    cache.close()
+
+
+def test_fingerprint_depends_on_params_and_input_bytes(tmp_path):
+    image = tmp_path / "in.png"
+    image.write_bytes(b"one")
+    first = request_fingerprint({"prompt": "p", "diff": 30}, [image])
+
+    assert request_fingerprint({"diff": 30, "prompt": "p"}, [image]) == first
+    assert request_fingerprint({"prompt": "p", "diff": 31}, [image]) != first
+    image.write_bytes(b"two")
+    os.utime(image, ns=(0, 1))
+    assert request_fingerprint({"prompt": "p", "diff": 30}, [image]) != first
+
+
+def test_get_put_and_ttl(cache, tmp_path):
+    output_dir = _output(tmp_path, "map-a", 10)
+    cache.put("fp", task_id="t1", output_dir=output_dir)
+
+    hit = cache.get("fp", ttl=60)
+    assert hit["task_id"] == "t1"
+    assert hit["output_dir"] == str(output_dir)
+    assert hit["result"] == {}
+    assert cache.get("fp", ttl=-1) is None
+    assert cache.get("fp", ttl=60) is None
+
+
+def test_get_drops_entry_whose_output_is_gone(cache, tmp_path):
+    output_dir = _output(tmp_path, "map-a", 10)
+    cache.put("fp", task_id="t1", output_dir=output_dir)
+    (output_dir / "pipeline_result.json").unlink()
+
+    assert cache.get("fp", ttl=60) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_get_drops_entry_whose_result_was_rewritten(cache, tmp_path):
+    output_dir = _output(tmp_path, "map-a", 10)
+    cache.put("first", task_id="t1", output_dir=output_dir)
+    (output_dir / "pipeline_result.json").write_text('{"prompt": "other"}', encoding="utf-8")
+    cache.put("second", task_id="t2", output_dir=output_dir)
+
+    assert cache.get("first", ttl=60) is None
+    assert cache.get("second", ttl=60)["result"] == {"prompt": "other"}
+    assert cache.stats()["entries"] == 1
+
+
+def test_table_without_result_hash_is_rebuilt(tmp_path):
+    path = tmp_path / "tasks.sqlite3"
+    legacy = sqlite3.connect(path)
+    legacy.execute(
+        "CREATE TABLE result_cache (fingerprint TEXT PRIMARY KEY, task_id TEXT NOT NULL, output_dir TEXT NOT NULL,"
+        " size_bytes INTEGER NOT NULL, created_at REAL NOT NULL, last_used_at REAL NOT NULL)"
+    )
+    legacy.execute("INSERT INTO result_cache VALUES ('fp', 't1', ?, 1, 0, 0)", (str(tmp_path),))
+    legacy.commit()
+    legacy.close()
+
+    cache = ResultCache(path)
+    try:
+        assert cache.stats()["entries"] == 0
+        cache.put("fp", task_id="t2", output_dir=_output(tmp_path, "map-a", 10))
+        assert cache.get("fp", ttl=60)["task_id"] == "t2"
+    finally:
+        cache.close()
+
+
+def test_prune_drops_rows_but_never_outputs(cache, tmp_path):
+    old = _output(tmp_path, "old", 100)
+    expired = _output(tmp_path, "expired", 10)
+    new = _output(tmp_path, "new", 100)
+    for name, output_dir in (("old", old), ("new", new)):
+        cache.put(name, task_id=name, output_dir=output_dir)
+        time.sleep(0.01)
+
+    assert cache.prune(ttl=3600, max_bytes=150) == 1
+    assert cache.get("old", ttl=3600) is None
+    assert cache.get("new", ttl=3600)["task_id"] == "new"
+
+    cache.put("expired", task_id="expired", output_dir=expired)
+    assert cache.prune(ttl=-1, max_bytes=10**9) == 2
+    assert cache.stats()["entries"] == 0
+    assert old.exists() and new.exists() and expired.exists()
+
+
+def test_inflight_claim_and_release():
+    inflight = InFlight()
+    assert inflight.claim("fp", "t1") is None
+    assert inflight.claim("fp", "t2") == "t1"
+    inflight.release("fp", "t2")
+    assert inflight.claim("fp", "t3") == "t1"
+    inflight.release("fp", "t1")
+    assert inflight.claim("fp", "t3") is None
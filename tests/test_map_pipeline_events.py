@@ -0,0 +1,51 @@
+import asyncio
+import json
+import threading
+
+from map_pipeline_events import AsyncWaiter, TaskNotifier, ThreadWaiter, format_cursor, parse_cursor, sse_message
+
+
+def test_notify_wakes_only_watchers_of_that_task():
+    notifier = TaskNotifier()
+    watched, other = ThreadWaiter(), ThreadWaiter()
+    with notifier.watch(["a", "b"], watched), notifier.watch(["c"], other):
+        assert notifier.watcher_count() == 2
+        notifier.notify("b")
+        assert watched.wait(0.01) is True
+        assert other.wait(0.01) is False
+    assert notifier.watcher_count() == 0
+
+
+def test_wake_before_wait_is_not_missed():
+    waiter = ThreadWaiter()
+    waiter.wake()
+    assert waiter.wait(0) is True
+    assert waiter.wait(0) is False
+
+
+def test_async_waiter_woken_from_another_thread():
+    async def scenario():
+        notifier = TaskNotifier()
+        waiter = AsyncWaiter()
+        with notifier.watch(["a"], waiter):
+            threading.Timer(0.01, notifier.notify, args=("a",)).start()
+            woke = await waiter.wait(5)
+            timed_out = await waiter.wait(0.01)
+        return woke, timed_out
+
+    assert asyncio.run(scenario()) == (True, False)
+
+
+def test_cursor_round_trip():
+    cursors = {"a": 3, "task:with:colons": -1}
+    assert parse_cursor(format_cursor(cursors)) == cursors
+    assert parse_cursor(None) == {}
+    assert parse_cursor("a:x, :4, b:2") == {"b": 2}
+
+
+def test_sse_message():
+    message = sse_message({"seq": 1, "text": "雪"}, event="progress", event_id="a:1")
+    lines = message.split("\n")
+    assert lines[:2] == ["id: a:1", "event: progress"]
+    assert json.loads(lines[2][len("data: "):]) == {"seq": 1, "text": "雪"}
+    assert message.endswith("\n\n")
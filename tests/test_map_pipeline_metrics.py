@@ -0,0 +1,49 @@
+import math
+
+import pytest
+
+from map_pipeline_metrics import Registry, _format_value
+
+
+@pytest.mark.parametrize(
+    "value, text",
+    [(3.0, "3"), (0.25, "0.25"), (math.nan, "NaN"), (math.inf, "+Inf"), (-math.inf, "-Inf"), (-2, "-2")],
+)
+def test_format_value(value, text):
+    assert _format_value(value) == text
+
+
+def test_registry_renders_exposition_format():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests.", ("route", "status"))
+    registry.gauge("queue_depth", "Queued jobs.", lambda: math.nan)
+    latency = registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.5, 1))
+    requests.inc(route="/generate", status="200")
+    requests.inc(2, route='/say "hi"\n', status="500")
+    for value in (0.1, 0.5, 0.7, 4):
+        latency.observe(value, route="/generate")
+
+    assert registry.render() == "\n".join(
+        [
+            "# HELP requests_total Requests.",
+            "# TYPE requests_total counter",
+            'requests_total{route="/generate",status="200"} 1',
+            'requests_total{route="/say \\"hi\\"\\n",status="500"} 2',
+            "# HELP queue_depth Queued jobs.",
+            "# TYPE queue_depth gauge",
+            "queue_depth NaN",
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{route="/generate",le="0.5"} 2',
+            'latency_seconds_bucket{route="/generate",le="1"} 3',
+            'latency_seconds_bucket{route="/generate",le="+Inf"} 4',
+            'latency_seconds_sum{route="/generate"} 5.3',
+            'latency_seconds_count{route="/generate"} 4',
+        ]
+    ) + "\n"
+
+
+def test_labels_must_match_the_declared_names():
+    counter = Registry().counter("jobs_total", "Jobs.", ("state",))
+    with pytest.raises(ValueError):
+        counter.inc(status="done")
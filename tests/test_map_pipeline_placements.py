@@ -0,0 +1,133 @@
+import struct
+
+import pytest
+
+from map_pipeline_placements import (
+    FLAG_CLUSTER,
+    FLAG_FLIP_V,
+    HEADER,
+    RECORD,
+    PlacementFormatError,
+    pack_placements,
+    placement_items,
+    prop_images,
+    read_placements_bin,
+    unpack_placements,
+    write_placements_bin,
+)
+
+
+def test_round_trip_normalises_placement_shapes():
+    items = [
+        {"id": "tree_1", "bbox": [10, 20, 42, 84], "layer": "trees", "cluster": True},
+        {"prop_id": "rock", "position": {"x": 5.5, "y": 6}, "size": [8, 9], "chunk": "chunk_1_0", "flip_v": 1},
+        {"name": "well", "x": 1, "y": 2, "w": 3, "h": 4, "image": "props/well.png"},
+    ]
+
+    placements = unpack_placements(
+        pack_placements(items, images={"tree_1": "props/tree_1.png"}, chunk="chunk_0_0")
+    )
+
+    assert placements == [
+        {
+            "id": "tree_1",
+            "image": "props/tree_1.png",
+            "chunk": "chunk_0_0",
+            "layer": "trees",
+            "x": 10.0,
+            "y": 20.0,
+            "w": 32.0,
+            "h": 64.0,
+            "flags": FLAG_CLUSTER,
+        },
+        {
+            "id": "rock",
+            "image": "",
+            "chunk": "chunk_1_0",
+            "layer": "",
+            "x": 5.5,
+            "y": 6.0,
+            "w": 8.0,
+            "h": 9.0,
+            "flags": FLAG_FLIP_V,
+        },
+        {
+            "id": "well",
+            "image": "props/well.png",
+            "chunk": "chunk_0_0",
+            "layer": "",
+            "x": 1.0,
+            "y": 2.0,
+            "w": 3.0,
+            "h": 4.0,
+            "flags": 0,
+        },
+    ]
+
+
+def test_unicode_strings_and_empty_input_round_trip(tmp_path):
+    path = write_placements_bin(tmp_path / "placements.bin", [{"id": "雪松", "layer": "森林"}])
+    assert [(p["id"], p["layer"]) for p in read_placements_bin(path)] == [("雪松", "森林")]
+    assert unpack_placements(pack_placements([])) == []
+
+
+def test_placement_items_and_prop_images():
+    assert placement_items({"props": [{"id": 1}, "junk"]}) == [{"id": 1}]
+    assert placement_items({"other": []}) == []
+    assert prop_images([{"id": "a", "image": "a.png"}, {"id": "b"}, None]) == {"a": "a.png"}
+
+
+def test_out_of_range_coordinates_raise_format_error():
+    with pytest.raises(PlacementFormatError):
+        pack_placements([{"id": "far", "x": 1e300, "y": 0}])
+
+
+@pytest.mark.parametrize(
+    "item",
+    [
+        {"id": "a", "x": "left", "y": 0},
+        {"id": "a", "bbox": [0, None, 4, 4]},
+        {"id": "a", "position": {"x": None, "y": 2}},
+        {"id": "a", "width": {"px": 3}},
+    ],
+)
+def test_non_numeric_boxes_raise_format_error(item):
+    with pytest.raises(PlacementFormatError):
+        pack_placements([item])
+
+
+def test_null_coordinates_default_to_zero():
+    (record,) = unpack_placements(pack_placements([{"id": "a", "x": None, "y": 3, "width": None}]))
+    assert (record["x"], record["y"], record["w"]) == (0.0, 3.0, 0.0)
+
+
+@pytest.mark.parametrize(
+    "corrupt",
+    [
+        lambda data: data[: HEADER.size - 1],
+        lambda data: b"NOPE" + data[4:],
+        lambda data: data[:-1],
+    ],
+)
+def test_malformed_files_raise_format_error(corrupt):
+    data = pack_placements([{"id": "a", "layer": "b"}])
+    with pytest.raises(PlacementFormatError):
+        unpack_placements(corrupt(data))
+
+
+def test_out_of_range_string_index_raises_format_error():
+    data = bytearray(pack_placements([{"id": "a"}]))
+    struct.pack_into("<I", data, HEADER.size, 99)
+    with pytest.raises(PlacementFormatError):
+        unpack_placements(bytes(data))
+
+
+def test_record_size_larger_than_record_is_skipped_over():
+    data = pack_placements([{"id": "a", "x": 1}, {"id": "b", "x": 2}])
+    fields = list(HEADER.unpack_from(data))
+    records = data[HEADER.size:HEADER.size + 2 * RECORD.size]
+    padded = b"".join(records[i:i + RECORD.size] + b"\0" * 4 for i in range(0, len(records), RECORD.size))
+    fields[4] = RECORD.size + 4
+    fields[7] += 8
+    rebuilt = HEADER.pack(*fields) + padded + data[HEADER.size + 2 * RECORD.size:]
+    assert [p["x"] for p in unpack_placements(rebuilt)] == [1.0, 2.0]
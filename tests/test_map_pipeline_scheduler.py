@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+
+from map_pipeline_scheduler import JobScheduler, QueueFull, SchedulerClosed, parse_priority
+
+
+def _noop(task_id, **kwargs):
+    pass
+
+
+def _blocked_scheduler(max_queue=8):
+    """A started one-worker scheduler whose worker is held inside job "busy"."""
+    release = threading.Event()
+    running = threading.Event()
+
+    def hold(task_id):
+        running.set()
+        release.wait(5)
+
+    scheduler = JobScheduler(workers=1, max_queue=max_queue)
+    scheduler.start()
+    scheduler.submit("busy", hold, {}, priority=0)
+    assert running.wait(5)
+    return scheduler, release
+
+
+def test_parse_priority():
+    assert parse_priority(None) == 0
+    assert parse_priority("Batch") == 10
+    assert parse_priority("3") == 3
+    with pytest.raises(ValueError):
+        parse_priority("urgent")
+
+
+def test_submit_reports_position_in_priority_then_fifo_order():
+    scheduler, release = _blocked_scheduler()
+    try:
+        assert scheduler.submit("b1", _noop, {}, priority=10) == 0
+        assert scheduler.submit("b2", _noop, {}, priority=10) == 1
+        assert scheduler.submit("i1", _noop, {}, priority=0) == 0
+        assert scheduler.submit("i2", _noop, {}, priority=0) == 1
+
+        assert scheduler.position("busy")["queue_state"] == "running"
+        assert [scheduler.position(task_id)["queue_position"] for task_id in ("i1", "i2", "b1", "b2")] == [1, 2, 3, 4]
+        assert scheduler.position("unknown") is None
+    finally:
+        release.set()
+        scheduler.stop()
+
+
+def test_queue_full_and_closed():
+    scheduler, release = _blocked_scheduler(max_queue=1)
+    try:
+        scheduler.submit("q1", _noop, {}, priority=0)
+        assert scheduler.full
+        with pytest.raises(QueueFull):
+            scheduler.submit("q2", _noop, {}, priority=0)
+    finally:
+        release.set()
+        scheduler.stop()
+    with pytest.raises(SchedulerClosed):
+        scheduler.submit("q3", _noop, {}, priority=0)
+
+
+def test_stop_returns_dropped_jobs_in_queue_order():
+    scheduler, release = _blocked_scheduler()
+    scheduler.submit("later", _noop, {"fingerprint": "b"}, priority=10)
+    scheduler.submit("sooner", _noop, {"fingerprint": "a"}, priority=0)
+
+    dropped = scheduler.stop()
+    release.set()
+
+    assert dropped == [("sooner", {"fingerprint": "a"}), ("later", {"fingerprint": "b"})]
+    assert scheduler.snapshot()["queued"] == 0
+    assert scheduler.stop() == []
+
+
+def test_jobs_run_with_their_kwargs():
+    done = threading.Event()
+    seen = []
+
+    def record(task_id, value):
+        seen.append((task_id, value))
+        done.set()
+
+    scheduler = JobScheduler(workers=2, max_queue=4)
+    scheduler.start()
+    try:
+        scheduler.submit("t1", record, {"value": 7}, priority=0)
+        assert done.wait(5)
+    finally:
+        scheduler.stop()
+    assert seen == [("t1", 7)]
+
+
+def test_jobs_lists_running_and_queued():
+    scheduler, release = _blocked_scheduler()
+    try:
+        scheduler.submit("queued", _noop, {"output_dir": "b"}, priority=0)
+        assert sorted(task_id for task_id, _ in scheduler.jobs()) == ["busy", "queued"]
+    finally:
+        release.set()
+        scheduler.stop()
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+from map_pipeline_store import MemoryTaskStore, SQLiteTaskStore, open_task_store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = open_task_store(request.param, tmp_path / "tasks.sqlite3")
+    yield store
+    store.close()
+
+
+def test_events_are_numbered_and_merged_into_task(store):
+    store.create("t1", {"status": "pending", "progress": 0})
+    first = store.append_event("t1", "started", {"status": "running", "progress": 5})
+    second = store.append_event("t1", "completed", {"status": "completed", "progress": 100})
+
+    assert (first["seq"], second["seq"]) == (0, 1)
+    assert first == {"seq": 0, "task_id": "t1", "type": "started", "status": "running", "progress": 5}
+    assert store.get("t1") == {"status": "completed", "progress": 100}
+    assert store.count() == 1
+
+
+def test_events_after_pages_from_cursor(store):
+    store.create("t1", {"status": "pending"})
+    for i in range(5):
+        store.append_event("t1", "progress", {"progress": i})
+
+    assert [event["seq"] for event in store.events_after("t1", -1)] == [0]
+    assert [event["seq"] for event in store.events_after("t1", 1, limit=2)] == [2, 3]
+    assert store.events_after("t1", 4) == []
+    assert store.events_after("missing", -1) == []
+
+
+def test_update_and_missing_tasks(store):
+    assert store.get("missing") is None
+    assert store.update("missing", status="running") is False
+    with pytest.raises(KeyError):
+        store.append_event("missing", "started", {})
+
+    store.create("t1", {"status": "pending"})
+    assert store.update("t1", status="running", message="go") is True
+    assert store.get("t1") == {"status": "running", "message": "go"}
+
+
+def test_compact_keeps_terminal_event_and_expires_old_tasks(store):
+    store.create("done", {"status": "pending"})
+    store.append_event("done", "started", {"status": "running"})
+    store.append_event("done", "completed", {"status": "completed"})
+    store.create("live", {"status": "pending"})
+    store.append_event("live", "started", {"status": "running"})
+    time.sleep(0.01)
+
+    stats = store.compact(event_retention=0, task_retention=3600)
+    assert stats == {"events_removed": 1, "tasks_removed": 0}
+    assert [event["type"] for event in store.events_after("done", -1, limit=10)] == ["completed"]
+    assert len(store.events_after("live", -1, limit=10)) == 1
+
+    stats = store.compact(event_retention=0, task_retention=0)
+    assert stats == {"events_removed": 1, "tasks_removed": 1}
+    assert store.get("done") is None
+    assert store.get("live") is not None
+
+
+def test_sqlite_store_survives_reopen_and_recovers_interrupted(tmp_path):
+    path = tmp_path / "tasks.sqlite3"
+    store = SQLiteTaskStore(path)
+    store.create("running", {"status": "pending"})
+    store.append_event("running", "started", {"status": "running"})
+    store.create("done", {"status": "pending"})
+    store.append_event("done", "completed", {"status": "completed"})
+    store.close()
+
+    store = SQLiteTaskStore(path)
+    try:
+        assert store.recover_interrupted() == ["running"]
+        assert store.get("running")["status"] == "failed"
+        assert store.events_after("running", 0)[0]["type"] == "failed"
+        assert store.get("done")["status"] == "completed"
+    finally:
+        store.close()
+
+
+def test_memory_store_recovers_nothing():
+    assert MemoryTaskStore().recover_interrupted() == []
+
+
+def test_unknown_store_kind(tmp_path):
+    with pytest.raises(ValueError):
+        open_task_store("redis", tmp_path / "tasks.sqlite3")
@@ -0,0 +1,98 @@
+import pytest
+
+import map_pipeline_trace
+from map_pipeline_trace import SpanPeaks, StageStats, Tracer, instrument_module
+
+
+ALLOC = 64 * 1024 * 1024
+
+
+def _peaks_available():
+    peaks = SpanPeaks()
+    token = peaks.begin()
+    peaks.end(token)
+    return token is not None
+
+
+def test_span_records_timing_and_chrome_trace(tmp_path):
+    tracer = Tracer()
+    with tracer.span("outer", chunk="c0"):
+        with tracer.span("inner") as args:
+            args["cached"] = True
+
+    inner, outer = tracer.spans
+    assert (inner["name"], inner["parent"], inner["depth"]) == ("inner", "outer", 1)
+    assert (outer["name"], outer["parent"], outer["depth"]) == ("outer", None, 0)
+    assert inner["args"] == {"cached": True}
+    assert inner["rss_delta_bytes"] == inner["rss_end_bytes"] - inner["rss_start_bytes"]
+
+    events = tracer.chrome_trace()["traceEvents"]
+    assert [event["name"] for event in events] == ["outer", "inner"]
+    assert events[0]["args"]["chunk"] == "c0"
+    assert tracer.write_chrome_trace(tmp_path / "trace.json").is_file()
+
+
+def test_span_records_error_and_reraises():
+    tracer = Tracer()
+    with pytest.raises(KeyError):
+        with tracer.span("boom"):
+            raise KeyError("x")
+    assert tracer.spans[0]["error"] == "KeyError"
+
+
+@pytest.mark.skipif(not _peaks_available(), reason="needs a resettable VmHWM (Linux)")
+def test_peak_is_per_span_not_process_lifetime(monkeypatch):
+    monkeypatch.setattr(map_pipeline_trace, "_span_peaks", SpanPeaks())
+    tracer = Tracer()
+    with tracer.span("parent"):
+        with tracer.span("heavy"):
+            block = bytearray(ALLOC)
+            block[:: 4096] = b"x" * len(block[:: 4096])
+            del block
+        with tracer.span("light"):
+            pass
+
+    heavy, light, parent = tracer.spans
+    assert heavy["process_peak_rss_bytes"] >= heavy["rss_start_bytes"] + ALLOC // 2
+    assert light["process_peak_rss_bytes"] < heavy["process_peak_rss_bytes"] - ALLOC // 2
+    assert parent["process_peak_rss_bytes"] >= heavy["process_peak_rss_bytes"]
+
+
+def test_span_peaks_disabled_never_resets_the_mark(tmp_path, monkeypatch):
+    clear_refs = tmp_path / "clear_refs"
+    clear_refs.write_text("", encoding="ascii")
+    monkeypatch.setattr(map_pipeline_trace, "_span_peaks", SpanPeaks(str(clear_refs), enabled=False))
+    tracer = Tracer()
+    with tracer.span("plain"):
+        pass
+
+    assert tracer.spans[0]["process_peak_rss_bytes"] is None
+    assert tracer.chrome_trace()["traceEvents"][0]["args"]["process_peak_rss_bytes"] is None
+    assert clear_refs.read_text(encoding="ascii") == ""
+
+
+def test_span_peaks_unavailable(tmp_path):
+    peaks = SpanPeaks(clear_refs=str(tmp_path / "missing" / "clear_refs"))
+    token = peaks.begin()
+    assert token is None
+    assert peaks.end(token) is None
+
+
+def test_instrument_module_wraps_existing_functions_once():
+    class Module:
+        @staticmethod
+        def stage(value):
+            return value * 2
+
+    assert instrument_module(Module, ["stage", "missing"], prefix="asf.") == ["stage"]
+    assert instrument_module(Module, ["stage"]) == []
+    assert Module.stage(3) == 6
+
+
+def test_stage_stats_percentiles():
+    stats = StageStats()
+    for value in range(1, 101):
+        stats.observe("asf", float(value))
+    summary = stats.summary()["asf"]
+    assert summary["count"] == 100
+    assert (summary["p50_ms"], summary["p90_ms"], summary["p99_ms"], summary["max_ms"]) == (50, 90, 99, 100)
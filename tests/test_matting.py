@@ -0,0 +1,284 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+# old/ is a flat script tree; appended so its top-level names never shadow installed packages.
+OLD_ROOT = Path(__file__).resolve().parent.parent / "old"
+if str(OLD_ROOT) not in sys.path:
+    sys.path.append(str(OLD_ROOT))
+
+from lib import matting  # noqa: E402
+from lib.matting import MattingEngine, _edge_band_regions, _tile_span, squared_threshold  # noqa: E402
+
+
+def _scene(h, w, bg=(255, 255, 255), seed=0, noise=12):
+    """Background with noise, a few solid blobs and anti-aliased-looking fringes."""
+    rng = np.random.default_rng(seed)
+    rgb = np.empty((h, w, 3), np.uint8)
+    rgb[:] = bg
+    noise = rng.integers(-noise, noise + 1, size=(h, w, 3))
+    rgb = np.clip(rgb.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    ys, xs = np.mgrid[0:h, 0:w]
+    for cy, cx, r, color in ((h // 3, w // 4, min(h, w) // 6, (200, 40, 30)),
+                             (2 * h // 3, 2 * w // 3, min(h, w) // 5, (30, 90, 200)),
+                             (h // 2, w - 4, min(h, w) // 8, (240, 235, 225))):
+        d = np.hypot(ys - cy, xs - cx)
+        rgb[d < r] = color
+        fringe = (d >= r) & (d < r + 2)
+        rgb[fringe] = ((np.array(color, np.int16) * 3 + np.array(bg, np.int16) * 17) // 20).astype(np.uint8)
+    return rgb
+
+
+def _float_white_mask(rgb, bg_color, tolerance):
+    """remove_background's float32 white-background mask before the integer engine."""
+    img = rgb.astype(np.float32)
+    max_rgb = np.max(img, axis=2)
+    min_rgb = np.min(img, axis=2)
+    saturation = np.where(max_rgb > 0, (max_rgb - min_rgb) / np.maximum(max_rgb, 1), 0)
+    mask = (max_rgb >= 255 - tolerance) & (saturation <= tolerance / 255.0 * 1.5)
+    distances = np.sqrt(np.sum((img - np.array(bg_color, np.float32)) ** 2, axis=2))
+    return mask | (distances <= tolerance * 1.5)
+
+
+def _float_refine_edges(rgb, alpha, bg_color, feather_radius=1):
+    """remove_background.refine_edges before banding, as a full-frame reference."""
+    from scipy import ndimage
+
+    alpha = alpha.astype(np.float32)
+    binary = alpha > 0
+    dilated = ndimage.binary_dilation(binary, iterations=feather_radius + 1)
+    eroded = ndimage.binary_erosion(binary, iterations=max(1, feather_radius))
+    distances = np.sqrt(np.sum((rgb.astype(np.float32) - np.array(bg_color, np.float32)) ** 2, axis=2))
+    adjust = dilated & ~eroded & (alpha > 0) & (distances < 60)
+    factor = np.clip(distances / 60, 0, 1)
+    alpha[adjust] = alpha[adjust] * factor[adjust]
+    return alpha.astype(np.uint8)
+
+
+def _cross_grow(mask, iterations, outside=False):
+    """Dilation with the 4-neighbour cross, in plain numpy; `outside` is the border value."""
+    for _ in range(iterations):
+        padded = np.pad(mask, 1, constant_values=outside)
+        mask = (padded[1:-1, 1:-1] | padded[:-2, 1:-1] | padded[2:, 1:-1]
+                | padded[1:-1, :-2] | padded[1:-1, 2:])
+    return mask
+
+
+@pytest.mark.parametrize("tolerance", [0, 1, 2.5, 7.07, 30, 45.0, 75])
+def test_squared_threshold_matches_sqrt_comparison(tolerance):
+    d2 = np.arange(int((tolerance + 3) ** 2) + 1)
+    d = np.sqrt(d2)
+    assert np.array_equal(d2 <= squared_threshold(tolerance, inclusive=True), d <= tolerance)
+    assert np.array_equal(d2 <= squared_threshold(tolerance), d < tolerance)
+
+
+@pytest.mark.parametrize("bg_color", [(255, 255, 255), (248, 250, 246)])
+@pytest.mark.parametrize("tolerance", [10, 30, 50])
+def test_white_key_mask_matches_float_formula(bg_color, tolerance):
+    rng = np.random.default_rng(tolerance)
+    rgb = np.concatenate([
+        rng.integers(0, 256, size=(64, 64, 3)),
+        rng.integers(180, 256, size=(64, 64, 3)),
+    ]).astype(np.uint8)
+
+    mask = MattingEngine().white_key_mask(rgb, bg_color, tolerance)
+
+    assert np.array_equal(mask, _float_white_mask(rgb, bg_color, tolerance))
+
+
+@pytest.mark.parametrize("inclusive", [False, True])
+def test_color_key_mask_matches_euclidean_distance(inclusive):
+    rng = np.random.default_rng(1)
+    rgb = rng.integers(0, 80, size=(96, 96, 3)).astype(np.uint8)
+    bg_color = (20, 40, 30)
+    distances = np.sqrt(((rgb.astype(np.float64) - bg_color) ** 2).sum(axis=2))
+    engine = MattingEngine()
+
+    for tolerance in (5, 17.5, 30):
+        expected = distances <= tolerance if inclusive else distances < tolerance
+        assert np.array_equal(engine.color_key_mask(rgb, bg_color, tolerance, inclusive=inclusive), expected)
+
+
+@pytest.mark.parametrize("block", [4, 8, 16])
+def test_edge_band_regions_cover_the_edge_band_without_overlap(block):
+    opaque = MattingEngine().white_key_mask(_scene(70, 90), (255, 255, 255), 30) == 0
+    # refine_edges only touches opaque pixels that the 1-step erosion (zero border) removes.
+    band = opaque & _cross_grow(~opaque, 1, outside=True)
+
+    covered = np.zeros(opaque.shape, np.int32)
+    for y0, y1, x0, x1 in _edge_band_regions(opaque, block):
+        covered[y0:y1, x0:x1] += 1
+
+    assert covered.max() == 1
+    assert not (band & (covered == 0)).any()
+
+
+def test_edge_band_regions_empty_without_foreground():
+    assert list(_edge_band_regions(np.zeros((40, 40), bool), 8)) == []
+
+
+@pytest.mark.parametrize("block", [8, 64])
+def test_refine_edges_matches_full_frame_reference(monkeypatch, block):
+    pytest.importorskip("scipy")
+    monkeypatch.setattr(matting, "REFINE_BLOCK", block)
+    bg_color = (252, 251, 253)
+    rgb = _scene(120, 150, bg=bg_color)
+    engine = MattingEngine()
+    alpha = np.where(engine.white_key_mask(rgb, bg_color, 10), 0, 255).astype(np.uint8)
+    expected = _float_refine_edges(rgb, alpha, bg_color)
+
+    adjusted = engine.refine_edges(rgb, alpha, bg_color)
+
+    assert adjusted > 0
+    assert np.array_equal(alpha, expected)
+
+
+@pytest.mark.parametrize("limit,tile,halo", [(100, 32, 4), (70, 64, 16), (33, 8, 2), (10, 32, 4)])
+def test_tile_span_adds_halo_and_keeps_a_fixed_size(limit, tile, halo):
+    size = min(limit, tile + 2 * halo)
+    for start in range(0, limit, tile):
+        stop = min(start + tile, limit)
+        outer_start, outer_stop = _tile_span(start, stop, limit, tile, halo)
+        assert 0 <= outer_start <= max(0, start - halo)
+        assert min(limit, stop + halo) <= outer_stop <= limit
+        assert outer_stop - outer_start == size
+
+
+@pytest.mark.parametrize("border_skip", [0, 3, 7, 40])
+def test_border_connected_keeps_exactly_the_seeded_labels(border_skip):
+    ndimage = pytest.importorskip("scipy.ndimage")
+    rng = np.random.default_rng(border_skip)
+    mask = rng.random((48, 64)) < 0.45
+    labeled, count = ndimage.label(mask)
+    assert count > 50
+
+    def ring_labels(inset):
+        inner = labeled[inset:labeled.shape[0] - inset, inset:labeled.shape[1] - inset]
+        return set(inner[0]) | set(inner[-1]) | set(inner[:, 0]) | set(inner[:, -1])
+
+    edge = ring_labels(0) - {0}
+    seeded = edge | ring_labels(border_skip) if 0 < border_skip < 48 - border_skip else edge
+    expected = np.isin(labeled, sorted(seeded - {0}))
+
+    kept = MattingEngine().border_connected(mask.astype(np.uint8), border_skip=border_skip)
+
+    assert kept.dtype == bool
+    assert np.array_equal(kept, expected)
+    if border_skip == 7:
+        # The inner ring seeds components that never reach the image edge.
+        assert (kept & ~np.isin(labeled, sorted(edge))).any()
+
+
+def _moving_clip(count, h=24, w=32):
+    """Static grey background with a flickering alpha and a square that moves one column per frame."""
+    rng = np.random.default_rng(count)
+    frames = []
+    for index in range(count):
+        rgb = np.full((h, w, 3), 128, np.uint8)
+        rgb[8:16, 4 + 4 * index:12 + 4 * index] = (250, 20, 20)
+        alpha = rng.integers(0, 256, size=(h, w)).astype(np.uint8)
+        frames.append((rgb, alpha))
+    return frames
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 5])
+def test_smooth_alpha_sequence_yields_one_alpha_per_frame(count):
+    frames = _moving_clip(count)
+    smoothed = list(matting.smooth_alpha_sequence(frames))
+
+    assert len(smoothed) == count
+    assert all(alpha.shape == frames[0][1].shape for alpha in smoothed)
+    if count == 1:
+        assert np.array_equal(smoothed[0], frames[0][1])
+
+
+def test_smooth_alpha_sequence_medians_static_pixels_only():
+    frames = _moving_clip(3)
+    original = [alpha.copy() for _, alpha in frames]
+
+    middle = list(matting.smooth_alpha_sequence(frames))[1]
+
+    rgbs = [rgb.astype(np.int16) for rgb, _ in frames]
+    static = ((np.abs(rgbs[1] - rgbs[0]).max(axis=2) <= matting.TEMPORAL_MOTION_THRESHOLD)
+              & (np.abs(rgbs[1] - rgbs[2]).max(axis=2) <= matting.TEMPORAL_MOTION_THRESHOLD))
+    median = np.median(np.stack(original), axis=0).astype(np.uint8)
+    assert static.any() and (~static).any()
+    assert np.array_equal(middle[static], median[static])
+    assert np.array_equal(middle[~static], original[1][~static])
+    assert all(np.array_equal(alpha, before) for (_, alpha), before in zip(frames, original))
+
+
+def _gradient_frames(h, w, base, cx, cy, count=4):
+    ys, xs = np.mgrid[0:h, 0:w]
+    frames = []
+    for index in range(count):
+        rgb = np.empty((h, w, 3), np.uint8)
+        for channel in range(3):
+            rgb[:, :, channel] = np.clip(base[channel] + cx[channel] * xs / w + cy[channel] * ys / h + 0.5, 0, 255)
+        rgb[h // 3:2 * h // 3, w // 3 + index:2 * w // 3 + index] = (20, 120, 40)
+        frames.append(rgb)
+    return frames
+
+
+def test_estimate_clip_background_recovers_a_gradient():
+    cx, cy = (30, -10, 0), (-20, 15, 25)
+    clip = matting.estimate_clip_background(_gradient_frames(90, 120, (190, 200, 180), cx, cy), tolerance=30)
+
+    assert clip.gradient is not None
+    assert np.allclose(clip.gradient[:, 1], cx, atol=1.5)
+    assert np.allclose(clip.gradient[:, 2], cy, atol=1.5)
+    plane = clip.background(90, 120).astype(np.int16)
+    assert np.abs(plane[0, 0] - (190, 200, 180)).max() <= 2
+
+
+def test_estimate_clip_background_flat_background_has_no_gradient():
+    frames = _gradient_frames(90, 120, (240, 240, 240), (0, 0, 0), (0, 0, 0))
+
+    clip = matting.estimate_clip_background(frames, tolerance=30)
+
+    assert clip.gradient is None
+    assert clip.bg_color == (240, 240, 240)
+    assert clip.background(90, 120) == (240, 240, 240)
+
+
+@pytest.mark.parametrize("h,w,crop", [(720, 1280, (40, 1240)), (600, 800, None), (720, 1000, None)])
+def test_clip_crop_only_applies_to_720p_frames(h, w, crop):
+    frames = []
+    for _ in range(2):
+        rgb = np.full((h, w, 3), 200, np.uint8)
+        rgb[:, :40] = rgb[:, w - 40:] = 5
+        frames.append(rgb)
+
+    assert matting.estimate_clip_background(frames).crop == crop
+    assert matting.estimate_clip_background(frames, detect_crop=False).crop is None
+
+
+@pytest.mark.parametrize(
+    "strategy,bg_color,params",
+    [
+        ("color", (30, 200, 40), {"tolerance": 30}),
+        ("color", (30, 200, 40), {"tolerance": 30, "edge_smooth": 0}),
+        ("white", (252, 251, 253), {"tolerance": 10}),
+        ("white", (225, 226, 224), {"tolerance": 20, "white_threshold": 220}),
+        # Off-white background below white_threshold: the coarse box must use the colour key too,
+        # or it drops the pure white square as background.
+        ("white", (232, 232, 232), {"tolerance": 20, "white_threshold": 240}),
+        ("floor", (255, 255, 255), {"floor": 240}),
+    ],
+)
+def test_matte_tiled_matches_whole_region(strategy, bg_color, params):
+    if strategy != "floor" and params.get("edge_smooth", 1):
+        pytest.importorskip("scipy")
+    # Low noise: the coarse foreground box is allowed to miss isolated single-pixel specks.
+    rgb = _scene(200, 170, bg=bg_color, seed=3, noise=3)
+    rgb[150:180, 20:60] = 255
+    engine = MattingEngine()
+
+    expected = engine._matte_region(rgb, strategy, bg_color, **params)
+    tiled = MattingEngine().matte_tiled(rgb, strategy, bg_color=bg_color, tile=64, **params)
+
+    assert expected.any() and not expected.all()
+    assert np.array_equal(tiled, expected)
@@ -0,0 +1,49 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+OLD_ROOT = Path(__file__).resolve().parent.parent / "old"
+if str(OLD_ROOT) not in sys.path:
+    sys.path.append(str(OLD_ROOT))
+
+from lib import remove_background  # noqa: E402
+
+
+def _crash_on_bad(task):
+    name, crash = task
+    if crash:
+        os._exit(1)
+    return (name, (1, 1), None)
+
+
+def test_run_tasks_records_a_crashed_worker_per_task():
+    tasks = [("a.png", False), ("b.png", True), ("c.png", False)]
+
+    results = list(remove_background._run_tasks(_crash_on_bad, tasks, 2, lambda task: task[0]))
+
+    by_name = {name: (value, error) for name, value, error in results}
+    assert sorted(by_name) == ["a.png", "b.png", "c.png"]
+    assert by_name["b.png"][0] is None
+    assert "BrokenProcessPool" in by_name["b.png"][1]
+    # Tasks finished before the crash keep their results; the rest are failed, never dropped.
+    assert all(value is not None or error for value, error in by_name.values())
+
+
+class _Block:
+    def __init__(self, size):
+        self.size = size
+
+
+def test_shared_capacity_rejects_frames_larger_than_dev_shm():
+    if not os.path.isdir("/dev/shm"):
+        pytest.skip("no /dev/shm")
+    free = remove_background.shutil.disk_usage("/dev/shm").free
+
+    remove_background._check_shared_capacity({"a.png": _Block(1)})
+    with pytest.raises(MemoryError):
+        remove_background._check_shared_capacity({"a.png": _Block(free), "b.png": _Block(free)})